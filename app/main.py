@@ -4,37 +4,104 @@ import io
 import re
 import sys
 import json
+import hashlib
+import hmac
+import secrets
+import importlib
+import sqlite3
+import uuid
+import zlib
+import zipfile
+import itertools
 import math
+import copy
+import asyncio
+import functools
+import multiprocessing
+import time
+import queue
 import shutil
+import signal
+import threading
 import traceback
 import tempfile
 import subprocess
+from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Optional, List, Dict
-
-from fastapi import FastAPI, Request, Form, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from collections import deque, OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, List, Dict, Callable
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import FastAPI, Request, Form, UploadFile, File
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, FileResponse
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
 from aiogram import Bot, Dispatcher
 from aiogram.filters import Command
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import (
     Message, Update,
     InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo,
-    ReplyKeyboardMarkup, KeyboardButton, BufferedInputFile, BotCommand
+    ReplyKeyboardMarkup, KeyboardButton, BufferedInputFile, FSInputFile, InputMediaDocument, BotCommand
 )
-
-from docxtpl import DocxTemplate, InlineImage
-from docx.shared import Mm
-
-from PIL import Image
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from pdf2image import convert_from_path
-import pytesseract
-from googletrans import Translator
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError
+
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from xml.sax.saxutils import escape as xml_escape
+
+class LazyImport:
+    """Og‘ir kutubxona (yoki undagi nom) birinchi murojaatda import qilinadi — sovuq start tez bo‘ladi.
+    Modul kabi (attr) ham, klass/funksiya kabi (chaqirish) ham ishlaydi."""
+    registry: List["LazyImport"] = []
+
+    def __init__(self, module: str, attr: Optional[str] = None):
+        self._module, self._attr, self._obj = module, attr, None
+        LazyImport.registry.append(self)
+
+    @property
+    def name(self) -> str:
+        return f"{self._module}.{self._attr}" if self._attr else self._module
+
+    def load(self):
+        if self._obj is None:
+            obj = importlib.import_module(self._module)
+            self._obj = getattr(obj, self._attr) if self._attr else obj
+        return self._obj
+
+    def __getattr__(self, name: str):
+        return getattr(self.load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+DocxTemplate = LazyImport("docxtpl", "DocxTemplate")
+InlineImage = LazyImport("docxtpl", "InlineImage")
+Document = LazyImport("docx", "Document")
+Mm = LazyImport("docx.shared", "Mm")
+Image = LazyImport("PIL.Image")
+ImageOps = LazyImport("PIL.ImageOps")
+PdfReader = LazyImport("PyPDF2", "PdfReader")
+PdfWriter = LazyImport("PyPDF2", "PdfWriter")
+canvas = LazyImport("reportlab.pdfgen.canvas")
+pdfmetrics = LazyImport("reportlab.pdfbase.pdfmetrics")
+TTFont = LazyImport("reportlab.pdfbase.ttfonts", "TTFont")
+colors = LazyImport("reportlab.lib.colors")
+ParagraphStyle = LazyImport("reportlab.lib.styles", "ParagraphStyle")
+SimpleDocTemplate = LazyImport("reportlab.platypus", "SimpleDocTemplate")
+Paragraph = LazyImport("reportlab.platypus", "Paragraph")
+Table = LazyImport("reportlab.platypus", "Table")
+TableStyle = LazyImport("reportlab.platypus", "TableStyle")
+Spacer = LazyImport("reportlab.platypus", "Spacer")
+RLImage = LazyImport("reportlab.platypus", "Image")
+convert_from_path = LazyImport("pdf2image", "convert_from_path")
+pdfinfo_from_path = LazyImport("pdf2image", "pdfinfo_from_path")
+pytesseract = LazyImport("pytesseract")
+Translator = LazyImport("googletrans", "Translator")
 
 # =========================
 # CONFIG
@@ -44,16 +111,17 @@ from googletrans import Translator
 PORT = int(os.getenv("PORT", "8080"))          # Railway qo‘yadi
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")         # bo‘lmasa "" qaytadi
 APP_BASE = os.getenv("APP_BASE", "")       # https://ofm.example.com kabi
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "")   # lokal Bot API / loadtest soxta serveri (http://127.0.0.1:8081)
 GROUP_CHAT_ID = -1003046464831
 
-WORKDIR = "/tmp/ofm_bot"
+WORKDIR = os.getenv("WORKDIR", "/tmp/ofm_bot")   # bir nechta worker/replika bo‘lsa — umumiy volume
 ADMINS = {684983417}                 # kerak bo‘lsa qo‘shimcha admin id’larni qo‘shing
 ADMIN_WEB_KEY = "ofm"                # /admin?key=ofm; xohlasa o‘zgartiring
 
 # =========================
 # GLOBAL (RAM)
 # =========================
-bot = Bot(BOT_TOKEN)
+bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE))) if TELEGRAM_API_BASE else Bot(BOT_TOKEN)
 dp = Dispatcher()
 
 ACTIVE_USERS = set()
@@ -62,11 +130,14 @@ COUNTERS: Dict[str, int] = {
     "ocr": 0, "pagenum": 0, "watermark": 0, "translate": 0
 }
 PENDING: Dict[int, dict] = {}
-LAST_FILE: Dict[int, str] = {}
+LAST_FILE: Dict[int, dict] = {}   # uid -> {"blob", "name", "orphan"}
 
 PAUSED = False
 STARTED_AT = datetime.utcnow()
 
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")   # memory | sqlite (uvicorn --workers N / replikalar)
+STATE_DB = os.getenv("STATE_DB", "")                   # default: WORKDIR/state.db
+
 # =========================
 # UTIL
 # =========================
@@ -94,6 +165,241 @@ def human_size(n: int) -> str:
     units = ["KB","MB","GB","TB"]; i = int(math.log(n, 1024))
     return f"{n/(1024**i):.1f} {units[i]}"
 
+# =========================
+# METRICS (Prometheus text format: /metrics; p50/p95 — /admin)
+# =========================
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = tuple(float(1024 ** 2 * x) for x in (0.01, 0.1, 0.5, 1, 5, 10, 20, 50, 100))
+
+class Metrics:
+    """Histogram/counter/gauge. CPU_POOL child'larida events rejimida ishlaydi: yozuvlar ro‘yxatga
+    yig‘iladi va natija bilan parent'ga qaytib merge() qilinadi."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hist: Dict[tuple, dict] = {}
+        self.samples: Dict[tuple, deque] = {}
+        self.counters: Dict[tuple, float] = {}
+        self.gauges: Dict[tuple, float] = {}
+        self.events: Optional[list] = None
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, buckets: tuple = TIME_BUCKETS, **labels) -> None:
+        if self.events is not None: self.events.append(("observe", name, value, buckets, labels)); return
+        key = self._key(name, labels)
+        with self._lock:
+            h = self.hist.get(key)
+            if h is None: h = self.hist[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, b in enumerate(h["buckets"]):
+                if value <= b: h["counts"][i] += 1
+            h["sum"] += value; h["count"] += 1
+            self.samples.setdefault(key, deque(maxlen=1000)).append(value)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        if self.events is not None: self.events.append(("inc", name, value, None, labels)); return
+        key = self._key(name, labels)
+        with self._lock: self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, delta: bool = False, **labels) -> None:
+        if self.events is not None: return   # child'dagi gauge ma'nosiz
+        key = self._key(name, labels)
+        with self._lock: self.gauges[key] = (self.gauges.get(key, 0) if delta else 0) + value
+
+    def merge(self, events: list) -> None:
+        for kind, name, value, buckets, labels in events:
+            if kind == "observe": self.observe(name, value, buckets, **labels)
+            else: self.inc(name, value, **labels)
+
+    def quantiles(self, name: str) -> List[tuple]:
+        """[(labels, p50, p95, n)] — /admin jadvali uchun."""
+        with self._lock: items = [(k[1], list(v)) for k, v in self.samples.items() if k[0] == name]
+        return [(dict(lbl), percentile(vals, 50), percentile(vals, 95), len(vals)) for lbl, vals in sorted(items)]
+
+    def render(self) -> str:
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs: return ""
+            return "{" + ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pairs) + "}"
+        lines = []; typed = set()
+        with self._lock:
+            for (name, labels), v in sorted(self.counters.items()):
+                if name not in typed: lines.append(f"# TYPE {name} counter"); typed.add(name)
+                lines.append(f"{name}{fmt(labels)} {v}")
+            for (name, labels), v in sorted(self.gauges.items()):
+                if name not in typed: lines.append(f"# TYPE {name} gauge"); typed.add(name)
+                lines.append(f"{name}{fmt(labels)} {v}")
+            for (name, labels), h in sorted(self.hist.items()):
+                if name not in typed: lines.append(f"# TYPE {name} histogram"); typed.add(name)
+                for b, c in zip(h["buckets"], h["counts"]):
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', b)])} {c}")
+                lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {h['count']}")
+                lines.append(f"{name}_sum{fmt(labels)} {h['sum']}")
+                lines.append(f"{name}_count{fmt(labels)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+
+@contextmanager
+def stage(name: str, **labels):
+    """Bosqich vaqti (ofm_stage_seconds), xatolar (ofm_stage_errors_total) va in-flight gauge."""
+    METRICS.gauge("ofm_inflight", 1, delta=True, stage=name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        METRICS.inc("ofm_stage_errors_total", stage=name, **labels); raise
+    finally:
+        METRICS.observe("ofm_stage_seconds", time.perf_counter() - t0, stage=name, **labels)
+        METRICS.gauge("ofm_inflight", -1, delta=True, stage=name)
+
+def observe_bytes(stage_name: str, direction: str, n: int) -> None:
+    METRICS.observe("ofm_stage_bytes", n, SIZE_BUCKETS, stage=stage_name, dir=direction)
+
+def files_size(paths: List[str]) -> int:
+    total = 0
+    for p in paths:
+        try: total += os.path.getsize(p)
+        except OSError: pass
+    return total
+
+IN_POOL_CHILD = False   # CPU_POOL child'ida True (initializer)
+
+def _mark_pool_child() -> None:
+    global IN_POOL_CHILD
+    IN_POOL_CHILD = True
+
+def _call_capturing_metrics(fn: Callable, args: tuple, kwargs: dict) -> tuple:
+    # CPU_POOL child'ida: fn ichidagi metrikalarni yig‘ib natija bilan qaytaramiz
+    METRICS.events = []
+    try: return fn(*args, **kwargs), METRICS.events
+    finally: METRICS.events = None
+
+# =========================
+# STATE (sessiya, oxirgi fayl, hisoblagichlar, pauza)
+# =========================
+class MemoryState:
+    """Bitta process uchun: yuqoridagi global dict/set'lar."""
+
+    def session_get(self, uid: int) -> Optional[dict]:
+        return PENDING.get(uid)
+
+    def session_put(self, uid: int, s: dict) -> None:
+        PENDING[uid] = s
+
+    def session_del(self, uid: int) -> None:
+        PENDING.pop(uid, None)
+
+    def session_update(self, uid: int, fn: Callable[[dict], None]) -> Optional[dict]:
+        s = PENDING.get(uid)
+        if s is not None: fn(s)
+        return s
+
+    def last_file_get(self, uid: int) -> Optional[dict]:
+        return LAST_FILE.get(uid)
+
+    def last_file_put(self, uid: int, lf: dict) -> None:
+        LAST_FILE[uid] = lf
+
+    def user_add(self, uid: int) -> None:
+        ACTIVE_USERS.add(uid)
+
+    def user_count(self) -> int:
+        return len(ACTIVE_USERS)
+
+    def counter_inc(self, name: str, n: int = 1) -> None:
+        COUNTERS[name] = COUNTERS.get(name, 0) + n
+
+    def counters(self) -> Dict[str, int]:
+        return dict(COUNTERS)
+
+    def flag_get(self, name: str) -> bool:
+        return PAUSED if name == "paused" else False
+
+    def flag_set(self, name: str, value: bool) -> None:
+        global PAUSED
+        if name == "paused": PAUSED = value
+
+class SqliteState:
+    """Process'lar aro umumiy holat (WAL rejimidagi SQLite). Sessiyani o‘zgartirish
+    session_update() orqali — BEGIN IMMEDIATE ichida o‘qib-yoziladi, yo‘qolgan yozuv bo‘lmaydi."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        ensure_dir(os.path.dirname(path))
+        self._conn().executescript(
+            "CREATE TABLE IF NOT EXISTS kv (ns TEXT NOT NULL, k TEXT NOT NULL, v TEXT NOT NULL, PRIMARY KEY (ns, k));"
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0);"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            c.execute("PRAGMA journal_mode=WAL"); c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    def _get(self, ns: str, k) -> Optional[dict]:
+        row = self._conn().execute("SELECT v FROM kv WHERE ns=? AND k=?", (ns, str(k))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, ns: str, k, v) -> None:
+        self._conn().execute("INSERT OR REPLACE INTO kv (ns, k, v) VALUES (?, ?, ?)",
+                             (ns, str(k), json.dumps(v, ensure_ascii=False)))
+
+    def session_get(self, uid: int) -> Optional[dict]:
+        return self._get("session", uid)
+
+    def session_put(self, uid: int, s: dict) -> None:
+        self._put("session", uid, s)
+
+    def session_del(self, uid: int) -> None:
+        self._conn().execute("DELETE FROM kv WHERE ns='session' AND k=?", (str(uid),))
+
+    def session_update(self, uid: int, fn: Callable[[dict], None]) -> Optional[dict]:
+        c = self._conn(); c.execute("BEGIN IMMEDIATE")
+        try:
+            s = self._get("session", uid)
+            if s is not None:
+                fn(s); self._put("session", uid, s)
+            c.execute("COMMIT")
+            return s
+        except Exception:
+            c.execute("ROLLBACK"); raise
+
+    def last_file_get(self, uid: int) -> Optional[dict]:
+        return self._get("last_file", uid)
+
+    def last_file_put(self, uid: int, lf: dict) -> None:
+        self._put("last_file", uid, lf)
+
+    def user_add(self, uid: int) -> None:
+        self._conn().execute("INSERT OR IGNORE INTO kv (ns, k, v) VALUES ('user', ?, '1')", (str(uid),))
+
+    def user_count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM kv WHERE ns='user'").fetchone()[0]
+
+    def counter_inc(self, name: str, n: int = 1) -> None:
+        self._conn().execute("INSERT INTO counters (name, n) VALUES (?, ?) "
+                             "ON CONFLICT(name) DO UPDATE SET n = n + excluded.n", (name, n))
+
+    def counters(self) -> Dict[str, int]:
+        out = {k: 0 for k in COUNTERS}
+        out.update(dict(self._conn().execute("SELECT name, n FROM counters").fetchall()))
+        return out
+
+    def flag_get(self, name: str) -> bool:
+        return bool(self._get("flag", name))
+
+    def flag_set(self, name: str, value: bool) -> None:
+        self._put("flag", name, bool(value))
+
+STATE = SqliteState(STATE_DB or os.path.join(WORKDIR, "state.db")) if STATE_BACKEND == "sqlite" else MemoryState()
+
 # =========================
 # KEYBOARDS (Reply)
 # =========================
@@ -113,7 +419,7 @@ def kb_session(op: str) -> ReplyKeyboardMarkup:
         resize_keyboard=True,
         keyboard=[
             [KeyboardButton(text="✅ Yakunlash"), KeyboardButton(text="❌ Bekor"), KeyboardButton(text="📋 Holat")],
-            [KeyboardButton(text="🆕 Rezyume"), KeyboardButton(text="🌐 Tarjima")],
+            [KeyboardButton(text="♻️ Oxirgi fayl"), KeyboardButton(text="🆕 Rezyume"), KeyboardButton(text="🌐 Tarjima")],
             [KeyboardButton(text="↩️ Asosiy menyu")],
         ],
     )
@@ -124,7 +430,7 @@ def kb_convert_targets() -> ReplyKeyboardMarkup:
         keyboard=[
             [KeyboardButton(text="🎯 Target: PDF"), KeyboardButton(text="🎯 Target: PNG")],
             [KeyboardButton(text="🎯 Target: DOCX"), KeyboardButton(text="🎯 Target: PPTX")],
-            [KeyboardButton(text="✅ Yakunlash"), KeyboardButton(text="❌ Bekor")],
+            [KeyboardButton(text="✅ Yakunlash"), KeyboardButton(text="❌ Bekor"), KeyboardButton(text="♻️ Oxirgi fayl")],
             [KeyboardButton(text="↩️ Asosiy menyu")],
         ],
     )
@@ -135,7 +441,7 @@ def kb_translate_targets(cur: str = "uz") -> ReplyKeyboardMarkup:
         keyboard=[
             [KeyboardButton(text="🎯 Tgt: uz"), KeyboardButton(text="🎯 Tgt: en"), KeyboardButton(text="🎯 Tgt: ru")],
             [KeyboardButton(text=f"📌 Hozirgi: {cur}")],
-            [KeyboardButton(text="✅ Yakunlash"), KeyboardButton(text="❌ Bekor")],
+            [KeyboardButton(text="✅ Yakunlash"), KeyboardButton(text="❌ Bekor"), KeyboardButton(text="♻️ Oxirgi fayl")],
             [KeyboardButton(text="↩️ Asosiy menyu")],
         ],
     )
@@ -170,13 +476,48 @@ def root_ok(): return "OK"
 
 @app.get("/admin", response_class=HTMLResponse)
 def admin_page(key: str = "", pause: int = 0):
-    global PAUSED
     if key == ADMIN_WEB_KEY and pause in (0,1):
-        PAUSED = bool(pause)
-
-    total = sum(COUNTERS.values())
-    status_badge = '<span class="badge bg-success">ON</span>' if not PAUSED else '<span class="badge bg-danger">PAUSED</span>'
-    rows = "".join(f"<tr><td>{k}</td><td>{v}</td></tr>" for k,v in COUNTERS.items())
+        STATE.flag_set("paused", bool(pause))
+
+    counters = STATE.counters(); paused = STATE.flag_get("paused")
+    total = sum(counters.values())
+    status_badge = '<span class="badge bg-success">ON</span>' if not paused else '<span class="badge bg-danger">PAUSED</span>'
+    rows = "".join(f"<tr><td>{k}</td><td>{v}</td></tr>" for k,v in counters.items())
+    cs = RESULT_CACHE.stats
+    bs = BLOB_STORE.stats
+    blob_line = f"Yuklamalar: Telegram'dan {bs['download']}, qayta ishlatildi {bs['hit']}, o‘chirildi {bs['evict']}"
+    rr = list(RESUME_RENDER_MS)
+    render_line = (f"Rezyume render: p50 {percentile(rr, 50):.0f} ms, p95 {percentile(rr, 95):.0f} ms "
+                   f"(oxirgi {len(rr)} ta)") if rr else "Rezyume render: hali yo‘q"
+    uq = UPDATE_QUEUE.stats
+    upd_line = (f"Webhook: {WEBHOOK_MODE}, navbat {UPDATE_QUEUE.depth} ({len(UPDATE_QUEUE.pending)} foydalanuvchi), "
+                f"qabul {uq['accepted']}, takror {uq['duplicate']}, xato {uq['failed']}")
+    job_line = f"Worker navbati ({JOB_BACKEND}): {JOB_QUEUE.stats()}" if JOB_QUEUE is not None else f"Worker navbati: {JOB_BACKEND}"
+    du = STORAGE.last
+    disk_line = (f"Disk: sessiyalar {human_size(du['users'])} ({du['user_count']} user), blob {human_size(du['blobs'])}, "
+                 f"kesh {human_size(du['cache'])}; o‘chirildi: {STORAGE.stats['released']} sessiya, "
+                 f"{STORAGE.stats['evicted']} eski (hisob: {du['at']:%H:%M:%S})") if du else "Disk: hali hisoblanmagan"
+    cache_line = (f"Kesh: hit <b>{cs['hit']}</b> / miss <b>{cs['miss']}</b>, "
+                  f"yozildi {cs['store']}, o‘chirildi {cs['evict']}, hajm {human_size(RESULT_CACHE.usage())}")
+    ex_line = " | ".join(f"{e.name}: {e.inflight}/{e.workers} (navbat {e.queued})" for e in (IO_POOL, CPU_POOL))
+    ad = ADMISSION.stats
+    admit_line = (f"Kirish nazorati: band <b>{ADMISSION.used}/{ADMISSION.capacity}</b>, navbat <b>{len(ADMISSION.waiting)}</b>"
+                  f"/{ADMISSION.queue_max}; o‘tkazildi {ad['admitted']} (kutgan {ad['queued']}), rad: to‘la "
+                  f"<b>{ad['rejected_full']}</b>, foydalanuvchi {ad['rejected_user']}, vaqt {ad['timeout']}")
+    warm_line = (f"Warm-up: {sum(WARMUP_MS.values()):.0f} ms (eng sekin: "
+                 f"{', '.join(f'{k} {v:.0f}' for k, v in sorted(WARMUP_MS.items(), key=lambda kv: -kv[1])[:3])})"
+                 if WARMUP_MS else f"Warm-up: {'kutilmoqda' if WARMUP else 'o‘chirilgan'}")
+    pf = PREFETCHER.stats
+    pre_line = (f"Prefetch: {'yoqilgan' if PREFETCH else 'o‘chirilgan'}, boshlandi {pf['started']}, tayyor {pf['done']}, "
+                f"xato {pf['failed']}, bekor {pf['cancelled']}, band sabab o‘tkazildi {pf['skipped_busy']}")
+    rb = RESUME_BULK.stats
+    bulk_line = f"Bulk resume: partiyalar {rb['batches']}, yozuvlar {rb['records']}, xato {rb['failed']}, hozir {len(RESUME_BULK.running)}"
+    ob = OUTBOUND.stats
+    out_line = (f"Chiquvchi: yuborildi {ob['sent']}, 429 {ob['retry_after']}, xato {ob['failed']}, "
+                f"limit kutish {ob['waited_s']:.1f} s, chat bucket {len(OUTBOUND.chats)}")
+    lo = LO_POOL.status()
+    lo_line = (f"LibreOffice: <b>{len(lo)}</b> worker ({lo[0]['mode']}), band: {sum(w['busy'] for w in lo)}, "
+               f"restart: {sum(w['restarts'] for w in lo)}") if lo else "LibreOffice: hali ishga tushmagan"
     html = f"""
     <html><head>
     <title>OFM Admin</title>
@@ -184,7 +525,20 @@ def admin_page(key: str = "", pause: int = 0):
     </head><body class="p-4">
     <h3>OFM — Admin panel {status_badge}</h3>
     <p>Uptime: {datetime.utcnow() - STARTED_AT}</p>
-    <p>Foydalanuvchilar: <b>{len(ACTIVE_USERS)}</b> | Jami amallar: <b>{total}</b></p>
+    <p>Foydalanuvchilar: <b>{STATE.user_count()}</b> | Jami amallar: <b>{total}</b> | State: {STATE_BACKEND}</p>
+    <p>{lo_line}</p>
+    <p>Executor: {ex_line}</p>
+    <p>{admit_line}</p>
+    <p>{pre_line}</p>
+    <p>{bulk_line}</p>
+    <p>{upd_line}</p>
+    <p>{job_line}</p>
+    <p>{out_line}</p>
+    <p>{cache_line}</p>
+    <p>{blob_line}</p>
+    <p>{disk_line}</p>
+    <p>{render_line}</p>
+    <p>{warm_line}</p>
     <div class="mb-3">
       <a class="btn btn-danger" href="/admin?key={ADMIN_WEB_KEY}&pause=1">Pause</a>
       <a class="btn btn-success ms-2" href="/admin?key={ADMIN_WEB_KEY}&pause=0">Resume</a>
@@ -193,10 +547,34 @@ def admin_page(key: str = "", pause: int = 0):
       <thead><tr><th>Funksiya</th><th>Soni</th></tr></thead>
       <tbody>{rows}</tbody>
     </table>
+    <table class="table table-bordered w-auto">
+      <thead><tr><th>Bosqich</th><th>p50, ms</th><th>p95, ms</th><th>n</th></tr></thead>
+      <tbody>{stage_rows()}</tbody>
+    </table>
     </body></html>
     """
     return html
 
+def stage_rows() -> str:
+    return "".join(f"<tr><td>{lbl.get('stage')}</td><td>{p50*1000:.0f}</td><td>{p95*1000:.0f}</td><td>{n}</td></tr>"
+                   for lbl, p50, p95, n in METRICS.quantiles("ofm_stage_seconds"))
+
+@app.get("/admin/resume_fidelity")
+async def admin_resume_fidelity(key: str = ""):
+    if key != ADMIN_WEB_KEY: return JSONResponse({"status": "error", "error": "forbidden"}, status_code=403)
+    return await IO_POOL.run(resume_fidelity, RESUME_SAMPLE)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    for e in (IO_POOL, CPU_POOL):
+        METRICS.gauge("ofm_executor_inflight", e.inflight, pool=e.name)
+        METRICS.gauge("ofm_executor_queued", e.queued, pool=e.name)
+    METRICS.gauge("ofm_update_queue_depth", UPDATE_QUEUE.depth)
+    METRICS.gauge("ofm_admission_used", ADMISSION.used)
+    METRICS.gauge("ofm_admission_queue_depth", len(ADMISSION.waiting))
+    for op, n in STATE.counters().items(): METRICS.gauge("ofm_ops_completed", n, op=op)
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/form", response_class=HTMLResponse)
 def get_form(id: str = ""):
     tpl = env.get_template("form.html")
@@ -205,41 +583,578 @@ def get_form(id: str = ""):
 # =========================
 # DOWNLOAD HELPERS
 # =========================
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(WORKDIR, "blobs"))
+BLOB_MAX_BYTES = int(float(os.getenv("BLOB_MAX_MB", "1024")) * 1024 * 1024)
+BLOB_TTL = float(os.getenv("BLOB_TTL_HOURS", "72")) * 3600
+
+def link_or_copy(src: str, dst: str) -> str:
+    ensure_dir(os.path.dirname(dst))
+    if os.path.exists(dst): os.remove(dst)
+    try: os.link(src, dst)
+    except OSError: shutil.copyfile(src, dst)
+    return dst
+
+class BlobStore:
+    """Telegram fayllari file_unique_id bo‘yicha bir marta yuklanadi (forward qilingan
+    bir xil fayl boshqa foydalanuvchida ham qayta yuklanmaydi). LRU + TTL bilan tozalanadi."""
+
+    def __init__(self, root: str, max_bytes: int, ttl: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = {"hit": 0, "download": 0, "evict": 0}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def path(self, unique_id: str) -> str:
+        key = safe_name(unique_id)
+        return os.path.join(self.root, key[:2], key)
+
+    async def fetch(self, unique_id: str, file_id: str) -> str:
+        p = self.path(unique_id)
+        if os.path.exists(p):
+            os.utime(p); self.stats["hit"] += 1
+            return p
+        if unique_id in self._inflight:   # aynan shu fayl hozir yuklanmoqda
+            return await asyncio.shield(self._inflight[unique_id])
+        fut = asyncio.get_running_loop().create_future(); self._inflight[unique_id] = fut
+        try:
+            ensure_dir(os.path.dirname(p))
+            tmp = f"{p}.part{os.getpid()}"
+            tg_file = await bot.get_file(file_id)
+            await bot.download_file(tg_file.file_path, destination=tmp)
+            os.replace(tmp, p)
+            self.stats["download"] += 1
+            fut.set_result(p)
+        except Exception as e:
+            fut.set_exception(e); fut.exception()
+            raise
+        finally:
+            self._inflight.pop(unique_id, None)
+        await asyncio.to_thread(self.evict)
+        return p
+
+    def evict(self) -> None:
+        entries = []
+        if not os.path.isdir(self.root): return
+        for shard in os.listdir(self.root):
+            sd = os.path.join(self.root, shard)
+            for name in (os.listdir(sd) if os.path.isdir(sd) else []):
+                fp = os.path.join(sd, name)
+                try: st = os.stat(fp)
+                except OSError: continue
+                entries.append((st.st_mtime, st.st_size, fp))
+        entries.sort()
+        total = sum(e[1] for e in entries); now = time.time()
+        for mtime, size, fp in entries:
+            if total <= self.max_bytes and now - mtime <= self.ttl: continue
+            try: os.remove(fp)
+            except OSError: continue
+            total -= size; self.stats["evict"] += 1
+
+BLOB_STORE = BlobStore(BLOB_DIR, BLOB_MAX_BYTES, BLOB_TTL)
+
+# =========================
+# STORAGE (WORKDIR hayot sikli: sessiya papkalari, limitlar, tozalash)
+# =========================
+STORAGE_USER_MAX = int(float(os.getenv("STORAGE_USER_MAX_MB", "500")) * 1024 * 1024)
+STORAGE_TOTAL_MAX = int(float(os.getenv("STORAGE_TOTAL_MAX_MB", "4096")) * 1024 * 1024)
+STORAGE_MAX_AGE = float(os.getenv("STORAGE_MAX_AGE_HOURS", "24")) * 3600
+STORAGE_GRACE = float(os.getenv("STORAGE_GRACE_SEC", "600"))      # shundan yangi papkalar limit uchun o‘chirilmaydi
+STORAGE_SWEEP_INTERVAL = float(os.getenv("STORAGE_SWEEP_SEC", "300"))
+
+def dir_usage(path: str) -> tuple:
+    """(baytlar, eng yangi mtime)"""
+    total = 0; newest = 0.0
+    for dp, _, names in os.walk(path):
+        for n in names:
+            try: st = os.stat(os.path.join(dp, n))
+            except OSError: continue
+            total += st.st_size; newest = max(newest, st.st_mtime)
+    return total, newest
+
+class StorageManager:
+    """WORKDIR/<uid>/<sid>/ — har sessiya o‘z papkasida; tugaganda/bekor qilinganda o‘chadi.
+    Qolganlari (osilib qolgan sessiyalar, inbox) yosh va LRU bo‘yicha, user va global limit bilan tozalanadi."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.stats = {"released": 0, "evicted": 0}
+        self.last: dict = {}
+
+    def session_dir(self, uid: int, sid: str) -> str:
+        return os.path.join(self.root, str(uid), sid)
+
+    def inbox(self, uid: int) -> str:
+        return os.path.join(self.root, str(uid), "inbox")
+
+    def release(self, path: Optional[str]) -> None:
+        root = os.path.abspath(self.root) + os.sep
+        if not path or not os.path.abspath(path).startswith(root) or not os.path.isdir(path): return
+        shutil.rmtree(path, ignore_errors=True); self.stats["released"] += 1
+
+    def _units(self, uid: Optional[int] = None) -> List[tuple]:
+        """[(mtime, size, path, uid)] — sessiya papkalari va user papkasidagi alohida fayllar."""
+        out = []
+        uids = [str(uid)] if uid is not None else [d for d in (os.listdir(self.root) if os.path.isdir(self.root) else []) if d.isdigit()]
+        for u in uids:
+            ud = os.path.join(self.root, u)
+            for name in (os.listdir(ud) if os.path.isdir(ud) else []):
+                p = os.path.join(ud, name)
+                if os.path.isdir(p): size, mtime = dir_usage(p)
+                else:
+                    try: st = os.stat(p); size, mtime = st.st_size, st.st_mtime
+                    except OSError: continue
+                out.append((mtime, size, p, u))
+        return out
+
+    def _drop(self, path: str) -> None:
+        if os.path.isdir(path): shutil.rmtree(path, ignore_errors=True)
+        else:
+            try: os.remove(path)
+            except OSError: return
+        self.stats["evicted"] += 1
+
+    def user_usage(self, uid: int) -> int:
+        return sum(u[1] for u in self._units(uid))
+
+    def trim_user(self, uid: int, keep: Optional[str] = None) -> int:
+        """User limitdan oshsa eng eski papkalarni o‘chiradi (keep — joriy sessiya). Qolgan hajm."""
+        units = sorted(self._units(uid)); total = sum(u[1] for u in units)
+        for mtime, size, path, _ in units:
+            if total <= STORAGE_USER_MAX: break
+            if keep and os.path.abspath(path) == os.path.abspath(keep): continue
+            if time.time() - mtime <= STORAGE_GRACE: continue   # navbatdagi ish fayllari bo‘lishi mumkin
+            self._drop(path); total -= size
+        return total
+
+    def sweep(self) -> dict:
+        now = time.time(); kept = []
+        for unit in self._units():
+            if now - unit[0] > STORAGE_MAX_AGE: self._drop(unit[2])
+            else: kept.append(unit)
+        per_user: Dict[str, List[tuple]] = {}
+        for unit in kept: per_user.setdefault(unit[3], []).append(unit)
+        kept = []
+        for u, units in per_user.items():
+            units.sort(); total = sum(x[1] for x in units)
+            for unit in units:
+                if total > STORAGE_USER_MAX and now - unit[0] > STORAGE_GRACE:
+                    self._drop(unit[2]); total -= unit[1]
+                else: kept.append(unit)
+        kept.sort(); total = sum(x[1] for x in kept)
+        for unit in kept:
+            if total <= STORAGE_TOTAL_MAX: break
+            if now - unit[0] > STORAGE_GRACE: self._drop(unit[2]); total -= unit[1]
+        BLOB_STORE.evict(); RESULT_CACHE.evict()
+        self.last = {"users": total, "user_count": len(per_user), "blobs": dir_usage(BLOB_DIR)[0],
+                     "cache": RESULT_CACHE.usage(), "at": datetime.utcnow()}
+        return self.last
+
+STORAGE = StorageManager(WORKDIR)
+
+async def storage_sweeper():
+    while True:
+        try: await asyncio.to_thread(STORAGE.sweep)
+        except Exception: traceback.print_exc()
+        await asyncio.sleep(STORAGE_SWEEP_INTERVAL)
+
+def session_workdir(uid: int) -> str:
+    """Joriy sessiya papkasi; sessiya bo‘lmasa — inbox."""
+    s = STATE.session_get(uid)
+    d = (s or {}).get("dir") or (user_dir(uid) if s else STORAGE.inbox(uid))
+    ensure_dir(d); return d
+
 async def grab_file_from_message(m: Message) -> Optional[str]:
     uid = m.from_user.id
-    d = user_dir(uid)
+    d = session_workdir(uid)
 
     if m.document:
-        f_id = m.document.file_id
+        f_id = m.document.file_id; f_uid = m.document.file_unique_id
         fn = safe_name(m.document.file_name or f"{now_stamp()}")
     elif m.photo:
         p = m.photo[-1]
-        f_id = p.file_id
+        f_id = p.file_id; f_uid = p.file_unique_id
         fn = f"photo_{now_stamp()}.jpg"
     else:
         return None
 
-    tg_file = await bot.get_file(f_id)
-    local = os.path.join(d, fn)
-    ensure_dir(d)
-    await bot.download_file(tg_file.file_path, destination=local)
+    with stage("download"):
+        blob = await BLOB_STORE.fetch(f_uid, f_id)
+    observe_bytes("download", "in", files_size([blob]))
+    local = link_or_copy(blob, os.path.join(d, fn))
+    STATE.last_file_put(uid, {"blob": blob, "name": fn, "orphan": False})
     return local
 
+def reuse_last_file(uid: int) -> Optional[str]:
+    """Oxirgi qabul qilingan faylni qayta yuklamasdan user papkasiga qaytaradi."""
+    lf = STATE.last_file_get(uid)
+    if not lf or not os.path.exists(lf["blob"]): return None
+    os.utime(lf["blob"])
+    return link_or_copy(lf["blob"], os.path.join(session_workdir(uid), lf["name"]))
+
+# =========================
+# LIBREOFFICE POOL (uzoq yashovchi soffice'lar, har birining o‘z profili)
+# =========================
+SOFFICE_BIN = os.getenv("SOFFICE_BIN", "soffice")
+SOFFICE_POOL_SIZE = int(os.getenv("SOFFICE_POOL_SIZE", "2"))
+SOFFICE_PROFILE_ROOT = os.getenv("SOFFICE_PROFILE_ROOT", os.path.join(tempfile.gettempdir(), "ofm_lo"))
+SOFFICE_JOB_TIMEOUT = float(os.getenv("SOFFICE_JOB_TIMEOUT", "120"))     # bitta ish uchun, sekund
+SOFFICE_START_TIMEOUT = float(os.getenv("SOFFICE_START_TIMEOUT", "45"))  # instance ko‘tarilishini kutish
+SOFFICE_HEALTH_INTERVAL = float(os.getenv("SOFFICE_HEALTH_INTERVAL", "30"))
+SOFFICE_MAX_JOBS = int(os.getenv("SOFFICE_MAX_JOBS", "200"))             # shuncha ishdan keyin qayta ishga tushadi
+
+def _import_uno():
+    # python3-uno Debian paketidan keladi; slim image'dagi python uni o‘zi ko‘rmaydi
+    for extra in ("", "/usr/lib/python3/dist-packages", "/usr/lib/libreoffice/program"):
+        if extra and extra not in sys.path: sys.path.append(extra)
+        try:
+            import uno as _uno
+            from com.sun.star.beans import PropertyValue as _pv
+            return _uno, _pv
+        except ImportError: continue
+    return None, None
+
+uno, PropertyValue = _import_uno()
+
+def _uno_prop(name: str, value):
+    p = PropertyValue(); p.Name = name; p.Value = value
+    return p
+
+def _kill_group(proc: Optional[subprocess.Popen]) -> None:
+    if proc is None or proc.poll() is not None: return
+    try: os.killpg(proc.pid, signal.SIGKILL)
+    except Exception: proc.kill()
+    try: proc.wait(5)
+    except Exception: pass
+
+def _pdf_filter(doc) -> str:
+    if doc.supportsService("com.sun.star.sheet.SpreadsheetDocument"): return "calc_pdf_Export"
+    if doc.supportsService("com.sun.star.presentation.PresentationDocument"): return "impress_pdf_Export"
+    if doc.supportsService("com.sun.star.drawing.DrawingDocument"): return "draw_pdf_Export"
+    return "writer_pdf_Export"
+
+class SofficeWorker:
+    """Bitta soffice instance. uno bo‘lsa — socket orqali ishlaydi,
+    bo‘lmasa har ish uchun CLI, lekin baribir o‘z (isitilgan) profili bilan."""
+
+    def __init__(self, idx: int):
+        self.idx = idx
+        # pipe nomi va profil process'ga xos — bir nechta uvicorn worker bir-biriga xalal bermaydi
+        self.pipe = f"ofm_lo_{os.getpid()}_{idx}"
+        self.profile = os.path.join(SOFFICE_PROFILE_ROOT, f"{os.getpid()}_w{idx}")
+        self.proc: Optional[subprocess.Popen] = None
+        self.desktop = None
+        self.jobs = 0
+        self.restarts = 0
+        self.busy = False
+
+    @property
+    def mode(self) -> str:
+        return "uno" if uno is not None else "cli"
+
+    def _base_cmd(self) -> List[str]:
+        return [SOFFICE_BIN, "--headless", "--invisible", "--nologo", "--nodefault",
+                "--norestore", "--nolockcheck", f"-env:UserInstallation=file://{self.profile}"]
+
+    def start(self) -> None:
+        ensure_dir(self.profile)
+        self.desktop = None; self.jobs = 0
+        if uno is None: return
+        self.proc = subprocess.Popen(
+            self._base_cmd() + [f"--accept=pipe,name={self.pipe};urp;StarOffice.ComponentContext"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+
+    def stop(self) -> None:
+        self.desktop = None
+        _kill_group(self.proc); self.proc = None
+
+    def restart(self) -> None:
+        self.stop(); self.restarts += 1; self.start()
+
+    def _connect(self, timeout: float):
+        if self.desktop is not None: return self.desktop
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                ctx = resolver.resolve(f"uno:pipe,name={self.pipe};urp;StarOffice.ComponentContext")
+                break
+            except Exception:
+                if self.proc is None or self.proc.poll() is not None or time.monotonic() > deadline: raise
+                time.sleep(0.25)
+        self.desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        return self.desktop
+
+    @contextmanager
+    def _watchdog(self, timeout: float):
+        """UNO chaqiruvi osilib qolsa — timer process'ni o‘ldiradi, chaqiruv xato bilan qaytadi. Event: vaqt tugadimi."""
+        timed_out = threading.Event()
+        def on_timeout(): timed_out.set(); self.stop()
+        timer = threading.Timer(timeout, on_timeout); timer.daemon = True; timer.start()
+        try: yield timed_out
+        finally: timer.cancel()
+
+    def healthy(self) -> bool:
+        if uno is None: return True
+        if self.proc is None or self.proc.poll() is not None: return False
+        with self._watchdog(SOFFICE_START_TIMEOUT) as timed_out:
+            try:
+                self._connect(SOFFICE_START_TIMEOUT).getComponents()
+            except Exception:
+                self.desktop = None; return False
+        return not timed_out.is_set()
+
+    def convert(self, srcs: List[str], out_dir: str, timeout: float) -> List[str]:
+        ensure_dir(out_dir)
+        outs = [os.path.join(out_dir, os.path.splitext(os.path.basename(s))[0] + ".pdf") for s in srcs]
+        self.jobs += 1
+        if uno is None:
+            self._convert_cli(srcs, out_dir, timeout)
+        else:
+            self._convert_uno(srcs, outs, timeout)
+        return outs
+
+    def _convert_cli(self, srcs: List[str], out_dir: str, timeout: float) -> None:
+        proc = subprocess.Popen(self._base_cmd() + ["--convert-to", "pdf", "--outdir", out_dir, *srcs],
+                                start_new_session=True)
+        try:
+            rc = proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc)
+            raise TimeoutError(f"LibreOffice {timeout:.0f}s ichida tugatmadi")
+        if rc != 0: raise subprocess.CalledProcessError(rc, SOFFICE_BIN)
+
+    def _convert_uno(self, srcs: List[str], outs: List[str], timeout: float) -> None:
+        with self._watchdog(timeout) as timed_out:
+            try:
+                desktop = self._connect(SOFFICE_START_TIMEOUT)
+                for src, out in zip(srcs, outs):
+                    doc = desktop.loadComponentFromURL(uno.systemPathToFileUrl(os.path.abspath(src)), "_blank", 0,
+                                                       (_uno_prop("Hidden", True),))
+                    if doc is None: raise RuntimeError(f"LibreOffice faylni ocha olmadi: {os.path.basename(src)}")
+                    try:
+                        doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(out)), (_uno_prop("FilterName", _pdf_filter(doc)),))
+                    finally:
+                        doc.close(True)
+            except Exception:
+                if timed_out.is_set(): raise TimeoutError(f"LibreOffice {timeout:.0f}s ichida tugatmadi")
+                raise
+
+class SofficePool:
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.workers: List[SofficeWorker] = []
+        self.idle: "queue.Queue[SofficeWorker]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = False
+
+    def start(self) -> None:
+        with self.lock:
+            if self.started: return
+            for i in range(self.size):
+                w = SofficeWorker(i); w.start()
+                self.workers.append(w); self.idle.put(w)
+            self.started = True
+        threading.Thread(target=self._health_loop, name="soffice-health", daemon=True).start()
+
+    def shutdown(self) -> None:
+        for w in self.workers:
+            w.stop(); shutil.rmtree(w.profile, ignore_errors=True)
+
+    def convert(self, srcs: List[str], out_dir: str, timeout: Optional[float] = None) -> List[str]:
+        """srcs -> out_dir/<nom>.pdf; bir nechta fayl bitta worker'da ketma-ket o‘tadi."""
+        self.start()
+        timeout = timeout or SOFFICE_JOB_TIMEOUT
+        try: w = self.idle.get(timeout=timeout)
+        except queue.Empty: raise TimeoutError("Bo‘sh LibreOffice worker topilmadi")
+        w.busy = True
+        try:
+            outs = w.convert(srcs, out_dir, timeout * len(srcs))
+        except Exception:
+            if not w.healthy(): w.restart()
+            raise
+        finally:
+            if w.jobs >= SOFFICE_MAX_JOBS: w.restart()
+            w.busy = False
+            self.idle.put(w)
+        missing = [o for o in outs if not os.path.exists(o)]
+        if missing: raise FileNotFoundError("LibreOffice conversion failed")
+        return outs
+
+    def _health_loop(self) -> None:
+        while True:
+            time.sleep(SOFFICE_HEALTH_INTERVAL)
+            for _ in range(self.size):
+                try: w = self.idle.get_nowait()
+                except queue.Empty: break
+                try:
+                    if not w.healthy(): w.restart()
+                except Exception: traceback.print_exc()
+                finally: self.idle.put(w)
+
+    def status(self) -> List[dict]:
+        return [{"id": w.idx, "mode": w.mode, "busy": w.busy, "jobs": w.jobs, "restarts": w.restarts,
+                 "alive": w.mode == "cli" or (w.proc is not None and w.proc.poll() is None)} for w in self.workers]
+
+LO_POOL = SofficePool(SOFFICE_POOL_SIZE)
+
+# =========================
+# FONTS (reportlab; bir marta ro‘yxatdan o‘tadi)
+# =========================
+FONT_DIR = os.getenv("FONT_DIR", "/usr/share/fonts/truetype/dejavu")
+FONTS = {"regular": "Helvetica", "bold": "Helvetica-Bold", "serif": "Helvetica"}
+_FONTS_READY = False
+
+def register_fonts() -> dict:
+    global _FONTS_READY
+    if _FONTS_READY: return FONTS
+    for key, name, fn in [("regular", "DejaVuSans", "DejaVuSans.ttf"),
+                          ("bold", "DejaVuSans-Bold", "DejaVuSans-Bold.ttf"),
+                          ("serif", "TimesNewRoman", "DejaVuSerif.ttf")]:
+        try:
+            pdfmetrics.registerFont(TTFont(name, os.path.join(FONT_DIR, fn))); FONTS[key] = name
+        except Exception: pass
+    _FONTS_READY = True
+    return FONTS
+
 # =========================
 # LOW-LEVEL CONVERTS
 # =========================
 def soffice_convert_to_pdf(src: str, out_dir: Optional[str] = None) -> str:
     if out_dir is None: out_dir = os.path.dirname(src)
-    subprocess.run(["soffice", "--headless", "--convert-to", "pdf", "--outdir", out_dir, src], check=True)
-    base = os.path.splitext(os.path.basename(src))[0]
-    out = os.path.join(out_dir, base + ".pdf")
-    if not os.path.exists(out): raise FileNotFoundError("LibreOffice conversion failed")
+    observe_bytes("soffice", "in", files_size([src]))
+    with stage("soffice"):
+        out = LO_POOL.convert([src], out_dir)[0]
+    observe_bytes("soffice", "out", files_size([out]))
     return out
 
-def images_to_single_pdf(img_paths: List[str], out_pdf: str) -> str:
+# ---- Rasm -> PDF (oqimli) ----
+IMG_PDF_PAGE = os.getenv("IMG_PDF_PAGE", "auto").lower()   # auto (sahifa = rasm, 1px = 1pt) | a4
+IMG_PDF_DPI = int(os.getenv("IMG_PDF_DPI", "0"))           # >0 va a4: shu DPI'dan kattasini kichraytiradi (qayta kodlanadi)
+IMG_PDF_MARGIN = float(os.getenv("IMG_PDF_MARGIN_MM", "0")) * mm
+IMG_PDF_QUALITY = int(os.getenv("IMG_PDF_QUALITY", "90"))  # faqat kichraytirilgan rasmlar uchun
+
+# EXIF orientation -> rasm birlik kvadratini (W x H ko‘rinadigan) sahifaga joylovchi CTM (a b c d e f).
+# Aylantirish ham, oynaviy holatlar ham shu matritsa bilan — piksellar qayta kodlanmaydi.
+_EXIF_CTM = {
+    1: lambda W, H: (W, 0, 0, H, 0, 0),
+    2: lambda W, H: (-W, 0, 0, H, W, 0),
+    3: lambda W, H: (-W, 0, 0, -H, W, H),
+    4: lambda W, H: (W, 0, 0, -H, 0, H),
+    5: lambda W, H: (0, -H, -W, 0, W, H),
+    6: lambda W, H: (0, -H, W, 0, 0, H),
+    7: lambda W, H: (0, H, W, 0, 0, 0),
+    8: lambda W, H: (0, H, -W, 0, W, 0),
+}
+
+class ImagePdfWriter:
+    """Rasmlarni bittalab diskka PDF qilib yozadi: xotirada bir vaqtda faqat bitta rasm.
+    JPEG (L/RGB/CMYK) baytlari DCTDecode bilan o‘zgarishsiz joylanadi; qolganlari FlateDecode (yo‘qotishsiz).
+    EXIF orientation sahifa matritsasi orqali qo‘llanadi."""
+    def __init__(self, out_pdf: str, page: str = "auto", dpi: int = 0, margin: float = 0.0):
+        self.f = open(out_pdf, "wb")
+        self.page, self.dpi, self.margin = page, dpi, margin
+        self.offsets: List[int] = []
+        self.kids: List[int] = []
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._reserve(); self._reserve()   # 1: Catalog, 2: Pages — oxirida yoziladi
+
+    def _reserve(self) -> int:
+        self.offsets.append(0); return len(self.offsets)
+
+    def _obj(self, num: int, head: bytes, stream_src=None, length: int = 0) -> None:
+        self.offsets[num - 1] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % num + head)
+        if stream_src is not None:
+            self.f.write(b"\nstream\n")
+            if isinstance(stream_src, bytes): self.f.write(stream_src)
+            else: shutil.copyfileobj(stream_src, self.f, 1 << 20)
+            self.f.write(b"\nendstream")
+        self.f.write(b"\nendobj\n")
+
+    def _box(self, w: int, h: int):
+        """Ko‘rinadigan (w x h px) rasm uchun: sahifa o‘lchami, rasm joyi va o‘lchami (pt), maksimal piksel."""
+        if self.page != "a4":
+            return (w, h), (0.0, 0.0, float(w), float(h)), None
+        pw, ph = A4 if h >= w else (A4[1], A4[0])
+        bw, bh = pw - 2 * self.margin, ph - 2 * self.margin
+        k = min(bw / w, bh / h)
+        W, H = w * k, h * k
+        limit = (math.ceil(W / 72 * self.dpi), math.ceil(H / 72 * self.dpi)) if self.dpi > 0 else None
+        return (pw, ph), ((pw - W) / 2, (ph - H) / 2, W, H), limit
+
+    def add(self, path: str) -> None:
+        with Image.open(path) as im:
+            orient = im.getexif().get(0x0112, 1)
+            if orient not in _EXIF_CTM: orient = 1
+            sw, sh = im.size
+            w, h = (sh, sw) if orient in (5, 6, 7, 8) else (sw, sh)
+            (pw, ph), (x, y, W, H), limit = self._box(w, h)
+            scale = min(1.0, limit[0] / w, limit[1] / h) if limit else 1.0
+            img_num = self._reserve()
+            if im.format == "JPEG" and im.mode in ("L", "RGB", "CMYK") and scale >= 1.0:
+                cs = {"L": b"/DeviceGray", "RGB": b"/DeviceRGB", "CMYK": b"/DeviceCMYK"}[im.mode]
+                decode = b" /Decode [1 0 1 0 1 0 1 0]" if im.mode == "CMYK" and "adobe" in im.info else b""
+                size = os.path.getsize(path)
+                head = (b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent 8"
+                        b"%s /Filter /DCTDecode /Length %d >>" % (sw, sh, cs, decode, size))
+                with open(path, "rb") as src: self._obj(img_num, head, src, size)
+            else:
+                if scale < 1.0:
+                    tw, th = max(1, round(sw * scale)), max(1, round(sh * scale))
+                    if im.format == "JPEG": im.draft(im.mode if im.mode in ("L", "RGB") else "RGB", (tw, th))
+                    px = self._flat(im).resize((tw, th), Image.LANCZOS)
+                    buf = io.BytesIO(); px.save(buf, format="JPEG", quality=IMG_PDF_QUALITY)
+                    data, filt = buf.getvalue(), b"/DCTDecode"
+                else:
+                    px = self._flat(im)
+                    data, filt = zlib.compress(px.tobytes(), 6), b"/FlateDecode"
+                cs = b"/DeviceGray" if px.mode == "L" else b"/DeviceRGB"
+                head = (b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent 8"
+                        b" /Filter %s /Length %d >>" % (px.width, px.height, cs, filt, len(data)))
+                self._obj(img_num, head, data, len(data))
+                del px, data
+        a, b, c, d, e, f = _EXIF_CTM[orient](W, H)
+        content = ("q %.4f %.4f %.4f %.4f %.4f %.4f cm /Im0 Do Q" % (a, b, c, d, e + x, f + y)).encode()
+        content_num = self._reserve()
+        self._obj(content_num, b"<< /Length %d >>" % len(content), content)
+        page_num = self._reserve()
+        self._obj(page_num, (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R"
+                             b" /Resources << /XObject << /Im0 %d 0 R >> >> >>" % (pw, ph, content_num, img_num)))
+        self.kids.append(page_num)
+
+    @staticmethod
+    def _flat(im: "Image.Image") -> "Image.Image":
+        """Alfa -> oq fon; palitra/16-bit -> RGB yoki L."""
+        if im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info):
+            rgba = im.convert("RGBA"); bg = Image.new("RGB", rgba.size, (255, 255, 255))
+            bg.paste(rgba, mask=rgba.getchannel("A")); return bg
+        if im.mode in ("L", "RGB"): return im
+        if im.mode in ("1", "I;16", "I"): return im.convert("L")
+        return im.convert("RGB")
+
+    def close(self) -> None:
+        kids = b" ".join(b"%d 0 R" % k for k in self.kids)
+        self._obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.kids)))
+        self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self.f.tell()
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.offsets) + 1))
+        for off in self.offsets: self.f.write(b"%010d 00000 n \n" % off)
+        self.f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self.offsets) + 1, xref))
+        self.f.close()
+
+def images_to_single_pdf(img_paths: List[str], out_pdf: str, page: str = IMG_PDF_PAGE, dpi: int = IMG_PDF_DPI) -> str:
     if not img_paths: raise ValueError("No images")
-    imgs = [Image.open(p).convert("RGB") for p in img_paths]
-    imgs[0].save(out_pdf, save_all=True, append_images=imgs[1:])
+    observe_bytes("img2pdf", "in", files_size(img_paths))
+    with stage("img2pdf"):
+        wr = ImagePdfWriter(out_pdf, page=page, dpi=dpi, margin=IMG_PDF_MARGIN)
+        try:
+            for p in img_paths: wr.add(p)
+        finally:
+            wr.close()
+    observe_bytes("img2pdf", "out", files_size([out_pdf]))
     return out_pdf
 
 def pdf_merge(paths: List[str], out_pdf: str) -> str:
@@ -250,41 +1165,59 @@ def pdf_merge(paths: List[str], out_pdf: str) -> str:
     with open(out_pdf,"wb") as f: wr.write(f)
     return out_pdf
 
-def pdf_split_range(src_pdf: str, rng: str, out_pdf: str) -> str:
-    rd = PdfReader(src_pdf); wr = PdfWriter(); total = len(rd.pages)
-    def add(ix): 
-        if 1<=ix<=total: wr.add_page(rd.pages[ix-1])
+def parse_page_range(rng: str, total: int) -> List[int]:
+    """'1-3,5,9-7' -> [1,2,3,5,9,8,7]; 1..total dan tashqaridagilar tashlanadi, tartib saqlanadi."""
+    pages: List[int] = []
     for part in re.split(r"\s*,\s*", rng.strip()):
         if not part: continue
         if "-" in part:
             a,b = part.split("-",1); a=int(a); b=int(b)
             step = 1 if a<=b else -1
-            for i in range(a, b+step, step): add(i)
-        else: add(int(part))
+            pages.extend(range(a, b+step, step))
+        else: pages.append(int(part))
+    return [ix for ix in pages if 1 <= ix <= total]
+
+def pdf_split_range(src_pdf: str, rng: str, out_pdf: str) -> str:
+    rd = PdfReader(src_pdf); wr = PdfWriter()
+    for ix in parse_page_range(rng, len(rd.pages)): wr.add_page(rd.pages[ix-1])
     with open(out_pdf,"wb") as f: wr.write(f)
     return out_pdf
 
+def _overlay_reader(pages: List[tuple], draw: Callable) -> PdfReader:
+    """Har (w, h, ...) uchun bitta sahifa — hammasi bitta canvas/hujjatda."""
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet)
+    for spec in pages:
+        c.setPageSize(spec[:2]); draw(c, *spec); c.showPage()
+    c.save(); packet.seek(0)
+    return PdfReader(packet)
+
 def pdf_overlay_text(src_pdf: str, out_pdf: str, text: str, page_numbers: bool=False) -> str:
-    rd = PdfReader(src_pdf); wr = PdfWriter()
-    try:
-        pdfmetrics.registerFont(TTFont("TimesNewRoman", "/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf"))
-        font = "TimesNewRoman"
-    except Exception: font = "Helvetica"
-
-    for i, page in enumerate(rd.pages, start=1):
-        w = float(page.mediabox.width); h = float(page.mediabox.height)
-        packet = io.BytesIO()
-        c = canvas.Canvas(packet, pagesize=(w,h))
-        c.setFillAlpha(0.25); c.setFont(font, 28)
-        if text:
+    """Watermark: har xil sahifa o‘lchami uchun bitta overlay, qayta ishlatiladi (shrift ham bir marta
+    yoziladi). Raqamlar: barcha shtamplar bitta ko‘p sahifali overlay'da, bitta o‘tishda qo‘shiladi."""
+    font = register_fonts()["serif"]
+    rd = PdfReader(src_pdf); wr = PdfWriter(); total = len(rd.pages)
+    sizes = [(float(pg.mediabox.width), float(pg.mediabox.height)) for pg in rd.pages]
+
+    wm: Dict[tuple, object] = {}
+    if text:
+        def draw_wm(c, w, h):
+            c.setFillAlpha(0.25); c.setFont(font, 28)
             c.saveState(); c.translate(w/2, h/2); c.rotate(30)
             c.drawCentredString(0, 0, text); c.restoreState()
-        if page_numbers:
+        distinct = list(dict.fromkeys(sizes))
+        wm = dict(zip(distinct, _overlay_reader(distinct, draw_wm).pages))
+
+    nums = None
+    if page_numbers:
+        def draw_num(c, w, h, i):
             c.setFillAlpha(1.0); c.setFont(font, 12)
-            c.drawString(w-60, 20, f"{i}/{len(rd.pages)}")
-        c.save(); packet.seek(0)
-        overlay = PdfReader(packet)
-        page.merge_page(overlay.pages[0])
+            c.drawString(w-60, 20, f"{i}/{total}")
+        nums = _overlay_reader([(w, h, i) for i, (w, h) in enumerate(sizes, start=1)], draw_num).pages
+
+    for i, page in enumerate(rd.pages):
+        if text: page.merge_page(wm[sizes[i]])
+        if nums is not None: page.merge_page(nums[i])
         wr.add_page(page)
     with open(out_pdf,"wb") as f: wr.write(f)
     return out_pdf
@@ -292,30 +1225,1215 @@ def pdf_overlay_text(src_pdf: str, out_pdf: str, text: str, page_numbers: bool=F
 # =========================
 # OCR
 # =========================
-def ocr_image(img_path: str) -> str:
-    # lang bermaymiz -> tesseract default (o‘rnatilgan traineddata bo‘yicha auto)
-    return pytesseract.image_to_string(Image.open(img_path)).strip()
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))   # parallel tesseract soni (CPU_POOL child'ida — 1)
+OCR_BATCH = int(os.getenv("OCR_BATCH", "1"))                           # bitta pdftoppm chaqiruvidagi sahifalar
+OCR_TMP = os.getenv("OCR_TMP") or None
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")   # tesseract o‘zi ham thread ochmasin — parallelizmni biz beramiz
+OCR_LANG = os.getenv("OCR_LANG", "")              # "uzb+uzb_cyrl+rus+eng"; bo‘sh — tesseract default (eng)
+OCR_PSM = os.getenv("OCR_PSM", "")                # 3 — avto sahifa, 6 — bitta matn bloki; bo‘sh — default
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1") == "1"
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))        # effektiv DPI: PDF shu DPI'da rasterlanadi,
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", str(round(OCR_DPI * 11.69))))   # foto esa A4 deb shu uzun tomongacha kichraytiriladi
+OCR_BINARIZE = os.getenv("OCR_BINARIZE", "0") == "1"
+OCR_DESKEW = os.getenv("OCR_DESKEW", "0") == "1"
+OCR_DESKEW_MAX = float(os.getenv("OCR_DESKEW_MAX", "5"))   # gradus
+RATIO_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0)
+
+def ocr_options() -> dict:
+    return {"lang": OCR_LANG or None, "config": f"--psm {OCR_PSM}" if OCR_PSM else ""}
+
+def otsu_threshold(im: "Image.Image") -> int:
+    hist = im.histogram()[:256]; total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    best, best_t, w0, sum0 = -1.0, 127, 0, 0.0
+    for t in range(256):
+        w0 += hist[t]
+        if not w0 or w0 == total: continue
+        sum0 += t * hist[t]
+        m0, m1 = sum0 / w0, (sum_all - sum0) / (total - w0)
+        between = w0 * (total - w0) * (m0 - m1) ** 2
+        if between > best: best, best_t = between, t
+    return best_t
+
+def estimate_skew(im: "Image.Image", max_angle: float = OCR_DESKEW_MAX) -> float:
+    """Proyeksiya profili: kichik qora-oq nusxani burib, qatorlar yig‘indisi dispersiyasi eng katta burchak.
+    Qator yig‘indisi — resize((1, h), BOX) (numpy'siz)."""
+    small = im.copy(); small.thumbnail((800, 800))
+    t = otsu_threshold(small)
+    ink = small.point(lambda p: 255 if p < t else 0)   # matn — oq
+    def score(angle: float) -> float:
+        rows = list(ink.rotate(angle, resample=Image.NEAREST, fillcolor=0).resize((1, ink.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        return sum((r - mean) ** 2 for r in rows)
+    best = max((a / 2 for a in range(int(-max_angle * 2), int(max_angle * 2) + 1)), key=score)
+    return max((best + d / 10 for d in range(-5, 6)), key=score)
+
+def ocr_preprocess(im: "Image.Image", max_side: Optional[int] = None, binarize: Optional[bool] = None,
+                   deskew: Optional[bool] = None) -> "Image.Image":
+    """EXIF burilishi -> kulrang -> uzun tomon max_side gacha (0 — o‘zgartirmaydi) -> ixtiyoriy deskew/binarizatsiya.
+    None — OCR_* sozlamalari."""
+    max_side = OCR_MAX_SIDE if max_side is None else max_side
+    binarize = OCR_BINARIZE if binarize is None else binarize
+    deskew = OCR_DESKEW if deskew is None else deskew
+    if max_side and im.format == "JPEG": im.draft("L", (max_side, max_side))   # JPEG'ni kichik masshtabda dekodlash
+    im = ImageOps.exif_transpose(im)
+    if im.mode != "L":
+        if im.mode in ("RGBA", "LA", "P"): im = im.convert("RGBA").convert("RGB")
+        im = im.convert("L")
+    if max_side and max(im.size) > max_side:
+        im.thumbnail((max_side, max_side), Image.LANCZOS)
+    if deskew:
+        angle = estimate_skew(im)
+        if abs(angle) >= 0.2: im = im.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if binarize:
+        t = otsu_threshold(im); im = im.point(lambda p: 255 if p > t else 0)
+    return im
+
+def ocr_image(img_path: str, preprocess: Optional[bool] = None) -> str:
+    pre = OCR_PREPROCESS if preprocess is None else preprocess
+    with stage("ocr_image"):
+        if not pre:
+            return pytesseract.image_to_string(Image.open(img_path), **ocr_options()).strip()
+        t0 = time.perf_counter()
+        with Image.open(img_path) as im:
+            px_in = im.width * im.height
+            img = ocr_preprocess(im)
+        t1 = time.perf_counter()
+        text = pytesseract.image_to_string(img, **ocr_options()).strip()
+        t2 = time.perf_counter()
+    # tesseract vaqti piksellarga deyarli chiziqli: tejalgan vaqt ~ tess * (in/out - 1) (taxmin; aniq — bench/)
+    ratio = img.width * img.height / max(1, px_in)
+    METRICS.observe("ofm_ocr_preprocess_seconds", t1 - t0)
+    METRICS.observe("ofm_ocr_pixel_ratio", ratio, buckets=RATIO_BUCKETS)
+    METRICS.observe("ofm_ocr_saved_seconds_est", (t2 - t1) * (1 / ratio - 1) - (t1 - t0))
+    return text
+
+def pdf_page_count(pdf_path: str) -> int:
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+def _page_runs(pages: List[int], size: int) -> List[List[int]]:
+    # ketma-ket sahifalarni size tadan guruhlaymiz (pdftoppm first..last oladi)
+    runs: List[List[int]] = []
+    for p in pages:
+        if runs and runs[-1][-1] == p - 1 and len(runs[-1]) < size: runs[-1].append(p)
+        else: runs.append([p])
+    return runs
+
+def _ocr_page_run(pdf_path: str, run: List[int], dpi: int) -> Dict[int, str]:
+    out: Dict[int, str] = {}
+    # sahifa allaqachon OCR DPI'da va (preprocess yoqilgan bo‘lsa) kulrang rasterlanadi
+    heavy = OCR_PREPROCESS and (OCR_BINARIZE or OCR_DESKEW)
+    with tempfile.TemporaryDirectory(dir=OCR_TMP) as td:
+        paths = convert_from_path(pdf_path, dpi=dpi, fmt="ppm", first_page=run[0], last_page=run[-1],
+                                  output_folder=td, paths_only=True, thread_count=1, grayscale=OCR_PREPROCESS)
+        for page, img_path in zip(run, sorted(paths)):
+            if heavy:
+                with Image.open(img_path) as im: src = ocr_preprocess(im, max_side=0)
+            else:
+                src = img_path   # fayl yo‘li to‘g‘ridan-to‘g‘ri tesseract'ga (JPEG/PIL aylanmasiz)
+            out[page] = pytesseract.image_to_string(src, **ocr_options()).strip()
+            os.remove(img_path)
+    return out
+
+def ocr_pdf_pages(pdf_path: str, pages: List[int], dpi: Optional[int] = None) -> Dict[int, str]:
+    texts: Dict[int, str] = {}
+    if not pages: return texts
+    dpi = dpi or OCR_DPI
+    runs = _page_runs(sorted(pages), OCR_BATCH)
+    # har to‘plam — alohida CPU_POOL ishi (parallelizm bitta daraja: pool'ning o‘zi); thread'lar faqat kutadi.
+    # CPU_POOL child'ida cpu_call o‘sha joyda bajaradi — ketma-ket.
+    workers = 1 if IN_POOL_CHILD else min(OCR_WORKERS, len(runs))
+    with stage("ocr_pdf"), ThreadPoolExecutor(workers, thread_name_prefix="ofm-ocr") as ex:
+        for part in ex.map(lambda r: cpu_call(_ocr_page_run, pdf_path, r, dpi), runs): texts.update(part)
+    METRICS.inc("ofm_ocr_pages_total", len(pages))
+    return texts
+
+def ocr_pdf(pdf_path: str, max_pages: int = 10, dpi: Optional[int] = None, pages: Optional[List[int]] = None) -> str:
+    """Faqat kerakli sahifalarni rasterlaydi, sahifalar bo‘yicha parallel OCR, natija sahifa tartibida."""
+    if pages is None: pages = list(range(1, min(pdf_page_count(pdf_path), max_pages) + 1))
+    texts = ocr_pdf_pages(pdf_path, pages, dpi)
+    return "\n\n---\n\n".join(texts[p] for p in sorted(texts) if texts[p])
+
+# ---- Matn qatlami (raqamli PDF'lar uchun OCR'siz) ----
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "20"))
+TEXT_LAYER_MIN_ALNUM = float(os.getenv("TEXT_LAYER_MIN_ALNUM", "0.6"))
+
+def text_layer_ok(txt: str) -> bool:
+    """Sahifa matni ishlatsa bo‘ladimi: juda qisqa, (cid:..)/\ufffd yoki asosan belgi bo‘lsa — yo‘q."""
+    t = (txt or "").strip()
+    if len(t) < TEXT_LAYER_MIN_CHARS: return False
+    if "\ufffd" in t or re.search(r"\(cid:\d+\)", t): return False
+    chars = [ch for ch in t if not ch.isspace()]
+    if sum(ch.isalnum() for ch in chars) / max(1, len(chars)) < TEXT_LAYER_MIN_ALNUM: return False
+    words = t.split()
+    return len(chars) / max(1, len(words)) <= 25   # bo‘shliqsiz "so‘z" oqimi — buzilgan encoding
+
+def pdf_text_layer(pdf_path: str, max_pages: int) -> Dict[int, str]:
+    rd = PdfReader(pdf_path); layer: Dict[int, str] = {}
+    for i in range(1, min(len(rd.pages), max_pages) + 1):
+        try: layer[i] = rd.pages[i-1].extract_text() or ""
+        except Exception: layer[i] = ""
+    return layer
+
+def pdf_extract_text(pdf_path: str, max_pages: int = 10, dpi: Optional[int] = None) -> dict:
+    """Har sahifa uchun: matn qatlami yaroqli bo‘lsa — o‘shani, bo‘lmasa OCR.
+    {"text", "mode": text|ocr|mixed, "pages": [{"page", "source"}]}"""
+    try:
+        layer = cpu_call(pdf_text_layer, pdf_path, max_pages); n = len(layer)
+    except Exception:
+        traceback.print_exc()
+        n = min(pdf_page_count(pdf_path), max_pages); layer = {i: "" for i in range(1, n + 1)}
+
+    need_ocr = [i for i in range(1, n + 1) if not text_layer_ok(layer[i])]
+    texts = {i: layer[i].strip() for i in range(1, n + 1) if i not in need_ocr}
+    texts.update(ocr_pdf_pages(pdf_path, need_ocr, dpi))
+    mode = "text" if not need_ocr else ("ocr" if len(need_ocr) == n else "mixed")
+    return {
+        "text": "\n\n---\n\n".join(texts[p] for p in sorted(texts) if texts[p]),
+        "mode": mode,
+        "pages": [{"page": i, "source": "ocr" if i in need_ocr else "text"} for i in range(1, n + 1)],
+    }
+
+# =========================
+# EXECUTORS (og‘ir ishlar event loop'dan tashqarida)
+# =========================
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))          # soffice, tarjima, tashqi process kutish
+IO_QUEUE = int(os.getenv("IO_QUEUE", "32"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))   # PDF/OCR
+CPU_QUEUE = int(os.getenv("CPU_QUEUE", "16"))
+CPU_MP_CONTEXT = os.getenv("CPU_MP_CONTEXT", "forkserver")
+EXEC_QUEUE_TIMEOUT = float(os.getenv("EXEC_QUEUE_TIMEOUT", "60"))
+
+class ExecutorBusy(RuntimeError):
+    pass
+
+class BoundedExecutor:
+    """Thread yoki process pool + chegaralangan navbat (workers + queue_size ta ish).
+    Limit bitta (threading semafor) — event loop'dan run() ham, IO thread'idan submit() ham shu navbatda."""
+
+    def __init__(self, name: str, factory: Callable, workers: int, queue_size: int, process: bool = False):
+        self.name = name
+        self.process = process
+        self.workers = max(1, workers)
+        self.limit = self.workers + max(0, queue_size)
+        self._factory = factory
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+        self.inflight = 0
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None: self._pool = self._factory(self.workers)
+            return self._pool
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.inflight - self.workers)
+
+    def _busy(self) -> "ExecutorBusy":
+        return ExecutorBusy("Server band, birozdan so‘ng qayta urinib ko‘ring.")
+
+    def _enter(self) -> None:
+        with self._lock: self.inflight += 1
+
+    def _leave(self) -> None:
+        with self._lock: self.inflight -= 1
+        self._slots.release()
+
+    def _broken(self, pool) -> None:
+        with self._lock:   # child o‘lib qolgan (OOM va h.k.) — keyingi ish yangi pool oladi
+            if self._pool is pool: self._pool = None
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            waiter = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire, True, EXEC_QUEUE_TIMEOUT))
+            try: ok = await asyncio.shield(waiter)
+            except asyncio.CancelledError:   # kutuvchi ketdi — keyin olingan slot qaytariladi
+                waiter.add_done_callback(lambda t: t.cancelled() or not t.result() or self._slots.release())
+                raise
+            if not ok: raise self._busy()
+        self._enter()
+        pool = self.pool
+        try:
+            loop = asyncio.get_running_loop()
+            if not self.process:
+                return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+            res, events = await loop.run_in_executor(pool, _call_capturing_metrics, fn, args, kwargs)
+            METRICS.merge(events)
+            return res
+        except BrokenProcessPool:
+            self._broken(pool); raise
+        finally:
+            self._leave()
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """Sinxron variant (IO_POOL thread'idan): o‘sha navbat va limit, natijani kutib qaytaradi."""
+        if not self._slots.acquire(timeout=EXEC_QUEUE_TIMEOUT): raise self._busy()
+        self._enter()
+        pool = self.pool
+        try:
+            if not self.process: return pool.submit(fn, *args, **kwargs).result()
+            res, events = pool.submit(_call_capturing_metrics, fn, args, kwargs).result()
+            METRICS.merge(events)
+            return res
+        except BrokenProcessPool:
+            self._broken(pool); raise
+        finally:
+            self._leave()
+
+    def shutdown(self) -> None:
+        with self._lock: pool, self._pool = self._pool, None
+        if pool is not None: pool.shutdown(wait=False, cancel_futures=True)
+
+IO_POOL = BoundedExecutor("io", lambda n: ThreadPoolExecutor(n, thread_name_prefix="ofm-io"), IO_WORKERS, IO_QUEUE)
+CPU_POOL = BoundedExecutor(
+    "cpu", lambda n: ProcessPoolExecutor(n, mp_context=multiprocessing.get_context(CPU_MP_CONTEXT), initializer=_mark_pool_child),
+    CPU_WORKERS, CPU_QUEUE, process=True,
+)
+
+def cpu_call(fn: Callable, *args, **kwargs):
+    """IO_POOL thread'idan (soffice/tarmoq kutadigan op ichidan) CPU ishini CPU_POOL process'iga berish —
+    PyPDF2/PIL GIL'ni ushlab turmaydi. Natija sinxron kutiladi."""
+    if IN_POOL_CHILD: return fn(*args, **kwargs)
+    return CPU_POOL.submit(fn, *args, **kwargs)
+
+# =========================
+# OPERATIONS (sinxron; executor ichida ishlaydi)
+# =========================
+IMG_EXTS = [".jpg",".jpeg",".png",".webp"]
+
+def op_result(paths: Optional[List[str]] = None, text: str = "", notes: Optional[List[str]] = None, error: str = "") -> dict:
+    return {"paths": paths or [], "text": text, "notes": notes or [], "error": error}
+
+def prefetch_dir(src: str) -> str:
+    """Fayl uchun oldindan tayyorlangan natijalar: <sessiya>/.pre/<nom>-<inode>-<hajm>/ (fayl almashsa — boshqa papka)."""
+    st = os.stat(src)
+    return os.path.join(os.path.dirname(src), ".pre", f"{os.path.basename(src)}-{st.st_ino}-{st.st_size}")
+
+def prefetched(src: str, kind: str) -> Optional[str]:
+    """kind: pdf (soffice natijasi) | text (extract_texts elementi, JSON)."""
+    try: d = prefetch_dir(src)
+    except OSError: return None
+    p = os.path.join(d, os.path.splitext(os.path.basename(src))[0] + ".pdf" if kind == "pdf" else "text.json")
+    if not os.path.exists(p): return None
+    METRICS.inc("ofm_prefetch_used_total", kind=kind)
+    return p
+
+# ---- PDF -> PNG (sahifalab, ZIP) ----
+RASTER_DPI = int(os.getenv("RASTER_DPI", "150"))
+RASTER_MAX_DPI = int(os.getenv("RASTER_MAX_DPI", "300"))
+RASTER_MAX_PAGES = int(os.getenv("RASTER_MAX_PAGES", "500"))
+RASTER_BATCH = int(os.getenv("RASTER_BATCH", "8"))                     # bitta pdftoppm chaqiruvidagi sahifalar
+RASTER_WORKERS = int(os.getenv("RASTER_WORKERS", str(os.cpu_count() or 2)))
+
+def _raster_run(pdf_path: str, run: List[int], dpi: int, td: str) -> List[str]:
+    paths = convert_from_path(pdf_path, dpi=dpi, fmt="png", first_page=run[0], last_page=run[-1],
+                              output_folder=td, paths_only=True, thread_count=1)
+    return sorted(paths)
+
+def pdf_to_png_zip(jobs: List[tuple], out_zip: str, dpi: int) -> int:
+    """jobs: [(pdf_path, prefix, pages)]. Sahifalar RASTER_BATCH tadan parallel pdftoppm'da rasterlanadi,
+    tayyor PNG'lar tartib bilan ZIP'ga (diskdan) yoziladi va o‘chiriladi — oldinda ko‘pi bilan 2*RASTER_WORKERS to‘plam."""
+    tasks = [(pdf, prefix, run) for pdf, prefix, pages in jobs for run in _page_runs(pages, RASTER_BATCH)]
+    if not tasks: return 0
+    written = 0; window = max(1, 2 * RASTER_WORKERS)
+    with stage("pdf_raster"), tempfile.TemporaryDirectory(dir=OCR_TMP) as td, \
+         zipfile.ZipFile(out_zip, "w", zipfile.ZIP_STORED, allowZip64=True) as zf, \
+         ThreadPoolExecutor(min(RASTER_WORKERS, len(tasks)), thread_name_prefix="ofm-raster") as ex:
+        pending: deque = deque()
+        it = iter(tasks)
+        for t in itertools.islice(it, window): pending.append((t, ex.submit(_raster_run, t[0], t[2], dpi, td)))
+        while pending:
+            (pdf, prefix, run), fut = pending.popleft()
+            for page, png in zip(run, fut.result()):
+                zf.write(png, f"{prefix}_p{page:04d}.png"); os.remove(png); written += 1
+            nxt = next(it, None)
+            if nxt: pending.append((nxt, ex.submit(_raster_run, nxt[0], nxt[2], dpi, td)))
+    METRICS.inc("ofm_raster_pages_total", written)
+    return written
+
+def image_to_png(src: str, out: str) -> str:
+    Image.open(src).convert("RGB").save(out, format="PNG")
+    return out
 
-def ocr_pdf(pdf_path: str, max_pages: int = 10, dpi: int = 200) -> str:
-    pages = convert_from_path(pdf_path, dpi=dpi, fmt="jpeg", first_page=1, last_page=None)
-    texts = []
-    for i, im in enumerate(pages, start=1):
-        if i > max_pages: break
-        buf = io.BytesIO(); im.save(buf, format="JPEG"); buf.seek(0)
-        txt = pytesseract.image_to_string(Image.open(buf))
-        if txt.strip(): texts.append(txt.strip())
-    return "\n\n---\n\n".join(texts)
+def op_convert(files: List[str], params: dict, target: str, out_dir: str) -> dict:
+    result_paths: List[str] = []; notes: List[str] = []
+    if target == "pdf":
+        imgs = [p for p in files if os.path.splitext(p)[1].lower() in IMG_EXTS]
+        others = [p for p in files if p not in imgs]
+        if imgs:
+            out = os.path.join(out_dir, f"images_{now_stamp()}.pdf")
+            cpu_call(images_to_single_pdf, imgs, out); result_paths.append(out)
+        for f in others:
+            out = prefetched(f, "pdf") or soffice_convert_to_pdf(f, out_dir); result_paths.append(out)
+        if len(result_paths) > 1:
+            merged = os.path.join(out_dir, f"merged_{now_stamp()}.pdf")
+            cpu_call(pdf_merge, result_paths, merged); result_paths = [merged]
+
+    elif target == "png":
+        dpi = max(36, min(int(params.get("dpi") or RASTER_DPI), RASTER_MAX_DPI))
+        jobs = []; budget = RASTER_MAX_PAGES
+        multi = sum(f.lower().endswith(".pdf") for f in files) > 1
+        for i, f in enumerate(files, 1):
+            ext = os.path.splitext(f)[1].lower()
+            if ext == ".pdf":
+                total = pdf_page_count(f)
+                pages = sorted(set(parse_page_range(params["range"], total))) if params.get("range") else list(range(1, total + 1))
+                if len(pages) > budget:
+                    notes.append(f"ℹ️ {input_ref(files, f)}: faqat birinchi {budget} sahifa (limit {RASTER_MAX_PAGES}).")
+                    pages = pages[:budget]
+                budget -= len(pages)
+                stem = os.path.splitext(os.path.basename(f))[0]
+                if pages: jobs.append((f, f"{i:02d}_{stem}" if multi else stem, pages))   # bir xil nomli PDF'lar to‘qnashmasin
+            else:
+                out = os.path.join(out_dir, os.path.splitext(os.path.basename(f))[0] + ".png")
+                result_paths.append(cpu_call(image_to_png, f, out))
+        if jobs:
+            out = os.path.join(out_dir, f"{jobs[0][1] if len(jobs) == 1 else 'pages'}_png_{now_stamp()}.zip")
+            n = pdf_to_png_zip(jobs, out, dpi)
+            result_paths.append(out); notes.append(f"🖼 {n} sahifa, {dpi} DPI — ZIP arxivda.")
+    return op_result(result_paths, notes=notes)
+
+def op_merge(files: List[str], params: dict, target: str, out_dir: str) -> dict:
+    out = os.path.join(out_dir, f"merged_{now_stamp()}.pdf")
+    pdf_merge([p for p in files if p.lower().endswith(".pdf")], out)
+    return op_result([out])
+
+def op_split(files: List[str], params: dict, target: str, out_dir: str) -> dict:
+    out = os.path.join(out_dir, f"split_{now_stamp()}.pdf")
+    pdf_split_range([p for p in files if p.lower().endswith(".pdf")][0], params["range"], out)
+    return op_result([out])
+
+def op_pagenum(files: List[str], params: dict, target: str, out_dir: str) -> dict:
+    out = os.path.join(out_dir, f"pagenum_{now_stamp()}.pdf")
+    pdf_overlay_text([p for p in files if p.lower().endswith(".pdf")][0], out, text="", page_numbers=True)
+    return op_result([out])
+
+def op_watermark(files: List[str], params: dict, target: str, out_dir: str) -> dict:
+    out = os.path.join(out_dir, f"watermark_{now_stamp()}.pdf")
+    pdf_overlay_text([p for p in files if p.lower().endswith(".pdf")][0], out,
+                     text=params.get("wm_text", "OFM"), page_numbers=False)
+    return op_result([out])
+
+def extract_text_item(f: str) -> dict:
+    """{"file", "text", "mode", "pages"}; PDF'da matn qatlami bo‘lsa OCR qilinmaydi."""
+    if f.lower().endswith(".pdf"): return {"file": f, **pdf_extract_text(f)}
+    return {"file": f, "text": cpu_call(ocr_image, f), "mode": "ocr", "pages": [{"page": 1, "source": "ocr"}]}
+
+def extract_texts(files: List[str], images_only: bool = False) -> List[dict]:
+    """Har fayl uchun extract_text_item; oldindan tayyorlangani (prefetch) bo‘lsa — o‘sha."""
+    items = []
+    for f in files:
+        ext = os.path.splitext(f)[1].lower()
+        if images_only and ext != ".pdf" and ext not in IMG_EXTS: continue
+        try:
+            pre = prefetched(f, "text")
+            if pre:
+                with open(pre, encoding="utf-8") as fh: items.append({**json.load(fh), "file": f})
+            else:
+                items.append(extract_text_item(f))
+        except Exception: traceback.print_exc()
+    return items
+
+def input_ref(files: List[str], f: str) -> str:
+    """Izohdagi kirish fayli nomi o‘rniga belgi — nom so‘rov bo‘yicha render_refs'da qo‘yiladi (kesh nomlarni saqlamaydi)."""
+    return f"\x00{files.index(f)}\x00" if f in files else os.path.basename(f)
+
+def render_refs(text: str, files: List[str]) -> str:
+    return re.sub(r"\x00(\d+)\x00", lambda m: os.path.basename(files[int(m.group(1))]) if int(m.group(1)) < len(files) else "", text or "")
+
+def text_mode_notes(items: List[dict], files: List[str]) -> List[str]:
+    notes = []
+    for it in items:
+        if not it["file"].lower().endswith(".pdf"): continue
+        n_text = sum(p["source"] == "text" for p in it["pages"])
+        notes.append(f"ℹ️ {input_ref(files, it['file'])}: {it['mode']} "
+                     f"(matn qatlami: {n_text}, OCR: {len(it['pages']) - n_text} sahifa)")
+    return notes
+
+def op_ocr(files: List[str], params: dict, target: str, out_dir: str) -> dict:
+    items = extract_texts(files)
+    texts = [it["text"] for it in items]
+    if texts:
+        return op_result(text="📝 OCR natija:\n\n" + "\n\n---\n\n".join([t for t in texts if t][:3]),
+                         notes=text_mode_notes(items, files))
+    return op_result(text="Matn topilmadi.")
+
+# ---- Tarjima dvigateli (bo‘laklab, parallel, keshli) ----
+TRANSLATE_BACKEND = os.getenv("TRANSLATE_BACKEND", "google")    # google | echo (tarmoqsiz, test uchun)
+TRANSLATE_CHUNK = int(os.getenv("TRANSLATE_CHUNK", "4500"))      # provayder limiti ichida
+TRANSLATE_CONCURRENCY = int(os.getenv("TRANSLATE_CONCURRENCY", "4"))
+TRANSLATE_CACHE_SIZE = int(os.getenv("TRANSLATE_CACHE_SIZE", "2000"))
+TRANSLATE_INLINE_MAX = 4000   # bundan uzun natija .txt hujjat bo‘lib boradi
+
+class GoogleTranslateBackend:
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def translate(self, text: str, dest: str) -> str:
+        with self._lock:
+            if self._client is None: self._client = Translator()
+        return self._client.translate(text, dest=dest).text
+
+class EchoTranslateBackend:
+    """Lokal stand-in: matnni o‘zgartirmay, til belgisi bilan qaytaradi."""
+
+    def translate(self, text: str, dest: str) -> str:
+        return f"[{dest}] {text}"
+
+TRANSLATE_BACKENDS = {"google": GoogleTranslateBackend, "echo": EchoTranslateBackend}
+
+def split_chunks(text: str, limit: int) -> List[tuple]:
+    """[(bo‘lak, keyingi ajratgich)] — paragraf chegarasida; juda uzun paragraf qator/gap bo‘yicha."""
+    pieces: List[tuple] = []
+    # ajratgichlar o‘zi saqlanadi: OCR matni qatorlarga bo‘lingan, "".join(b + s) matnni tiklaydi
+    parts = re.split(r"(\n\s*\n)", text.strip())
+    for para, psep in zip(parts[::2], parts[1::2] + [""]):
+        if len(para) <= limit:
+            pieces.append((para, psep)); continue
+        sents = re.split(r"(?<=[.!?\n])(\s+)", para)
+        for sent, ssep in zip(sents[::2], sents[1::2] + [""]):
+            if not sent:   # paragraf oxiridagi bo‘shliq — ajratgich oldingi bo‘lakka qo‘shiladi
+                pieces[-1] = (pieces[-1][0], pieces[-1][1] + ssep); continue
+            while len(sent) > limit:
+                pieces.append((sent[:limit], "")); sent = sent[limit:]
+            pieces.append((sent, ssep))
+        pieces[-1] = (pieces[-1][0], pieces[-1][1] + psep)
+    chunks: List[tuple] = []; cur = ""; cur_sep = ""
+    for piece, sep in pieces:
+        if cur and len(cur) + len(cur_sep) + len(piece) > limit:
+            chunks.append((cur, cur_sep)); cur = ""
+        cur = cur + cur_sep + piece if cur else piece
+        cur_sep = sep
+    if cur: chunks.append((cur, ""))
+    return chunks
+
+class TranslationEngine:
+    def __init__(self, backend, chunk: int, concurrency: int, cache_size: int):
+        self.backend = backend
+        self.chunk = chunk
+        self.concurrency = max(1, concurrency)
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self.stats = {"chunks": 0, "cache_hit": 0}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _key(self, text: str, dest: str) -> tuple:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest(), dest
+
+    def translate(self, text: str, dest: str) -> str:
+        chunks = split_chunks(text, self.chunk)
+        out: List[Optional[str]] = [None] * len(chunks)
+        todo = []
+        with self._lock:
+            for i, (c, _) in enumerate(chunks):
+                k = self._key(c, dest)
+                if k in self.cache:
+                    self.cache.move_to_end(k); out[i] = self.cache[k]; self.stats["cache_hit"] += 1
+                else: todo.append(i)
+            if todo and self._pool is None:
+                self._pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix="ofm-tr")
+        for i, res in zip(todo, self._pool.map(lambda i: self.backend.translate(chunks[i][0], dest), todo) if todo else []):
+            out[i] = res
+            with self._lock:
+                self.cache[self._key(chunks[i][0], dest)] = res; self.stats["chunks"] += 1
+                while len(self.cache) > self.cache_size: self.cache.popitem(last=False)
+        return "".join(o + sep for o, (_, sep) in zip(out, chunks)).strip()
+
+TRANSLATOR = TranslationEngine(TRANSLATE_BACKENDS.get(TRANSLATE_BACKEND, GoogleTranslateBackend)(),
+                               TRANSLATE_CHUNK, TRANSLATE_CONCURRENCY, TRANSLATE_CACHE_SIZE)
+
+def op_translate(files: List[str], params: dict, target: str, out_dir: str) -> dict:
+    tgt = params.get("tgt", "uz")
+    # file bo‘lsa — matn qatlami yoki OCR orqali olamiz
+    items = extract_texts(files, images_only=True)   # PyPDF2/OCR qismlari cpu_call bilan process'da; tarjima (tarmoq) — shu thread'da
+    full = "\n\n".join([it["text"] for it in items if it["text"]])
+    if not full.strip(): return op_result(error="Tarjima uchun matn yo‘q.")
+    translated = TRANSLATOR.translate(full, tgt)
+    notes = text_mode_notes(items, files)
+    if len(translated) <= TRANSLATE_INLINE_MAX:
+        return op_result(text=f"🌐 Tarjima → {tgt}:\n\n{translated}", notes=notes)
+    out = os.path.join(out_dir, f"translate_{tgt}_{now_stamp()}.txt")
+    with open(out, "w", encoding="utf-8") as f: f.write(translated)
+    return op_result([out], text=f"🌐 Tarjima → {tgt}: {len(translated)} belgi — to‘liq matn faylda.", notes=notes)
+
+# =========================
+# RESULT CACHE (kirish baytlari + op + parametrlar bo‘yicha)
+# =========================
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(WORKDIR, "cache"))
+CACHE_MAX_BYTES = int(float(os.getenv("CACHE_MAX_MB", "512")) * 1024 * 1024)
+CACHE_VERSION = 2   # natija formati o‘zgarsa oshiring — eski yozuvlar ishlatilmaydi
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""): h.update(chunk)
+    return h.hexdigest()
+
+def normalize_params(op: str, params: dict, target: str) -> dict:
+    if op == "convert":
+        if (target or "").lower() != "png": return {"target": (target or "").lower()}
+        return {"target": "png", "range": re.sub(r"\s+", "", params.get("range", "")), "dpi": params.get("dpi")}
+    if op == "split": return {"range": re.sub(r"\s+", "", params.get("range", ""))}
+    if op == "watermark": return {"wm_text": params.get("wm_text", "OFM")}
+    if op == "translate": return {"tgt": params.get("tgt", "uz")}
+    return {}
+
+def engine_settings(op: str, target: str) -> dict:
+    """Natijaga ta'sir qiluvchi server sozlamalari — o‘zgarsa eski kesh yozuvlari ishlatilmaydi."""
+    if op in ("ocr", "translate"):
+        return {"ocr": [OCR_LANG, OCR_PSM, OCR_DPI, OCR_PREPROCESS, OCR_MAX_SIDE, OCR_BINARIZE, OCR_DESKEW, OCR_DESKEW_MAX],
+                **({"tr": TRANSLATE_BACKEND} if op == "translate" else {})}
+    if op == "convert":
+        if (target or "").lower() == "png": return {"raster": [RASTER_DPI, RASTER_MAX_DPI, RASTER_MAX_PAGES]}
+        return {"img_pdf": [IMG_PDF_PAGE, IMG_PDF_DPI, IMG_PDF_MARGIN, IMG_PDF_QUALITY]}
+    return {}
+
+class ResultCache:
+    """Disk'dagi LRU: <dir>/<key[:2]>/<key>/{meta.json, natija fayllari}. Yozuv atomik (rename)."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.stats = {"hit": 0, "miss": 0, "store": 0, "evict": 0}
+        self._lock = threading.Lock()
+
+    def key(self, op: str, files: List[str], params: dict, target: str) -> str:
+        norm = {"v": CACHE_VERSION, "op": op, "inputs": [file_sha256(f) for f in files],
+                "params": normalize_params(op, params, target), "engine": engine_settings(op, target)}
+        return hashlib.sha256(json.dumps(norm, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    # Kesh kirish baytlari bo‘yicha — nomlar esa har so‘rovniki. Natija fayllari neytral nom bilan (out<k><ext>)
+    # saqlanadi; kirish nomidan yasalgan nom (<stem>..., NN_<stem>...) [indeks, raqamli, qoldiq] shablon bo‘ladi.
+    # ZIP ichidagi yozuv nomlari ham shunday. Izohlar (notes) input_ref belgilari bilan — nomsiz.
+    @staticmethod
+    def _template(name: str, files: List[str]) -> list:
+        stems = [os.path.splitext(os.path.basename(f))[0] for f in files]
+        for i in sorted(range(len(stems)), key=lambda i: -len(stems[i])):
+            for numbered, pre in ((True, f"{i + 1:02d}_{stems[i]}"), (False, stems[i])):
+                if stems[i] and name.startswith(pre) and name[len(pre):len(pre) + 1] in ("", ".", "_"):
+                    return [i, numbered, name[len(pre):]]
+        return [None, False, name]
+
+    @staticmethod
+    def _render(tpl: list, files: List[str]) -> str:
+        i, numbered, rest = tpl
+        if i is None or i >= len(files): return rest
+        stem = os.path.splitext(os.path.basename(files[i]))[0]
+        return (f"{i + 1:02d}_" if numbered else "") + stem + rest
+
+    def get(self, key: str, out_dir: str, files: List[str]) -> Optional[dict]:
+        """Topilsa natija fayllari out_dir'ga joriy so‘rov nomlari bilan hardlink/copy qilinadi va op_result qaytadi."""
+        if self.max_bytes <= 0: return None
+        entry = self._entry(key); meta_path = os.path.join(entry, "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f: meta = json.load(f)
+            paths = []
+            for k, (stored, tpl) in enumerate(zip(meta["files"], meta["names"])):
+                dst = os.path.join(out_dir, self._render(tpl, files)); src = os.path.join(entry, stored)
+                if os.path.exists(dst): os.remove(dst)
+                members = meta.get("zip", {}).get(str(k))
+                if members: self._rezip(src, dst, [self._render(t, files) for t in members])
+                else:
+                    try: os.link(src, dst)
+                    except OSError: shutil.copyfile(src, dst)
+                paths.append(dst)
+            os.utime(meta_path)   # LRU: oxirgi foydalanish vaqti
+        except (OSError, ValueError, KeyError, TypeError):
+            with self._lock: self.stats["miss"] += 1
+            return None
+        with self._lock: self.stats["hit"] += 1
+        return op_result(paths, text=meta.get("text", ""), notes=meta.get("notes", []))
+
+    @staticmethod
+    def _rezip(src: str, dst: str, names: List[str]) -> None:
+        # siqilmagan PNG'lar — baytlar ko‘chiriladi, faqat yozuv nomlari boshqa
+        with zipfile.ZipFile(src) as zin, zipfile.ZipFile(dst, "w", zipfile.ZIP_STORED, allowZip64=True) as zout:
+            for info, name in zip(zin.infolist(), names):
+                with zin.open(info) as r, zout.open(zipfile.ZipInfo(name, info.date_time), "w", force_zip64=True) as w:
+                    shutil.copyfileobj(r, w, 1024 * 1024)
+
+    def put(self, key: str, res: dict, files: List[str]) -> None:
+        if self.max_bytes <= 0 or res.get("error"): return
+        entry = self._entry(key)
+        if os.path.exists(entry): return
+        ensure_dir(os.path.dirname(entry))
+        tmp = tempfile.mkdtemp(prefix=".tmp_", dir=os.path.dirname(entry))
+        try:
+            stored, names, zips = [], [], {}
+            for k, p in enumerate(res["paths"]):
+                base = os.path.basename(p); name = f"out{k}{os.path.splitext(base)[1]}"
+                shutil.copyfile(p, os.path.join(tmp, name))
+                stored.append(name); names.append(self._template(base, files))
+                if base.lower().endswith(".zip"):
+                    with zipfile.ZipFile(p) as z: members = [self._template(n, files) for n in z.namelist()]
+                    if any(t[0] is not None for t in members): zips[str(k)] = members
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"files": stored, "names": names, "zip": zips, "text": res.get("text", ""),
+                           "notes": res.get("notes", [])}, f, ensure_ascii=False)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True); return
+        with self._lock: self.stats["store"] += 1
+        self.evict()
+
+    def _entries(self) -> List[tuple]:
+        out = []
+        if not os.path.isdir(self.root): return out
+        for shard in os.listdir(self.root):
+            sd = os.path.join(self.root, shard)
+            if not os.path.isdir(sd): continue
+            for key in os.listdir(sd):
+                entry = os.path.join(sd, key)
+                if key.startswith(".tmp_"): continue
+                try:
+                    atime = os.path.getmtime(os.path.join(entry, "meta.json"))
+                    size = sum(os.path.getsize(os.path.join(entry, n)) for n in os.listdir(entry))
+                except OSError: continue
+                out.append((atime, size, entry))
+        return out
+
+    def usage(self) -> int:
+        return sum(e[1] for e in self._entries())
+
+    def evict(self) -> None:
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes: break
+            shutil.rmtree(entry, ignore_errors=True); total -= size
+            with self._lock: self.stats["evict"] += 1
+
+RESULT_CACHE = ResultCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+# op -> (funksiya, executor). soffice LO_POOL'dan foydalanadi — u shu process'da, shuning uchun thread.
+# convert/translate thread'da, lekin ularning PyPDF2/PIL qismlari cpu_call orqali CPU_POOL'da.
+OPS: Dict[str, tuple] = {
+    "convert": (op_convert, IO_POOL),
+    "merge": (op_merge, CPU_POOL),
+    "split": (op_split, CPU_POOL),
+    "pagenum": (op_pagenum, CPU_POOL),
+    "watermark": (op_watermark, CPU_POOL),
+    "ocr": (op_ocr, IO_POOL),   # sahifa to‘plamlari o‘zi CPU_POOL'ga tarqaladi
+    "translate": (op_translate, IO_POOL),
+}
+
+# =========================
+# JOB QUEUE (og‘ir ishlar alohida worker process'larda: python -m app.worker)
+# =========================
+JOB_BACKEND = os.getenv("JOB_BACKEND", "inline")    # inline | sqlite
+JOB_DB = os.getenv("JOB_DB", "")                    # default: WORKDIR/jobs.db
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))    # heartbeat bo‘lmasa ish shu vaqtdan keyin qayta beriladi
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+
+class JobQueue(ABC):
+    """Broker interfeysi. Boshqa broker (Redis va h.k.) uchun shu metodlarni yozish kifoya —
+    birortasi yetishmasa, xato ish o‘rtasida emas, obyekt yaratilayotganda chiqadi."""
+
+    @abstractmethod
+    def enqueue(self, kind: str, payload: dict) -> str: ...
+    @abstractmethod
+    def claim(self, worker: str) -> Optional[dict]: ...
+    @abstractmethod
+    def heartbeat(self, job_id: str) -> None: ...
+    @abstractmethod
+    def complete(self, job_id: str, result: dict) -> None: ...
+    @abstractmethod
+    def fail(self, job_id: str, error: str) -> None: ...
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[dict]: ...
+    @abstractmethod
+    def stats(self) -> Dict[str, int]: ...
+
+class SqliteJobQueue(JobQueue):
+    """queued -> running (lease bilan) -> done|failed. Worker o‘lib qolsa lease tugaydi va ish
+    boshqa worker'ga o‘tadi; JOB_MAX_ATTEMPTS'dan oshsa — failed ("dead") sifatida qaytariladi."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        ensure_dir(os.path.dirname(path))
+        self._conn().executescript(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,"
+            " status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, worker TEXT,"
+            " result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            c.row_factory = sqlite3.Row
+            c.execute("PRAGMA journal_mode=WAL"); c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    @staticmethod
+    def _row(r) -> dict:
+        d = dict(r); d["payload"] = json.loads(d["payload"])
+        d["result"] = json.loads(d["result"]) if d.get("result") else None
+        return d
+
+    def enqueue(self, kind: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex; now = time.time()
+        self._conn().execute("INSERT INTO jobs (id, kind, payload, status, created, updated) VALUES (?, ?, ?, 'queued', ?, ?)",
+                             (job_id, kind, json.dumps(payload, ensure_ascii=False), now, now))
+        return job_id
+
+    def claim(self, worker: str) -> Optional[dict]:
+        c = self._conn(); now = time.time()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            r = c.execute("SELECT * FROM jobs WHERE status='queued' OR (status='running' AND lease_until < ?) "
+                          "ORDER BY created LIMIT 1", (now,)).fetchone()
+            if r is None:
+                c.execute("COMMIT"); return None
+            job = self._row(r)
+            if job["attempts"] >= JOB_MAX_ATTEMPTS:
+                c.execute("UPDATE jobs SET status='failed', error=?, updated=? WHERE id=?",
+                          ("worker ish paytida to‘xtadi", now, job["id"]))
+                c.execute("COMMIT")
+                return {**job, "dead": True}
+            c.execute("UPDATE jobs SET status='running', attempts=attempts+1, lease_until=?, worker=?, updated=? WHERE id=?",
+                      (now + JOB_LEASE, worker, now, job["id"]))
+            c.execute("COMMIT")
+            return {**job, "attempts": job["attempts"] + 1, "dead": False}
+        except Exception:
+            c.execute("ROLLBACK"); raise
+
+    def heartbeat(self, job_id: str) -> None:
+        self._conn().execute("UPDATE jobs SET lease_until=?, updated=? WHERE id=? AND status='running'",
+                             (time.time() + JOB_LEASE, time.time(), job_id))
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self._conn().execute("UPDATE jobs SET status='done', result=?, lease_until=NULL, updated=? WHERE id=?",
+                             (json.dumps(result, ensure_ascii=False), time.time(), job_id))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._conn().execute("UPDATE jobs SET status='failed', error=?, lease_until=NULL, updated=? WHERE id=?",
+                             (error, time.time(), job_id))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        r = self._conn().execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._row(r) if r else None
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+JOB_QUEUE: Optional[JobQueue] = SqliteJobQueue(JOB_DB or os.path.join(WORKDIR, "jobs.db")) if JOB_BACKEND == "sqlite" else None
+
+# =========================
+# OUTBOUND (Telegram'ga yuborish)
+# =========================
+OUT_GLOBAL_RATE = float(os.getenv("OUT_GLOBAL_RATE", "25"))        # xabar/s, butun bot (Telegram ~30)
+OUT_GLOBAL_BURST = int(os.getenv("OUT_GLOBAL_BURST", "30"))
+OUT_CHAT_RATE = float(os.getenv("OUT_CHAT_RATE", "1"))            # xabar/s, bitta shaxsiy chat
+OUT_CHAT_BURST = int(os.getenv("OUT_CHAT_BURST", "5"))
+OUT_GROUP_RATE = float(os.getenv("OUT_GROUP_RATE", str(20 / 60)))  # guruhlar: ~20 xabar/daqiqa
+OUT_GROUP_BURST = int(os.getenv("OUT_GROUP_BURST", "5"))
+OUT_MAX_RETRIES = int(os.getenv("OUT_MAX_RETRIES", "4"))
+OUT_CHAT_BUCKETS = int(os.getenv("OUT_CHAT_BUCKETS", "10000"))
+
+class TokenBucket:
+    """asyncio token-bucket: navbat bilan band qilinadi (tokens manfiyga tushishi mumkin), kutish — sleep.
+    pause(sec) — 429 retry_after: shu vaqtgacha hech kim yubormaydi."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate, self.burst = rate, burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, n: int = 1) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate); self.stamp = now
+        self.tokens -= n
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def pause(self, sec: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + sec)
+
+class Outbound:
+    """Telegram'ga chiquvchi xabarlar: global + chat bo‘yicha limit, 429 da retry_after kutib qayta urinish.
+    Har process'ning o‘z buckets'i (worker'lar bir nechta bo‘lsa — OUT_GLOBAL_RATE'ni bo‘lib bering)."""
+
+    def __init__(self):
+        self.glob = TokenBucket(OUT_GLOBAL_RATE, OUT_GLOBAL_BURST)
+        self.chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self.stats = {"sent": 0, "retry_after": 0, "failed": 0, "waited_s": 0.0}
+
+    def _chat(self, chat_id: int) -> TokenBucket:
+        b = self.chats.pop(chat_id, None)
+        if b is None:
+            b = TokenBucket(OUT_GROUP_RATE, OUT_GROUP_BURST) if chat_id < 0 else TokenBucket(OUT_CHAT_RATE, OUT_CHAT_BURST)
+        self.chats[chat_id] = b
+        while len(self.chats) > OUT_CHAT_BUCKETS: self.chats.popitem(last=False)
+        return b
+
+    async def call(self, chat_id: int, method: str, fn: Callable, n: int = 1):
+        """fn() — bot.<method>(...) korutinasini qaytaruvchi funksiya (qayta urinishda yangidan chaqiriladi)."""
+        bucket = self._chat(chat_id)
+        for attempt in range(OUT_MAX_RETRIES + 1):
+            wait = max(self.glob.reserve(n), bucket.reserve(n))
+            if wait > 0:
+                self.stats["waited_s"] += wait
+                METRICS.observe("ofm_outbound_wait_seconds", wait, method=method)
+                await asyncio.sleep(wait)
+            try:
+                with stage(method):
+                    res = await fn()
+                self.stats["sent"] += n
+                METRICS.inc("ofm_outbound_messages_total", n, method=method)
+                return res
+            except TelegramRetryAfter as e:
+                self.stats["retry_after"] += 1
+                METRICS.inc("ofm_outbound_retry_after_total", method=method)
+                bucket.pause(e.retry_after)
+                if attempt == OUT_MAX_RETRIES: break
+            except TelegramNetworkError:
+                if attempt == OUT_MAX_RETRIES: break
+                await asyncio.sleep(min(2 ** attempt, 10))
+        self.stats["failed"] += 1
+        METRICS.inc("ofm_outbound_failed_total", method=method)
+        raise RuntimeError(f"Telegram'ga yuborilmadi ({method}, chat {chat_id})")
+
+OUTBOUND = Outbound()
+
+def _input_size(doc) -> int:
+    if isinstance(doc, BufferedInputFile): return len(doc.data)
+    if isinstance(doc, FSInputFile): return files_size([str(doc.path)])
+    return 0
+
+def as_input_file(doc) -> "BufferedInputFile | FSInputFile":
+    """Yo‘l berilsa — FSInputFile: fayl diskdan bo‘laklab o‘qiladi, xotiraga to‘liq yuklanmaydi."""
+    return FSInputFile(doc, filename=os.path.basename(doc)) if isinstance(doc, str) else doc
+
+async def send_message(chat_id: int, text: str, **kwargs):
+    return await OUTBOUND.call(chat_id, "send_message", lambda: bot.send_message(chat_id, text, **kwargs))
+
+async def send_document(chat_id: int, document, **kwargs):
+    document = as_input_file(document)
+    observe_bytes("send_document", "out", _input_size(document))
+    return await OUTBOUND.call(chat_id, "send_document", lambda: bot.send_document(chat_id, document, **kwargs))
+
+async def send_documents(chat_id: int, docs: list, captions: Optional[List[str]] = None):
+    """Bir nechta fayl — sendMediaGroup (10 tadan albom), bittasi — oddiy sendDocument.
+    docs: yo‘l yoki InputFile; captions: har fayl uchun (ixtiyoriy)."""
+    docs = [as_input_file(d) for d in docs]; captions = captions or [None] * len(docs)
+    if len(docs) == 1:
+        return [await send_document(chat_id, docs[0], caption=captions[0])]
+    out = []
+    for i in range(0, len(docs), 10):
+        part = docs[i:i + 10]; caps = captions[i:i + 10]
+        if len(part) == 1:
+            out.append(await send_document(chat_id, part[0], caption=caps[0])); continue
+        observe_bytes("send_document", "out", sum(_input_size(d) for d in part))
+        media = [InputMediaDocument(media=d, caption=c) for d, c in zip(part, caps)]
+        out.append(await OUTBOUND.call(chat_id, "send_media_group",
+                                       lambda media=media: bot.send_media_group(chat_id, media), n=len(part)))
+    return out
+
+# =========================
+# ADMISSION (og‘ir ishlarga kirish nazorati)
+# =========================
+ADMIT_CAPACITY = int(os.getenv("ADMIT_CAPACITY", str(max(4, (os.cpu_count() or 2) * 2))))   # bir vaqtdagi "og‘irlik" birliklari
+ADMIT_USER_MAX = int(os.getenv("ADMIT_USER_MAX", "1"))       # bitta foydalanuvchining bajarilayotgan + navbatdagi ishlari
+ADMIT_QUEUE_MAX = int(os.getenv("ADMIT_QUEUE_MAX", "50"))    # shundan oshsa — rad (load shedding)
+ADMIT_WAIT_TIMEOUT = float(os.getenv("ADMIT_WAIT_TIMEOUT", "600"))
+OP_COST = {"split": 1, "merge": 1, "pagenum": 1, "watermark": 1, "translate": 2, "convert": 3, "resume": 3, "ocr": 4,
+           "resume_bulk": 3}   # resume_bulk — har RESUME_BULK_CHUNK yozuv uchun (units)
+
+class AdmissionRejected(RuntimeError):
+    pass
+
+class Admission:
+    """Global og‘irlik limiti + foydalanuvchi limiti + chegaralangan FIFO navbat.
+    Navbat boshidagisi sig‘maguncha keyingilar o‘tkazilmaydi (og‘ir ishlar och qolmasin).
+    notify(pos) — navbatdagi o‘rin o‘zgarganda chaqiriladi (pos=0: boshlandi)."""
+
+    def __init__(self, capacity: int, user_max: int, queue_max: int):
+        self.capacity, self.user_max, self.queue_max = capacity, user_max, queue_max
+        self.used = 0
+        self.users: Dict[int, int] = {}
+        self.waiting: deque = deque()   # [cost, uid, future, notify, last_pos]
+        self.stats = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_user": 0, "timeout": 0}
+        self._chains: Dict[Callable, asyncio.Task] = {}   # notify -> oxirgi xabar vazifasi
+
+    def cost(self, op: str, units: int = 1) -> int:
+        # capacity'dan oshmaydi — eng og‘ir ish ham yolg‘iz bo‘lganda sig‘adi
+        return min(OP_COST.get(op, 1) * max(1, units), self.capacity)
+
+    def _fits(self, cost: int) -> bool:
+        return self.used + cost <= self.capacity
+
+    def _grant(self, cost: int) -> None:
+        self.used += cost; self.stats["admitted"] += 1
+
+    def _pump(self) -> None:
+        while self.waiting and self._fits(self.waiting[0][0]):
+            cost, uid, fut, notify, _ = self.waiting.popleft()
+            if fut.done(): continue
+            self._grant(cost); fut.set_result(True)
+        for pos, w in enumerate(self.waiting, 1):
+            if w[4] != pos and w[3] is not None:
+                w[4] = pos; self._post(w[3], pos)
+
+    @staticmethod
+    async def _notify(notify: Callable, pos: int) -> None:
+        try: await notify(pos)
+        except Exception: traceback.print_exc()
+
+    def _post(self, notify: Callable, pos: int) -> None:
+        """Xabar fonda (OUTBOUND kutishi slot hisobini ushlab turmasin), bitta notify uchun tartib saqlanadi."""
+        prev = self._chains.get(notify)
+        async def run():
+            if prev is not None: await asyncio.gather(prev, return_exceptions=True)
+            await self._notify(notify, pos)
+        t = asyncio.create_task(run()); self._chains[notify] = t
+        t.add_done_callback(lambda t, n=notify: self._chains.pop(n, None) if self._chains.get(n) is t else None)
+
+    def _hold(self, uid) -> None:
+        if uid is not None: self.users[uid] = self.users.get(uid, 0) + 1
+
+    def _drop(self, uid) -> None:
+        if uid is None: return
+        self.users[uid] -= 1
+        if not self.users[uid]: del self.users[uid]
+
+    @asynccontextmanager
+    async def slot(self, uid, op: str, notify: Optional[Callable] = None, units: int = 1):
+        """uid: foydalanuvchi (yoki ("bulk", id) kabi boshqa kalit); None — shaxssiz so‘rov, user limiti qo‘llanmaydi.
+        units: ish hajmi (masalan, bulk'dagi yozuv to‘plamlari) — narx OP_COST[op] * units."""
+        cost = self.cost(op, units)
+        if uid is not None and self.users.get(uid, 0) >= self.user_max:
+            self.stats["rejected_user"] += 1; METRICS.inc("ofm_admission_rejected_total", reason="user")
+            raise AdmissionRejected("⏳ Oldingi amalingiz hali bajarilmoqda — tugashini kuting.")
+        if not self.waiting and self._fits(cost):
+            self._grant(cost)
+        elif len(self.waiting) >= self.queue_max:
+            self.stats["rejected_full"] += 1; METRICS.inc("ofm_admission_rejected_total", reason="full")
+            raise AdmissionRejected("🚦 Server hozir juda band, navbat to‘la. Birozdan so‘ng ✅ Yakunlash'ni qayta bosing.")
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            w = [cost, uid, fut, notify, len(self.waiting) + 1]
+            self.waiting.append(w); self.stats["queued"] += 1
+            self._hold(uid)
+            if notify is not None: self._post(notify, w[4])
+            t0 = time.monotonic()
+            try:
+                await asyncio.wait_for(asyncio.shield(fut), ADMIT_WAIT_TIMEOUT)
+            except BaseException as e:
+                self._drop(uid)
+                if fut.done() and not fut.cancelled():
+                    self.used -= cost   # ruxsat berilgan edi, lekin kutuvchi ketdi
+                else:
+                    fut.cancel()
+                    if w in self.waiting: self.waiting.remove(w)
+                self._pump()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeout"] += 1; METRICS.inc("ofm_admission_rejected_total", reason="timeout")
+                    raise AdmissionRejected("⌛ Navbat juda uzoq cho‘zildi, qayta urinib ko‘ring.")
+                raise
+            self._drop(uid)
+            METRICS.observe("ofm_admission_wait_seconds", time.monotonic() - t0, op=op)
+            if notify is not None: self._post(notify, 0)
+        self._hold(uid)
+        try:
+            yield
+        finally:
+            self.used -= cost
+            self._drop(uid)
+            self._pump()
+
+ADMISSION = Admission(ADMIT_CAPACITY, ADMIT_USER_MAX, ADMIT_QUEUE_MAX)
+
+def queue_notifier(chat_id: int) -> Callable:
+    """Navbatdagi o‘rinni bitta xabarda ko‘rsatadi va uni tahrirlab boradi."""
+    msg = {}
+    async def notify(pos: int) -> None:
+        text = f"⏳ Navbatdasiz: {pos}-o‘rin." if pos else "▶️ Navbatingiz keldi, bajarilmoqda…"
+        if "id" not in msg:
+            if not pos: return
+            sent = await send_message(chat_id, text); msg["id"] = sent.message_id
+        else:
+            await OUTBOUND.call(chat_id, "edit_message_text",
+                                lambda: bot.edit_message_text(text, chat_id=chat_id, message_id=msg["id"]))
+    return notify
 
 # =========================
 # RESUME (form → docx/pdf) – 422 dan holi
 # =========================
+class TemplateCache:
+    """resume.docx bir marta o‘qiladi va parse qilinadi; har so‘rov xotiradagi nusxani oladi.
+    Fayl mtime'i o‘zgarsa qayta yuklanadi. Har process'da (CPU_POOL child'larida ham) o‘zining nusxasi."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.loads = 0
+        self._mtime: Optional[float] = None
+        self._raw = b""
+        self._docx = None
+        self._lock = threading.Lock()
+
+    def get(self) -> tuple:
+        """(DocxTemplate, cache_hit)"""
+        mtime = os.path.getmtime(self.path); hit = True
+        with self._lock:
+            if self._docx is None or mtime != self._mtime:
+                with open(self.path, "rb") as f: self._raw = f.read()
+                self._docx = Document(io.BytesIO(self._raw))
+                self._mtime = mtime; self.loads += 1; hit = False
+            try: clone = copy.deepcopy(self._docx)
+            except Exception: clone = Document(io.BytesIO(self._raw))
+        tpl = DocxTemplate(io.BytesIO(self._raw))
+        tpl.docx = clone   # render() shu tayyor hujjatdan foydalanadi, diskka qaytmaydi
+        return tpl, hit
+
+RESUME_TPL = TemplateCache(os.path.join(TEMPLATES_DIR, "resume.docx"))
+RESUME_RENDER_MS: deque = deque(maxlen=500)   # oxirgi render vaqtlari (ms), /admin uchun
+
+def render_resume_docx(ctx: dict, img_bytes: Optional[bytes] = None) -> dict:
+    """{"docx": bytes, "render_ms": float, "template_hit": bool}"""
+    t0 = time.perf_counter()
+    doc, hit = RESUME_TPL.get()
+    inline_img = None
+    if img_bytes:
+        try: inline_img = InlineImage(doc, io.BytesIO(img_bytes), width=Mm(35))
+        except Exception: inline_img = None
+    buf = io.BytesIO(); doc.render({**ctx, "photo": inline_img}); doc.save(buf)
+    return {"docx": buf.getvalue(), "render_ms": (time.perf_counter() - t0) * 1000, "template_hit": hit}
+
+# ---- To‘g‘ridan-to‘g‘ri PDF (LibreOffice'siz) ----
+RESUME_PDF_ENGINE = os.getenv("RESUME_PDF_ENGINE", "soffice")   # soffice | native (xato bo‘lsa soffice'ga qaytadi)
+
+# resume.html bilan bir xil tartib
+RESUME_FIELDS = [
+    ("Joriy lavozim sanasi", "current_position_date"), ("Joriy lavozim to‘liq", "current_position_full"),
+    ("Tug‘ilgan yili", "birth_date"), ("Tug‘ilgan joyi", "birth_place"),
+    ("Millati", "nationality"), ("Partiyaviyligi", "party_membership"),
+    ("Ma’lumoti", "education"), ("Tamomlagan", "university"),
+    ("Ma’lumoti bo‘yicha mutaxassisligi", "specialization"),
+    ("Ilmiy daraja", "ilmiy_daraja"), ("Ilmiy unvon", "ilmiy_unvon"),
+    ("Qaysi chet tillarini biladi", "languages"),
+    ("Davlat mukofotlari bilan taqdirlanganmi", "dav_mukofoti"),
+    ("Deputatligi", "deputat"), ("Doimiy yashash manzili", "adresss"),
+]
+RELATIVE_COLS = [
+    ("Qarindoshligi", "relation_type"), ("F.I.Sh", "full_name"), ("Tug‘ilgan yili va joyi", "b_year_place"),
+    ("Ish joyi va lavozimi", "job_title"), ("Doimiy yashash manzili", "address"),
+]
+
+def render_resume_pdf_native(ctx: dict, img_bytes: Optional[bytes] = None) -> bytes:
+    f = register_fonts()
+    base = ParagraphStyle("base", fontName=f["regular"], fontSize=11, leading=14)
+    title = ParagraphStyle("title", parent=base, fontName=f["bold"], fontSize=16, leading=20, alignment=TA_CENTER)
+    name = ParagraphStyle("name", parent=base, fontName=f["bold"], fontSize=12, alignment=TA_CENTER, spaceAfter=8)
+    h2 = ParagraphStyle("h2", parent=base, fontName=f["bold"], fontSize=12, alignment=TA_CENTER, spaceBefore=10, spaceAfter=6)
+    cell = ParagraphStyle("cell", parent=base, fontSize=9, leading=11)
+    cell_b = ParagraphStyle("cell_b", parent=cell, fontName=f["bold"])
+
+    def para(txt, st=base) -> Paragraph:
+        return Paragraph(xml_escape(str(txt or "")).replace("\n", "<br/>"), st)
+
+    def field(label: str, key: str) -> Paragraph:
+        return Paragraph(f'<font name="{f["bold"]}">{xml_escape(label)}:</font> {xml_escape(str(ctx.get(key) or ""))}', base)
+
+    story = [para("MA’LUMOTNOMA", title), para(ctx.get("full_name"), name)]
+    fields = [field(lbl, key) for lbl, key in RESUME_FIELDS]
+    photo = None
+    if img_bytes:
+        try: photo = RLImage(io.BytesIO(img_bytes), width=35*mm, height=45*mm, kind="proportional")
+        except Exception: photo = None
+    if photo is not None:
+        # birinchi ikki qator (lavozim) yonida foto
+        head = Table([[fields[:2], photo]], colWidths=[None, 40*mm])
+        head.setStyle(TableStyle([("VALIGN", (0,0), (-1,-1), "TOP"), ("ALIGN", (1,0), (1,0), "RIGHT"),
+                                  ("LEFTPADDING", (0,0), (-1,-1), 0), ("RIGHTPADDING", (0,0), (-1,-1), 0)]))
+        story.append(head); story += fields[2:]
+    else:
+        story += fields
+
+    story += [para("MEHNAT FAOLIYATI", h2), para(ctx.get("work_experience"))]
+    story.append(para("Yaqin qarindoshlar haqida ma'lumot", h2))
+    rows = [[para(lbl, cell_b) for lbl, _ in RELATIVE_COLS]]
+    for r in ctx.get("relatives") or []:
+        if isinstance(r, dict): rows.append([para(r.get(key), cell) for _, key in RELATIVE_COLS])
+    rel = Table(rows, repeatRows=1, colWidths=[25*mm, 38*mm, 35*mm, 40*mm, 32*mm])
+    rel.setStyle(TableStyle([("GRID", (0,0), (-1,-1), 0.5, colors.black), ("VALIGN", (0,0), (-1,-1), "TOP")]))
+    story += [rel, Spacer(1, 8), Paragraph(f'<font name="{f["bold"]}">Tel:</font> {xml_escape(str(ctx.get("phone") or ""))}', base)]
+
+    buf = io.BytesIO()
+    SimpleDocTemplate(buf, pagesize=A4, leftMargin=20*mm, rightMargin=20*mm, topMargin=20*mm, bottomMargin=20*mm,
+                      title=str(ctx.get("full_name") or "Ma’lumotnoma")).build(story)
+    return buf.getvalue()
+
+async def render_resume_pdf(ctx: dict, img_bytes: Optional[bytes], docx_bytes: bytes) -> Optional[bytes]:
+    if RESUME_PDF_ENGINE == "native":
+        try: return await CPU_POOL.run(render_resume_pdf_native, ctx, img_bytes)
+        except Exception: traceback.print_exc()   # LibreOffice'ga qaytamiz
+    return await IO_POOL.run(convert_docx_bytes_to_pdf_bytes, docx_bytes)
+
+RESUME_SAMPLE = {
+    "full_name": "Aliyev Vali G‘anievich", "phone": "+998 90 123 45 67", "birth_date": "12.03.1985",
+    "birth_place": "Toshkent shahri", "nationality": "O‘zbek", "party_membership": "Yo‘q",
+    "education": "Oliy", "university": "2007 y. Toshkent davlat iqtisodiyot universiteti",
+    "specialization": "Moliya", "ilmiy_daraja": "Yo‘q", "ilmiy_unvon": "Yo‘q", "languages": "Rus, ingliz",
+    "dav_mukofoti": "Yo‘q", "deputat": "Yo‘q", "adresss": "Toshkent sh., Yunusobod tumani",
+    "current_position_date": "2019 yil 1 fevraldan", "current_position_full": "Moliya bo‘limi boshlig‘i",
+    "work_experience": "2007-2012 yy. — iqtisodchi\n2012-2019 yy. — bosh mutaxassis",
+    "relatives": [
+        {"relation_type": "Otasi", "full_name": "Aliyev G‘ani", "b_year_place": "1955, Toshkent",
+         "job_title": "Nafaqada", "address": "Toshkent sh."},
+        {"relation_type": "Onasi", "full_name": "Aliyeva Zuhra", "b_year_place": "1958, Samarqand",
+         "job_title": "Nafaqada", "address": "Toshkent sh."},
+    ],
+}
+
+def _norm_text(t: str) -> str:
+    t = re.sub(r"[‘’ʻʼ`´]", "'", t or "")
+    return re.sub(r"\s+", " ", t).strip().lower()
+
+def resume_fidelity(ctx: dict, img_bytes: Optional[bytes] = None) -> dict:
+    """Native PDF va DOCX→LibreOffice PDF'ni solishtiradi: sahifalar soni va har bir qiymat
+    ikkala PDF matnida borligi. native faqat soffice'da ham topilgan qiymatlarni yo‘qotmasa — ok."""
+    docx_bytes = render_resume_docx(ctx, img_bytes)["docx"]
+    pdfs = {"native": render_resume_pdf_native(ctx, img_bytes), "soffice": convert_docx_bytes_to_pdf_bytes(docx_bytes)}
+    values = [str(ctx.get(key)) for _, key in RESUME_FIELDS + [("", "full_name"), ("", "phone"), ("", "work_experience")] if ctx.get(key)]
+    for r in ctx.get("relatives") or []:
+        values += [str(r.get(key)) for _, key in RELATIVE_COLS if isinstance(r, dict) and r.get(key)]
+    report = {"fields": len(values), "pages": {}, "missing": {}}
+    for engine, pdf in pdfs.items():
+        if not pdf: report["missing"][engine] = None; continue
+        rd = PdfReader(io.BytesIO(pdf))
+        text = _norm_text(" ".join(pg.extract_text() or "" for pg in rd.pages))
+        report["pages"][engine] = len(rd.pages)
+        report["missing"][engine] = [v for v in values if _norm_text(v) not in text]
+    lo_missing = report["missing"].get("soffice")
+    report["ok"] = lo_missing is not None and set(report["missing"]["native"]) <= set(lo_missing) \
+        and report["pages"]["native"] <= report["pages"]["soffice"] + 1
+    return report
+
+def percentile(values, q: float) -> float:
+    vals = sorted(values)
+    if not vals: return 0.0
+    return vals[min(len(vals) - 1, int(round(q / 100 * (len(vals) - 1))))]
+
 def convert_docx_bytes_to_pdf_bytes(docx_bytes: bytes) -> Optional[bytes]:
     with tempfile.TemporaryDirectory() as td:
         docx_path = os.path.join(td, "file.docx")
         pdf_path = os.path.join(td, "file.pdf")
         save_bytes(docx_path, docx_bytes)
         try:
-            subprocess.run(["soffice", "--headless", "--convert-to", "pdf", "--outdir", td, docx_path], check=True)
+            soffice_convert_to_pdf(docx_path, td)
             with open(pdf_path,"rb") as f: return f.read()
         except Exception:
             traceback.print_exc(); return None
@@ -344,7 +2462,6 @@ async def send_resume_data(
     if not os.path.exists(tpl_path):
         return JSONResponse({"status": "error", "error": "resume.docx topilmadi"}, status_code=200)
 
-    doc = DocxTemplate(tpl_path)
     ctx = {
         "full_name": full_name, "phone": phone, "birth_date": birth_date, "birth_place": birth_place,
         "nationality": nationality, "party_membership": party_membership, "education": education,
@@ -354,40 +2471,445 @@ async def send_resume_data(
         "current_position_full": current_position_full, "work_experience": work_experience, "relatives": rels,
     }
 
-    inline_img = None; img_bytes = None
+    img_bytes = None
     if photo and photo.filename:
-        try:
-            img_bytes = await photo.read()
-            inline_img = InlineImage(doc, io.BytesIO(img_bytes), width=Mm(35))
-        except Exception: inline_img = None
-    ctx["photo"] = inline_img
+        try: img_bytes = await photo.read()
+        except Exception: img_bytes = None
 
-    buf = io.BytesIO(); doc.render(ctx); doc.save(buf); docx_bytes = buf.getvalue()
-    pdf_bytes = convert_docx_bytes_to_pdf_bytes(docx_bytes)
+    if JOB_QUEUE is not None:
+        photo_path = None
+        if img_bytes: photo_path = save_bytes(os.path.join(WORKDIR, "jobs", f"{uuid.uuid4().hex}.img"), img_bytes)
+        job_id = JOB_QUEUE.enqueue("resume", {"ctx": ctx, "tg_id": tg_id, "photo_path": photo_path})
+        return {"status":"success", "queued": True, "job_id": job_id}
 
+    uid = int(tg_id) if tg_id.lstrip("-").isdigit() else None   # tg_id'siz formalar bir-birini kutmaydi
+    try:
+        async with ADMISSION.slot(uid, "resume", queue_notifier(uid) if uid else None):
+            info = await process_resume(ctx, tg_id, img_bytes)
+    except AdmissionRejected as e:
+        return JSONResponse({"status": "busy", "error": str(e)}, status_code=503)
+    return {"status":"success", **info}
+
+async def process_resume(ctx: dict, tg_id: str, img_bytes: Optional[bytes]) -> dict:
+    """DOCX/PDF render + guruh va foydalanuvchiga yuborish (web yoki worker process'da)."""
+    with stage("resume_docx"):
+        rendered = await CPU_POOL.run(render_resume_docx, ctx, img_bytes)
+    docx_bytes = rendered["docx"]; RESUME_RENDER_MS.append(rendered["render_ms"])
+    with stage("resume_pdf", engine=RESUME_PDF_ENGINE):
+        pdf_bytes = await render_resume_pdf(ctx, img_bytes, docx_bytes)
+    observe_bytes("resume", "out", len(docx_bytes) + len(pdf_bytes or b""))
+
+    full_name = ctx.get("full_name", "")
     base = "_".join((full_name or "user").split()) or "user"
     docx_name = f"{base}_0.docx"; pdf_name = f"{base}_0.pdf"
 
     try:
-        payload = {k:v for k,v in ctx.items() if k!="photo"}; payload["timestamp"] = datetime.utcnow().isoformat()+"Z"
+        payload = dict(ctx); payload["timestamp"] = datetime.utcnow().isoformat()+"Z"
         json_bytes = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
-        await bot.send_document(GROUP_CHAT_ID, BufferedInputFile(json_bytes, filename=f"{base}.json"),
-                                caption=f"📄 Ma'lumotlar JSON: {full_name or '—'}")
-        if img_bytes:
-            await bot.send_document(GROUP_CHAT_ID, BufferedInputFile(img_bytes, filename=f"{base}.jpg"),
-                                    caption=f"🖼 Foto: {full_name or '—'}")
-    except Exception: traceback.print_exc()
+    except Exception:
+        traceback.print_exc(); json_bytes = b"{}"
+    group = [(BufferedInputFile(json_bytes, filename=f"{base}.json"), f"📄 Ma'lumotlar JSON: {full_name or '—'}")]
+    if img_bytes: group.append((BufferedInputFile(img_bytes, filename=f"{base}.jpg"), f"🖼 Foto: {full_name or '—'}"))
+    user = [(BufferedInputFile(docx_bytes, filename=docx_name), "✅ Word format")]
+    if pdf_bytes: user.append((BufferedInputFile(pdf_bytes, filename=pdf_name), "✅ PDF format"))
+
+    # guruh va foydalanuvchi — bir-biriga bog‘liq emas, parallel; har biri bitta albom
+    sends = [send_documents(GROUP_CHAT_ID, [d for d, _ in group], [c for _, c in group])]
+    if tg_id:
+        try: sends.append(send_documents(int(tg_id), [d for d, _ in user], [c for _, c in user]))
+        except ValueError: traceback.print_exc()
+    for r in await asyncio.gather(*sends, return_exceptions=True):
+        if isinstance(r, Exception): traceback.print_exception(type(r), r, r.__traceback__)
+
+    STATE.counter_inc("resume")
+    return {"render_ms": round(rendered["render_ms"], 1), "template_cached": rendered["template_hit"]}
 
+# =========================
+# RESUME BULK (ko‘p obyektivka: JSONL + fotolar → DOCX/PDF, bitta soffice chaqiruvi)
+# =========================
+RESUME_BULK_KEY = os.getenv("RESUME_BULK_KEY", "")   # bo‘sh — endpoint o‘chiq (admin kaliti ishlatilmaydi)
+RESUME_BULK_MAX = int(os.getenv("RESUME_BULK_MAX", "200"))            # bitta so‘rovdagi yozuvlar
+RESUME_BULK_DIR = os.path.join(WORKDIR, "bulk")
+RESUME_BULK_TTL = float(os.getenv("RESUME_BULK_TTL_HOURS", "24")) * 3600
+TG_UPLOAD_MAX = 50 * 1024 * 1024                                      # Bot API sendDocument chegarasi
+RESUME_BULK_CHUNK = int(os.getenv("RESUME_BULK_CHUNK", "10"))         # admission: shuncha yozuv = bitta "resume" narxi
+
+RESUME_DEFAULTS = {
+    "full_name": "", "phone": "", "birth_date": "", "birth_place": "", "nationality": "O‘zbek",
+    "party_membership": "Yo‘q", "education": "", "university": "", "specialization": "Yo‘q",
+    "ilmiy_daraja": "Yo‘q", "ilmiy_unvon": "Yo‘q", "languages": "Yo‘q", "dav_mukofoti": "Yo‘q",
+    "deputat": "Yo‘q", "adresss": "", "current_position_date": "", "current_position_full": "",
+    "work_experience": "", "relatives": [],
+}   # /send_resume_data formasidagi default'lar bilan bir xil
+
+def resume_ctx(rec: dict) -> dict:
+    ctx = {k: rec.get(k, v) for k, v in RESUME_DEFAULTS.items()}
+    if isinstance(ctx["relatives"], str):
+        try: ctx["relatives"] = json.loads(ctx["relatives"] or "[]")
+        except Exception: ctx["relatives"] = []
+    return {k: (v if k == "relatives" else str(v or "")) for k, v in ctx.items()}
+
+def parse_bulk_records(raw: bytes) -> List[dict]:
+    """JSONL: har qator bitta obyekt (forma maydonlari + ixtiyoriy "photo": yuklangan fayl nomi).
+    [{"i", "ctx", "photo", "error"}] — buzilgan qator butun partiyani to‘xtatmaydi."""
+    out = []
+    for n, line in enumerate(raw.decode("utf-8-sig", "replace").splitlines(), 1):
+        if not line.strip(): continue
+        rec = {"i": len(out) + 1, "line": n, "ctx": None, "photo": None, "error": ""}
+        try:
+            d = json.loads(line)
+            if not isinstance(d, dict): raise ValueError("obyekt kutilgan")
+            rec["ctx"] = resume_ctx(d); rec["photo"] = d.get("photo") or None
+        except Exception as e:
+            rec["error"] = f"{n}-qator: {e}"
+        out.append(rec)
+    return out
+
+def render_resume_batch(items: List[dict], out_dir: str, native_pdf: bool = False) -> List[dict]:
+    """CPU_POOL child'ida: shablon bir marta (TemplateCache) — har yozuv faqat render + save.
+    items: [{"i", "base", "ctx", "photo_path"}] -> [{"i", "docx", "pdf", "render_ms", "error"}]"""
+    out = []
+    for it in items:
+        r = {"i": it["i"], "docx": "", "pdf": "", "render_ms": 0.0, "error": ""}
+        try:
+            img = None
+            if it.get("photo_path"):
+                with open(it["photo_path"], "rb") as f: img = f.read()
+            rendered = render_resume_docx(it["ctx"], img)
+            r["render_ms"] = rendered["render_ms"]
+            r["docx"] = save_bytes(os.path.join(out_dir, f"{it['base']}.docx"), rendered["docx"])
+            if native_pdf:
+                try: r["pdf"] = save_bytes(os.path.join(out_dir, "pdf", f"{it['base']}.pdf"), render_resume_pdf_native(it["ctx"], img))
+                except Exception: traceback.print_exc()   # soffice bilan qilinadi
+        except Exception as e:
+            r["error"] = f"render: {e}"
+        out.append(r)
+    return out
+
+def convert_resume_batch(docx_paths: List[str], pdf_dir: str) -> Dict[str, str]:
+    """Hammasi bitta LO_POOL.convert chaqiruvida (bitta soffice, hujjatlar ketma-ket).
+    Partiya yiqilsa — fayllar bittalab qayta urinadi, buzilgani aniqlanadi. {docx: xato yoki ""}"""
     try:
-        if tg_id:
-            cid = int(tg_id)
-            await bot.send_document(cid, BufferedInputFile(docx_bytes, filename=docx_name), caption="✅ Word format")
-            if pdf_bytes:
-                await bot.send_document(cid, BufferedInputFile(pdf_bytes, filename=pdf_name), caption="✅ PDF format")
-    except Exception: traceback.print_exc()
+        LO_POOL.convert(docx_paths, pdf_dir)
+        return {p: "" for p in docx_paths}
+    except Exception:
+        traceback.print_exc()
+    errors = {}
+    for p in docx_paths:
+        out = os.path.join(pdf_dir, os.path.splitext(os.path.basename(p))[0] + ".pdf")
+        if os.path.exists(out): errors[p] = ""; continue
+        try: LO_POOL.convert([p], pdf_dir); errors[p] = ""
+        except Exception as e: errors[p] = f"pdf: {e}"
+    return errors
+
+def _chunks(seq: list, n: int) -> List[list]:
+    n = max(1, min(n, len(seq)))
+    k = math.ceil(len(seq) / n)
+    return [seq[i:i + k] for i in range(0, len(seq), k)]
+
+class ResumeBulk:
+    """Partiya: RESUME_BULK_DIR/<id>/ — status.json (har yozuv holati), docx/, docx/pdf/, photos/, result.zip.
+    Holat diskda — boshqa uvicorn worker ham /resume/bulk/<id> ga javob bera oladi."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.stats = {"batches": 0, "records": 0, "failed": 0}
+        self.running: Dict[str, asyncio.Task] = {}
+
+    def path(self, bid: str, *parts) -> str:
+        return os.path.join(self.root, bid, *parts)
+
+    def load(self, bid: str) -> Optional[dict]:
+        if not re.fullmatch(r"[0-9a-f]{12}", bid or ""): return None
+        try:
+            with open(self.path(bid, "status.json"), encoding="utf-8") as f: return json.load(f)
+        except (OSError, ValueError): return None
+
+    def save(self, st: dict) -> None:
+        st["updated"] = datetime.utcnow().isoformat() + "Z"
+        st["done"] = sum(r["status"] == "done" for r in st["records"])
+        st["failed"] = sum(r["status"] == "failed" for r in st["records"])
+        tmp = self.path(st["id"], f".status.{uuid.uuid4().hex[:6]}")
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(st, f, ensure_ascii=False)
+        os.replace(tmp, self.path(st["id"], "status.json"))
+
+    def sweep(self) -> None:
+        cutoff = time.time() - RESUME_BULK_TTL
+        for name in (os.listdir(self.root) if os.path.isdir(self.root) else []):
+            d = os.path.join(self.root, name)
+            if name not in self.running and os.path.getmtime(d) < cutoff: shutil.rmtree(d, ignore_errors=True)
+
+    def create(self, recs: List[dict], photos: Dict[str, bytes], delivery: str, chat_id: int) -> dict:
+        self.sweep()
+        bid = uuid.uuid4().hex[:12]
+        ensure_dir(self.path(bid, "docx", "pdf"))
+        saved = {name: save_bytes(self.path(bid, "photos", safe_name(name)), data) for name, data in photos.items()}
+        records, used = [], set()
+        for r in recs:
+            row = {"i": r["i"], "name": "", "base": "", "photo_path": None, "status": "queued", "error": r["error"], "files": []}
+            if r["ctx"] is not None:
+                base = f"{r['i']:03d}_" + "_".join((r["ctx"].get("full_name") or "user").split())
+                row.update(name=r["ctx"].get("full_name", ""), base=safe_name(base), ctx=r["ctx"])
+                if r["photo"]:
+                    row["photo_path"] = saved.get(r["photo"])
+                    if row["photo_path"] is None: row["warning"] = f"foto topilmadi: {r['photo']}"
+                    used.add(r["photo"])
+            if row["error"]: row["status"] = "failed"
+            records.append(row)
+        st = {"id": bid, "token": secrets.token_urlsafe(16), "status": "queued",
+              "created": datetime.utcnow().isoformat() + "Z", "delivery": delivery,
+              "chat_id": chat_id, "total": len(records), "records": records, "error": "",
+              "unused_photos": sorted(set(photos) - used)}
+        self.save(st)
+        self.stats["batches"] += 1; self.stats["records"] += len(records)
+        return st
+
+    def start(self, st: dict) -> None:
+        """JOB_QUEUE bo‘lsa — worker'ga (web tier soffice ko‘tarmaydi), bo‘lmasa shu process'da fonda."""
+        if JOB_QUEUE is not None:
+            JOB_QUEUE.enqueue("resume_bulk", {"id": st["id"], "uid": st["chat_id"] or None}); return
+        task = asyncio.create_task(self.run(st))
+        self.running[st["id"]] = task
+        task.add_done_callback(lambda _t, bid=st["id"]: self.running.pop(bid, None))
+
+    async def run(self, st: dict, admit: bool = True) -> None:
+        """admit=False — app/worker.py: u yerda parallellikni WORKER_CONCURRENCY cheklaydi."""
+        chat_id = st["chat_id"]
+        for r in st["records"]:   # worker qayta olgan ish: yarim qolgan yozuvlar boshidan
+            if r["status"] == "rendered": r.update(status="queued", files=[])
+        try:
+            if admit:   # partiyaning o‘z kaliti — foydalanuvchi va shaxssiz formalarni band qilmaydi
+                units = math.ceil(sum(r["status"] == "queued" for r in st["records"]) / RESUME_BULK_CHUNK)
+                async with ADMISSION.slot(("bulk", st["id"]), "resume_bulk", queue_notifier(chat_id) if chat_id else None, units):
+                    with stage("resume_bulk"): await self._build(st)
+            else:
+                with stage("resume_bulk"): await self._build(st)
+            st["status"] = "done"
+        except AdmissionRejected as e:
+            st["status"] = "failed"; st["error"] = str(e)
+        except Exception as e:
+            traceback.print_exc(); st["status"] = "failed"; st["error"] = str(e)
+        if st["status"] == "failed":
+            for r in st["records"]:
+                if r["status"] not in ("done", "failed"): r.update(status="failed", error=r["error"] or "partiya to‘xtadi")
+        self.stats["failed"] += sum(r["status"] == "failed" for r in st["records"])
+        self.save(st)
+        if st["status"] == "done" and st["delivery"] == "telegram": await self._deliver(st)
+
+    async def _build(self, st: dict) -> None:
+        bid = st["id"]; docx_dir = self.path(bid, "docx"); pdf_dir = os.path.join(docx_dir, "pdf")
+        live = {r["i"]: r for r in st["records"] if r["status"] == "queued"}
+
+        # 1) DOCX: CPU_POOL child'lari orasida bo‘lingan partiyalar
+        st["status"] = "rendering"; self.save(st)
+        items = [{"i": r["i"], "base": r["base"], "ctx": r["ctx"], "photo_path": r["photo_path"]} for r in live.values()]
+        native = RESUME_PDF_ENGINE == "native"
+        async def render(part: List[dict]) -> None:
+            for res in await CPU_POOL.run(render_resume_batch, part, docx_dir, native):
+                r = live[res["i"]]
+                if res["error"]: r.update(status="failed", error=res["error"]); continue
+                RESUME_RENDER_MS.append(res["render_ms"])
+                r["status"] = "rendered"; r["files"] = [os.path.basename(res["docx"])]
+                if res["pdf"]: r["status"] = "done"; r["files"].append(f"pdf/{os.path.basename(res['pdf'])}")
+            self.save(st)
+        if items: await asyncio.gather(*(render(part) for part in _chunks(items, CPU_POOL.workers)))
+
+        # 2) PDF: har soffice worker'ga bitta convert chaqiruvi (ishga tushish narxi partiyaga bir marta)
+        todo = [r for r in live.values() if r["status"] == "rendered"]
+        if todo:
+            st["status"] = "converting"; self.save(st)
+            async def convert(part: List[dict]) -> None:
+                errors = await IO_POOL.run(convert_resume_batch, [os.path.join(docx_dir, r["files"][0]) for r in part], pdf_dir)
+                for r in part:
+                    err = errors.get(os.path.join(docx_dir, r["files"][0]), "")
+                    if err: r.update(status="failed", error=err)
+                    else: r["status"] = "done"; r["files"].append(f"pdf/{r['base']}.pdf")
+                self.save(st)
+            with stage("resume_bulk_pdf"):
+                await asyncio.gather(*(convert(part) for part in _chunks(todo, LO_POOL.size)))
+
+        # 3) ZIP: docx/ va pdf/ + report.json (tayyor PDF/DOCX qayta siqilmaydi)
+        st["status"] = "packing"; self.save(st)
+        await IO_POOL.run(self._pack, st)
+        STATE.counter_inc("resume", st["done"])
+
+    def report(self, st: dict) -> dict:
+        rows = [{k: r.get(k) for k in ("i", "name", "status", "error", "warning", "files") if r.get(k) not in (None, "")}
+                for r in st["records"]]
+        return {"id": st["id"], "total": st["total"], "done": st["done"], "failed": st["failed"],
+                "unused_photos": st["unused_photos"], "records": rows}
+
+    def _pack(self, st: dict) -> None:
+        docx_dir = self.path(st["id"], "docx")
+        tmp = self.path(st["id"], ".result.zip")
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as z:
+            for r in st["records"]:
+                if r["status"] != "done": continue
+                for rel in r["files"]: z.write(os.path.join(docx_dir, rel), rel)
+            z.writestr("report.json", json.dumps(self.report({**st, "done": sum(r["status"] == "done" for r in st["records"]),
+                                                              "failed": sum(r["status"] == "failed" for r in st["records"])}),
+                                                 ensure_ascii=False, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+        os.replace(tmp, self.path(st["id"], "result.zip"))
+
+    async def _deliver(self, st: dict) -> None:
+        zip_path = self.path(st["id"], "result.zip")
+        caption = f"📦 Obyektivkalar: {st['done']}/{st['total']} tayyor" + (f", {st['failed']} xato" if st["failed"] else "")
+        try:
+            if os.path.getsize(zip_path) <= TG_UPLOAD_MAX:
+                await send_document(st["chat_id"], zip_path, caption=caption)
+            else:
+                link = f"{APP_BASE.rstrip('/')}/resume/bulk/{st['id']}/zip?token={st['token']}" if APP_BASE else st["id"]
+                await send_message(st["chat_id"], f"{caption}\nZIP Telegram chegarasidan katta — yuklab olish: {link}")
+        except Exception:
+            traceback.print_exc()
 
-    COUNTERS["resume"] += 1
-    return {"status":"success"}
+RESUME_BULK = ResumeBulk(RESUME_BULK_DIR)
+
+@app.post("/resume/bulk")
+async def resume_bulk_submit(
+    key: str = Form(""), records: UploadFile = File(...), photos: Optional[List[UploadFile]] = File(None),
+    delivery: str = Form("zip"), tg_id: str = Form(""),
+):
+    """records: JSONL fayl; photos: fotolar (yozuvdagi "photo" = fayl nomi); delivery: zip | telegram (tg_id'ga ZIP)."""
+    if not RESUME_BULK_KEY or not hmac.compare_digest(key.encode(), RESUME_BULK_KEY.encode()):
+        return JSONResponse({"status": "error", "error": "forbidden"}, status_code=403)
+    if delivery not in ("zip", "telegram"): return JSONResponse({"status": "error", "error": "delivery: zip | telegram"}, status_code=400)
+    chat_id = int(tg_id) if tg_id.lstrip("-").isdigit() else 0
+    if delivery == "telegram" and not chat_id:
+        return JSONResponse({"status": "error", "error": "telegram uchun tg_id kerak"}, status_code=400)
+    if not os.path.exists(os.path.join(TEMPLATES_DIR, "resume.docx")):
+        return JSONResponse({"status": "error", "error": "resume.docx topilmadi"}, status_code=200)
+
+    recs = parse_bulk_records(await records.read())
+    if not recs: return JSONResponse({"status": "error", "error": "yozuvlar yo‘q"}, status_code=400)
+    if len(recs) > RESUME_BULK_MAX:
+        return JSONResponse({"status": "error", "error": f"ko‘pi bilan {RESUME_BULK_MAX} ta yozuv"}, status_code=413)
+    imgs = {}
+    for ph in photos or []:
+        if ph and ph.filename: imgs[ph.filename] = await ph.read()
+
+    st = await IO_POOL.run(RESUME_BULK.create, recs, imgs, delivery, chat_id)
+    RESUME_BULK.start(st)
+    q = f"?token={st['token']}"
+    return JSONResponse({"status": "accepted", "batch_id": st["id"], "total": st["total"], "token": st["token"],
+                         "status_url": f"/resume/bulk/{st['id']}{q}", "zip_url": f"/resume/bulk/{st['id']}/zip{q}"},
+                        status_code=202)
+
+@app.get("/resume/bulk/{bid}")
+def resume_bulk_status(bid: str, token: str = ""):
+    st = RESUME_BULK.load(bid)
+    if not st or not hmac.compare_digest(token.encode(), st.get("token", "").encode()):
+        return JSONResponse({"status": "error", "error": "topilmadi"}, status_code=404)
+    return {"status": st["status"], "error": st["error"], "created": st["created"], "updated": st["updated"],
+            **RESUME_BULK.report(st)}
+
+@app.get("/resume/bulk/{bid}/zip")
+def resume_bulk_zip(bid: str, token: str = ""):
+    st = RESUME_BULK.load(bid)
+    if not st or not hmac.compare_digest(token.encode(), st.get("token", "").encode()):
+        return JSONResponse({"status": "error", "error": "topilmadi"}, status_code=404)
+    if st["status"] != "done": return JSONResponse({"status": st["status"], "done": st["done"], "total": st["total"]}, status_code=409)
+    return FileResponse(RESUME_BULK.path(bid, "result.zip"), media_type="application/zip", filename=f"obyektivka_{bid}.zip")
+
+# =========================
+# PREFETCH (fayl kelishi bilan fonda tayyorlash)
+# =========================
+# JOB_BACKEND=sqlite: og‘ir ishlar worker'larda — web tier soffice/OCR qilmaydi, uning papkalari worker'ga ko‘rinmaydi
+PREFETCH = os.getenv("PREFETCH", "1") == "1" and JOB_QUEUE is None
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))   # bir vaqtdagi fon ishlari (process bo‘yicha)
+PREFETCH_WAIT = float(os.getenv("PREFETCH_WAIT", "120"))             # finalize boshlanayotgan ishlarni shuncha kutadi
+
+def _atomic_dir(src: str) -> tuple:
+    final = prefetch_dir(src); tmp = f"{final}.tmp-{uuid.uuid4().hex[:8]}"
+    ensure_dir(tmp)
+    return final, tmp
+
+def _publish(tmp: str, final: str) -> None:
+    try: os.rename(tmp, final)
+    except OSError: shutil.rmtree(tmp, ignore_errors=True)   # boshqasi ulgurgan
+
+def prefetch_pdf(src: str) -> str:
+    final, tmp = _atomic_dir(src)
+    soffice_convert_to_pdf(src, tmp); _publish(tmp, final)
+    return final
+
+def prefetch_text(src: str) -> str:
+    final, tmp = _atomic_dir(src)
+    with open(os.path.join(tmp, "text.json"), "w", encoding="utf-8") as f:
+        json.dump(extract_text_item(src), f, ensure_ascii=False)
+    _publish(tmp, final)
+    return final
+
+def prefetch_parse(src: str) -> int:
+    rd = PdfReader(src)
+    if rd.is_encrypted: raise ValueError("parol bilan himoyalangan")
+    return len(rd.pages)
+
+def prefetch_plan(s: dict) -> List[tuple]:
+    """Sessiya holatiga qarab: [(fayl, tur)]. Tur: pdf | text | parse."""
+    op, files = s["op"], s["files"]
+    if op == "convert" and (s.get("target") or "") == "pdf":
+        return [(f, "pdf") for f in files if os.path.splitext(f)[1].lower() not in IMG_EXTS and not f.lower().endswith(".pdf")]
+    if op in ("ocr", "translate"):
+        exts = IMG_EXTS + [".pdf"] if op == "translate" else None
+        return [(f, "text") for f in files if exts is None or os.path.splitext(f)[1].lower() in exts]
+    if op == "merge":
+        return [(f, "parse") for f in files if f.lower().endswith(".pdf")]
+    return []
+
+class Prefetcher:
+    """Sessiya (sid) bo‘yicha fon vazifalari. Natijalar sessiya papkasida (.pre/) — worker process ham ko‘radi.
+    Bekor qilinsa navbatdagilar boshlanmaydi; executor ichida ketayotgani tugaydi, natijasi papka bilan o‘chadi."""
+
+    RUNNERS = {"pdf": (prefetch_pdf, "io"), "text": (prefetch_text, "io"), "parse": (prefetch_parse, "io")}
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.sem: Optional[asyncio.Semaphore] = None
+        self.tasks: Dict[str, Dict[tuple, asyncio.Task]] = {}
+        self.stats = {"started": 0, "done": 0, "failed": 0, "cancelled": 0, "skipped_busy": 0}
+
+    def schedule(self, uid: int, s: Optional[dict]) -> None:
+        if not PREFETCH or not s or not s.get("sid"): return
+        if self.sem is None: self.sem = asyncio.Semaphore(self.concurrency)
+        mine = self.tasks.setdefault(s["sid"], {})
+        for path, kind in prefetch_plan(s):
+            if (path, kind) in mine or (kind != "parse" and prefetched(path, kind)): continue
+            if ADMISSION.waiting:   # server band — asosiy ishlarga joy qoldiramiz
+                self.stats["skipped_busy"] += 1; continue
+            mine[(path, kind)] = asyncio.create_task(self._run(uid, path, kind))
+            self.stats["started"] += 1
+
+    async def _run(self, uid: int, path: str, kind: str):
+        fn, pool = self.RUNNERS[kind]
+        try:
+            async with self.sem:
+                with stage(f"prefetch_{kind}"):
+                    res = await (IO_POOL if pool == "io" else CPU_POOL).run(fn, path)
+            self.stats["done"] += 1
+            return res
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1; raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            if kind == "parse":   # merge: buzilgan PDF haqida darhol aytamiz
+                try: await send_message(uid, f"⚠️ {os.path.basename(path)}: PDF o‘qilmadi ({e}). Boshqa fayl yuboring.")
+                except Exception: traceback.print_exc()
+            else: traceback.print_exc()
+
+    async def settle(self, sid: Optional[str], timeout: float = PREFETCH_WAIT) -> None:
+        """finalize'dan oldin: boshlangan ishlar tugashini kutadi (takroran bajarmaslik uchun)."""
+        tasks = list(self.tasks.pop(sid, {}).values()) if sid else []
+        if not tasks: return
+        t0 = time.perf_counter()
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for t in pending: t.cancel()
+        METRICS.observe("ofm_prefetch_settle_seconds", time.perf_counter() - t0)
+
+    def cancel(self, sid: Optional[str]) -> None:
+        for t in (self.tasks.pop(sid, {}) if sid else {}).values(): t.cancel()
+
+PREFETCHER = Prefetcher(PREFETCH_CONCURRENCY)
 
 # =========================
 # BOT COMMANDS / COMMON
@@ -404,12 +2926,46 @@ async def set_bot_commands():
         BotCommand(command="pagenum", description="Sahifa raqamlash"),
         BotCommand(command="watermark", description="Watermark"),
         BotCommand(command="translate", description="Tarjima"),
+        BotCommand(command="last", description="Oxirgi faylni sessiyaga qo‘shish"),
     ])
 
 def session_start(uid: int, op: str, seed: Optional[dict]=None):
-    PENDING[uid] = {"op": op, "files": [], "params": seed or {}, "target": seed.get("target","") if seed else ""}
-
-def session_clear(uid: int): PENDING.pop(uid, None)
+    old = STATE.session_get(uid)
+    if old: PREFETCHER.cancel(old.get("sid")); STORAGE.release(old.get("dir"))
+    sid = uuid.uuid4().hex[:12]
+    STATE.session_put(uid, {"op": op, "files": [], "params": seed or {}, "target": seed.get("target","") if seed else "",
+                            "sid": sid, "dir": STORAGE.session_dir(uid, sid)})
+
+def session_clear(uid: int, keep_files: bool = False):
+    s = STATE.session_get(uid)
+    STATE.session_del(uid)
+    if s: PREFETCHER.cancel(s.get("sid"))
+    if s and not keep_files: STORAGE.release(s.get("dir"))
+
+def session_get(uid: int) -> Optional[dict]: return STATE.session_get(uid)
+
+def session_add_file(uid: int, path: str) -> Optional[dict]:
+    def add(s: dict):
+        if path not in s["files"]: s["files"].append(path)
+    return STATE.session_update(uid, add)
+
+def session_set(uid: int, key: str, value, param: bool = False) -> Optional[dict]:
+    def put(s: dict):
+        if param: s["params"][key] = value
+        else: s[key] = value
+    return STATE.session_update(uid, put)
+
+async def session_begin(m: Message, op: str, seed: Optional[dict]=None):
+    # sessionsiz yuborilgan fayl bo‘lsa — yangi sessionga o‘zi qo‘shiladi
+    uid = m.from_user.id
+    session_start(uid, op, seed)
+    lf = STATE.last_file_get(uid)
+    if lf and lf.get("orphan"):
+        STATE.last_file_put(uid, {**lf, "orphan": False})
+        local = reuse_last_file(uid)
+        if local:
+            PREFETCHER.schedule(uid, session_add_file(uid, local))
+            await m.answer(f"📎 Oxirgi fayl qo‘shildi: {os.path.basename(local)}")
 
 def session_status_text(s: dict) -> str:
     parts = [f"🧰 Jarayon: {s['op']}", f"📁 Fayllar: {len(s['files'])}"]
@@ -418,16 +2974,16 @@ def session_status_text(s: dict) -> str:
     return "\n".join(parts)
 
 def is_paused(uid: int) -> bool:
-    return PAUSED and uid not in ADMINS
+    return STATE.flag_get("paused") and uid not in ADMINS
 
 # =========================
 # HANDLERS
 # =========================
 @dp.message(Command("start"))
 async def cmd_start(m: Message):
-    ACTIVE_USERS.add(m.from_user.id)
+    STATE.user_add(m.from_user.id)
     await m.answer(
-        f"👥 {len(ACTIVE_USERS)}- nafar faol foydalanuvchi\n\n"
+        f"👥 {STATE.user_count()}- nafar faol foydalanuvchi\n\n"
         "Fayl yuboring — mos amallarni taklif qilaman, yoki menyudan tanlang.",
         reply_markup=kb_main()
     )
@@ -461,47 +3017,48 @@ async def show_resume_button(m: Message):
 @dp.message(lambda m: m.text in ["🔄 Konvert", "/convert"])
 async def start_convert(m: Message):
     if is_paused(m.from_user.id): return await m.answer("⏸ Texnik xizmat ko‘rsatilmoqda.")
-    session_start(m.from_user.id, "convert")
+    await session_begin(m, "convert")
     await m.answer(
         "🔄 Konvert.\n1) Fayl(lar) yuboring (DOCX/PPTX/XLSX/PDF/rasm).\n"
-        "2) Maqsad formatini tanlang.\n3) ✅ Yakunlash.",
+        "2) Maqsad formatini tanlang.\n3) ✅ Yakunlash.\n"
+        "PDF → PNG: sahifalar '1-3,5', sifat '200 dpi' deb yozsangiz bo‘ladi (natija — ZIP).",
         reply_markup=kb_convert_targets(),
     )
 
 @dp.message(lambda m: m.text in ["📎 Birlashtirish", "/merge"])
 async def start_merge(m: Message):
     if is_paused(m.from_user.id): return await m.answer("⏸ Texnik xizmat.")
-    session_start(m.from_user.id, "merge")
+    await session_begin(m, "merge")
     await m.answer("📎 PDF’larni yuboring, so‘ng ✅ Yakunlash.", reply_markup=kb_session("merge"))
 
 @dp.message(lambda m: m.text in ["✂️ Ajratish", "/split"])
 async def start_split(m: Message):
     if is_paused(m.from_user.id): return await m.answer("⏸ Texnik xizmat.")
-    session_start(m.from_user.id, "split")
+    await session_begin(m, "split")
     await m.answer("✂️ Bitta PDF yuboring, keyin '1-3,5' kabi diapazon yozing va ✅ Yakunlash.", reply_markup=kb_session("split"))
 
 @dp.message(lambda m: m.text in ["🔢 Raqamlash", "/pagenum"])
 async def start_pagenum(m: Message):
     if is_paused(m.from_user.id): return await m.answer("⏸ Texnik xizmat.")
-    session_start(m.from_user.id, "pagenum")
+    await session_begin(m, "pagenum")
     await m.answer("🔢 Bitta PDF yuboring va ✅ Yakunlash.", reply_markup=kb_session("pagenum"))
 
 @dp.message(lambda m: m.text in ["💧 Watermark", "/watermark"])
 async def start_watermark(m: Message):
     if is_paused(m.from_user.id): return await m.answer("⏸ Texnik xizmat.")
-    session_start(m.from_user.id, "watermark")
+    await session_begin(m, "watermark")
     await m.answer("💧 Bitta PDF yuboring. Keyin watermark matnini yozing va ✅ Yakunlash.", reply_markup=kb_session("watermark"))
 
 @dp.message(lambda m: m.text in ["🔎 OCR", "/ocr"])
 async def start_ocr(m: Message):
     if is_paused(m.from_user.id): return await m.answer("⏸ Texnik xizmat.")
-    session_start(m.from_user.id, "ocr")
+    await session_begin(m, "ocr")
     await m.answer("🔎 Rasm yoki PDF yuboring, so‘ng ✅ Yakunlash.", reply_markup=kb_session("ocr"))
 
 @dp.message(lambda m: m.text in ["🌐 Tarjima", "/translate"])
 async def start_translate(m: Message):
     if is_paused(m.from_user.id): return await m.answer("⏸ Texnik xizmat.")
-    session_start(m.from_user.id, "translate", seed={"tgt":"uz"})
+    await session_begin(m, "translate", seed={"tgt":"uz"})
     await m.answer(
         "🌐 Tarjima. Matn yuboring yoki rasm/PDF yuboring (OCR orqali). Tillarni tanlang.",
         reply_markup=kb_translate_targets("uz")
@@ -511,35 +3068,46 @@ async def start_translate(m: Message):
 @dp.message(lambda m: m.text and m.text.startswith("🎯 Target:"))
 async def set_target(m: Message):
     uid = m.from_user.id
-    s = PENDING.get(uid)
+    s = session_get(uid)
     if not s or s["op"] != "convert": return
     tgt = m.text.split(":",1)[1].strip().lower()
     if tgt in ["pdf","png","docx","pptx"]:
-        s["target"] = tgt
+        PREFETCHER.schedule(uid, session_set(uid, "target", tgt))
         await m.answer(f"🎯 Target: {tgt.upper()}")
 
 @dp.message(lambda m: m.text and m.text.startswith("🎯 Tgt:"))
 async def set_translate_tgt(m: Message):
     uid = m.from_user.id
-    s = PENDING.get(uid)
+    s = session_get(uid)
     if not s or s["op"] != "translate": return
     tgt = m.text.split(":",1)[1].strip().lower()
     if tgt in ["uz","en","ru"]:
-        s["params"]["tgt"] = tgt
+        session_set(uid, "tgt", tgt, param=True)
         await m.answer(f"🎯 Target til: {tgt}", reply_markup=kb_translate_targets(tgt))
 
 # ---- Session control ----
 @dp.message(lambda m: m.text in ["❌ Bekor", "/cancel"])
 async def cancel_session(m: Message):
+    task = OP_TASKS.pop(m.from_user.id, None)
+    if task is not None: task.cancel()   # navbatda kutayotgan bo‘lsa — chiqadi, fayllar o‘chadi
     session_clear(m.from_user.id)
     await m.answer("❌ Session bekor qilindi.", reply_markup=kb_main())
 
 @dp.message(lambda m: m.text in ["📋 Holat", "/status"])
 async def status_session(m: Message):
-    s = PENDING.get(m.from_user.id)
+    s = session_get(m.from_user.id)
     if not s: return await m.answer("ℹ️ Aktiv session yo‘q.", reply_markup=kb_main())
     await m.answer("📄\n" + session_status_text(s))
 
+@dp.message(lambda m: m.text in ["♻️ Oxirgi fayl", "/last"])
+async def attach_last_file(m: Message):
+    uid = m.from_user.id
+    if not session_get(uid): return await m.answer("ℹ️ Avval amalni tanlang (masalan, 🔄 Konvert).", reply_markup=kb_main())
+    local = reuse_last_file(uid)
+    if not local: return await m.answer("ℹ️ Oxirgi fayl topilmadi — faylni qayta yuboring.")
+    PREFETCHER.schedule(uid, session_add_file(uid, local))
+    await m.answer(f"♻️ Qo‘shildi: {os.path.basename(local)} ({human_size(os.path.getsize(local))})")
+
 @dp.message(lambda m: m.text == "↩️ Asosiy menyu")
 async def back_to_main(m: Message):
     await m.answer("Asosiy menyu", reply_markup=kb_main())
@@ -550,13 +3118,18 @@ async def any_file_received(m: Message):
     if is_paused(m.from_user.id): return await m.answer("⏸ Texnik xizmat.")
     local = await grab_file_from_message(m)
     if not local: return await m.answer("❌ Faylni yuklab bo‘lmadi.")
-    LAST_FILE[m.from_user.id] = local
 
-    s = PENDING.get(m.from_user.id)
-    if s:
-        s["files"].append(local)
+    uid = m.from_user.id
+    s = session_get(uid)
+    if s and await asyncio.to_thread(STORAGE.trim_user, uid, s.get("dir")) > STORAGE_USER_MAX:   # os.walk — event loop'dan tashqarida
+        os.remove(local)
+        return await m.answer(f"❌ Fayllar hajmi limiti ({human_size(STORAGE_USER_MAX)}) oshdi. ✅ Yakunlang yoki ❌ Bekor qiling.")
+    s = session_add_file(uid, local)
+    if s is not None:
+        PREFETCHER.schedule(uid, s)
         await m.answer(f"📥 Qabul qilindi: {os.path.basename(local)} ({human_size(os.path.getsize(local))})")
     else:
+        STATE.last_file_put(uid, {**STATE.last_file_get(uid), "orphan": True})
         await m.answer(
             "📎 Fayl qabul qilindi. Quyidagidan birini tanlang:",
             reply_markup=ReplyKeyboardMarkup(
@@ -569,124 +3142,125 @@ async def any_file_received(m: Message):
         )
 
 # ---- Finalize (/done) ----
+async def deliver_op_result(uid: int, op: str, res: dict) -> bool:
+    """Natijani foydalanuvchiga yuboradi; op xato qaytargan bo‘lsa — False."""
+    if res["error"]:
+        await send_message(uid, res["error"]); return False
+    for note in res["notes"]: await send_message(uid, note)
+    if res["paths"]: await send_documents(uid, res["paths"])
+    if res["text"]: await send_message(uid, res["text"])
+    STATE.counter_inc(op)
+    return True
+
+def localize_result(res: dict, files: List[str]) -> dict:
+    """input_ref belgilarini joriy so‘rovning fayl nomlariga almashtiradi (yangi natija ham, keshdagisi ham)."""
+    return {**res, "text": render_refs(res["text"], files), "notes": [render_refs(n, files) for n in res["notes"]]}
+
+async def cache_lookup(op: str, files: List[str], params: dict, target: str, out_dir: str) -> tuple:
+    """(kesh kaliti, natija yoki None). ADMISSION'dan oldin chaqiriladi — hit navbat kutmaydi."""
+    observe_bytes(f"op_{op}", "in", files_size(files))
+    try: key = await IO_POOL.run(RESULT_CACHE.key, op, files, params, target)
+    except OSError: return None, None
+    hit = await IO_POOL.run(RESULT_CACHE.get, key, out_dir, files)
+    if hit is not None:
+        METRICS.inc("ofm_cache_total", op=op, result="hit")
+        return key, {**localize_result(hit, files), "cached": True}
+    METRICS.inc("ofm_cache_total", op=op, result="miss")
+    return key, None
+
+async def run_op(op: str, files: List[str], params: dict, target: str, out_dir: str,
+                 key: Optional[str] = None, checked: bool = False) -> dict:
+    """Kesh -> op (o‘z executor'ida) -> keshga yozish. Natijada "cached" belgisi bor.
+    checked=True: cache_lookup allaqachon miss bergan (key — uning kaliti), faqat hisoblanadi."""
+    if not checked:
+        key, hit = await cache_lookup(op, files, params, target, out_dir)
+        if hit is not None: return hit
+    fn, pool = OPS[op]
+    with stage(f"op_{op}"):
+        res = await pool.run(fn, files, params, target, out_dir)
+    observe_bytes(f"op_{op}", "out", files_size(res["paths"]))
+    if key:
+        try: await IO_POOL.run(RESULT_CACHE.put, key, res, files)
+        except Exception: traceback.print_exc()
+    return {**localize_result(res, files), "cached": False}
+
+OP_TASKS: Dict[int, asyncio.Task] = {}   # uid -> navbat kutayotgan / bajarilayotgan finalize ishi
+
+def session_restore(uid: int, s: dict) -> None:
+    """Ish bajarilmadi — foydalanuvchi ✅ Yakunlash'ni qayta bosa olsin (yangi sessiya ochmagan bo‘lsa)."""
+    if session_get(uid) is None: STATE.session_put(uid, s)
+    else: STORAGE.release(s.get("dir"))
+
+async def run_session_op(uid: int, s: dict) -> None:
+    """finalize'dan ajratilgan: prefetch'ni kutish, ADMISSION navbati, op va natijani yuborish."""
+    op = s["op"]; out_dir = s.get("dir") or user_dir(uid)
+    keep = False
+    try:
+        await PREFETCHER.settle(s.get("sid"))   # fonda boshlangan konvert/OCR — qayta qilinmaydi
+        key, res = await cache_lookup(op, s["files"], s["params"], s.get("target"), out_dir)
+        try:
+            if res is None:   # admission faqat hisoblash uchun — keshdan javob navbatsiz
+                async with ADMISSION.slot(uid, op, queue_notifier(uid)):
+                    res = await run_op(op, s["files"], s["params"], s.get("target"), out_dir, key=key, checked=True)
+        except AdmissionRejected as e:
+            keep = True
+            return await send_message(uid, str(e))
+        if not await deliver_op_result(uid, op, res):
+            keep = True; return
+        await send_message(uid, "✅ Yakunlandi.", reply_markup=kb_main())
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        try: await send_message(uid, f"❌ Xatolik: {e}", reply_markup=kb_main())
+        except Exception: traceback.print_exc()
+    finally:
+        PREFETCHER.cancel(s.get("sid"))
+        if keep: session_restore(uid, s)
+        else: STORAGE.release(s.get("dir"))
+
 @dp.message(lambda m: m.text in ["✅ Yakunlash", "/done"])
 async def finalize(m: Message):
     uid = m.from_user.id
-    s = PENDING.get(uid)
+    s = session_get(uid)
     if not s: return await m.answer("ℹ️ Aktiv session yo‘q.", reply_markup=kb_main())
 
     op = s["op"]; files = s["files"]; params = s["params"]; tgt = s.get("target")
-    out_dir = user_dir(uid)
+    out_dir = s.get("dir") or user_dir(uid)
+    ensure_dir(out_dir)
 
     try:
+        pdfs = [p for p in files if p.lower().endswith(".pdf")]
         if op == "convert":
             if not files: return await m.answer("Fayl yuboring.")
             if not tgt: return await m.answer("🎯 Target tanlang.")
-
-            result_paths: List[str] = []
-            if tgt == "pdf":
-                imgs = [p for p in files if os.path.splitext(p)[1].lower() in [".jpg",".jpeg",".png",".webp"]]
-                others = [p for p in files if p not in imgs]
-                if imgs:
-                    out = os.path.join(out_dir, f"images_{now_stamp()}.pdf")
-                    images_to_single_pdf(imgs, out); result_paths.append(out)
-                for f in others:
-                    out = soffice_convert_to_pdf(f, out_dir); result_paths.append(out)
-                if len(result_paths) > 1:
-                    merged = os.path.join(out_dir, f"merged_{now_stamp()}.pdf")
-                    pdf_merge(result_paths, merged); result_paths = [merged]
-
-            elif tgt == "png":
-                for f in files:
-                    ext = os.path.splitext(f)[1].lower()
-                    if ext == ".pdf":
-                        await m.answer("ℹ️ PDF → PNG uchun rasterlash o‘rnatilmagan (poppler bilan to‘liq eksport qilishni yoqsangiz bo‘ladi).")
-                    else:
-                        im = Image.open(f).convert("RGB")
-                        out = os.path.join(out_dir, os.path.splitext(os.path.basename(f))[0] + ".png")
-                        im.save(out, format="PNG")
-                        result_paths.append(out)
-
-            elif tgt in ["docx","pptx"]:
-                return await m.answer("⚠️ Bunday konvert hozircha qo‘llanmaydi.")
-
-            for rp in result_paths:
-                await bot.send_document(uid, BufferedInputFile(open(rp,"rb").read(), filename=os.path.basename(rp)))
-            COUNTERS["convert"] += 1
-
+            if tgt in ["docx","pptx"]: return await m.answer("⚠️ Bunday konvert hozircha qo‘llanmaydi.")
         elif op == "merge":
-            pdfs = [p for p in files if p.lower().endswith(".pdf")]
             if len(pdfs) < 2: return await m.answer("Kamida 2 ta PDF yuboring.")
-            out = os.path.join(out_dir, f"merged_{now_stamp()}.pdf")
-            pdf_merge(pdfs, out)
-            await bot.send_document(uid, BufferedInputFile(open(out,"rb").read(), filename=os.path.basename(out)))
-            COUNTERS["merge"] += 1
-
         elif op == "split":
-            pdfs = [p for p in files if p.lower().endswith(".pdf")]
-            if not pdfs: return await m.answer("Bitta PDF yuboring.")
-            rng = params.get("range")
-            if not rng: return await m.answer("Diapazon kiriting (masalan: 1-3,5).")
-            out = os.path.join(out_dir, f"split_{now_stamp()}.pdf")
-            pdf_split_range(pdfs[0], rng, out)
-            await bot.send_document(uid, BufferedInputFile(open(out,"rb").read(), filename=os.path.basename(out)))
-            COUNTERS["split"] += 1
-
-        elif op == "pagenum":
-            pdfs = [p for p in files if p.lower().endswith(".pdf")]
             if not pdfs: return await m.answer("Bitta PDF yuboring.")
-            out = os.path.join(out_dir, f"pagenum_{now_stamp()}.pdf")
-            pdf_overlay_text(pdfs[0], out, text="", page_numbers=True)
-            await bot.send_document(uid, BufferedInputFile(open(out,"rb").read(), filename=os.path.basename(out)))
-            COUNTERS["pagenum"] += 1
-
-        elif op == "watermark":
-            pdfs = [p for p in files if p.lower().endswith(".pdf")]
+            if not params.get("range"): return await m.answer("Diapazon kiriting (masalan: 1-3,5).")
+        elif op in ["pagenum", "watermark"]:
             if not pdfs: return await m.answer("Bitta PDF yuboring.")
-            wm = params.get("wm_text", "OFM")
-            out = os.path.join(out_dir, f"watermark_{now_stamp()}.pdf")
-            pdf_overlay_text(pdfs[0], out, text=wm, page_numbers=False)
-            await bot.send_document(uid, BufferedInputFile(open(out,"rb").read(), filename=os.path.basename(out)))
-            COUNTERS["watermark"] += 1
-
         elif op == "ocr":
             if not files: return await m.answer("Rasm yoki PDF yuboring.")
-            texts = []
-            for f in files:
-                ext = os.path.splitext(f)[1].lower()
-                if ext == ".pdf":
-                    try: texts.append(ocr_pdf(f))
-                    except Exception: traceback.print_exc()
-                else:
-                    try: texts.append(ocr_image(f))
-                    except Exception: traceback.print_exc()
-            if texts:
-                await m.answer("📝 OCR natija:\n\n" + "\n\n---\n\n".join([t for t in texts if t][:3]))
-            else:
-                await m.answer("Matn topilmadi.")
-            COUNTERS["ocr"] += 1
-
-        elif op == "translate":
-            tgt = params.get("tgt", "uz")
-            translator = Translator()
-            texts = []
-            # file bo‘lsa — OCR qilib olamiz; text bo‘lsa — to‘g‘ridan
-            for f in files:
-                ext = os.path.splitext(f)[1].lower()
-                if ext == ".pdf":
-                    try: texts.append(ocr_pdf(f))
-                    except Exception: traceback.print_exc()
-                elif ext in [".jpg",".jpeg",".png",".webp"]:
-                    try: texts.append(ocr_image(f))
-                    except Exception: traceback.print_exc()
-            if (not files) and m.text and m.text not in ["✅ Yakunlash","❌ Bekor","📋 Holat","↩️ Asosiy menyu"]:
-                texts.append(m.text)
-
-            full = "\n\n".join([t for t in texts if t])
-            if not full.strip(): return await m.answer("Tarjima uchun matn yo‘q.")
-            tr = translator.translate(full, dest=tgt)
-            await m.answer(f"🌐 Tarjima → {tgt}:\n\n{tr.text[:4000]}")
-            COUNTERS["translate"] += 1
+
+        if op in OPS and JOB_QUEUE is not None:
+            JOB_QUEUE.enqueue("op", {"uid": uid, "op": op, "files": files, "params": params, "target": tgt,
+                                     "out_dir": out_dir, "cleanup": s.get("dir")})
+            session_clear(uid, keep_files=True)   # fayllarni worker ishdan keyin o‘chiradi
+            return await m.answer("⏳ Navbatga qo‘shildi — tayyor bo‘lishi bilan yuboraman.", reply_markup=kb_main())
+
+        if op in OPS:
+            # navbat kutish (ADMIT_WAIT_TIMEOUT gacha) webhook so‘rovini ham, update worker'ni ham band qilmasin
+            running = OP_TASKS.get(uid)
+            if running is not None and not running.done():
+                return await m.answer("⏳ Oldingi amalingiz hali bajarilmoqda — tugashini kuting.")
+            STATE.session_del(uid)   # endi sessiya (fayllar, prefetch) fon vazifasiniki
+            task = asyncio.create_task(run_session_op(uid, s))
+            OP_TASKS[uid] = task
+            task.add_done_callback(lambda t, uid=uid: OP_TASKS.pop(uid, None) if OP_TASKS.get(uid) is t else None)
+            return await m.answer("⏳ Qabul qilindi — tayyor bo‘lishi bilan yuboraman.", reply_markup=kb_main())
 
         await m.answer("✅ Yakunlandi.", reply_markup=kb_main())
         session_clear(uid)
@@ -707,7 +3281,7 @@ GLOBAL_BUTTONS = {
 @dp.message(lambda m: True)
 async def free_text_router(m: Message):
     uid = m.from_user.id
-    s = PENDING.get(uid)
+    s = session_get(uid)
 
     # Global tugmalar sessionni bosib ketmasin:
     txt = (m.text or "").strip()
@@ -730,11 +3304,18 @@ async def free_text_router(m: Message):
     op = s["op"]
     if op == "split":
         if re.fullmatch(r"[\d,\-\s]+", txt):
-            s["params"]["range"] = txt
+            session_set(uid, "range", txt, param=True)
             await m.answer(f"📌 Diapazon: {txt}")
+    elif op == "convert":
+        if mt := re.fullmatch(r"(\d{2,3})\s*dpi", txt, re.I):
+            session_set(uid, "dpi", int(mt.group(1)), param=True)
+            await m.answer(f"📌 PNG sifati: {mt.group(1)} DPI")
+        elif re.fullmatch(r"[\d,\-\s]+", txt):
+            session_set(uid, "range", txt, param=True)
+            await m.answer(f"📌 PNG sahifalari: {txt}")
     elif op == "watermark":
         if txt and txt not in ["✅ Yakunlash","❌ Bekor","📋 Holat"]:
-            s["params"]["wm_text"] = txt
+            session_set(uid, "wm_text", txt, param=True)
             await m.answer(f"📌 Watermark: {txt}")
     elif op == "translate":
         # oddiy matn — tarjima tarkibiga qo‘shib turamiz (yakunlashda foydalanamiz)
@@ -745,21 +3326,105 @@ async def free_text_router(m: Message):
 # =========================
 # WEBHOOK
 # =========================
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "sync")       # sync | async (darhol javob, fon navbat)
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16"))
+UPDATE_DEDUP_SIZE = int(os.getenv("UPDATE_DEDUP_SIZE", "10000"))
+
+async def process_update(data: dict) -> None:
+    if hasattr(dp, "feed_raw_update"):
+        await dp.feed_raw_update(bot, data)
+    else:
+        update = Update.model_validate(data)
+        await dp.feed_update(bot, update)
+
+def update_user_key(data: dict):
+    for obj in data.values():
+        if isinstance(obj, dict):
+            frm = obj.get("from") or obj.get("user") or {}
+            uid = frm.get("id") or (obj.get("chat") or {}).get("id")
+            if uid: return uid
+    return f"upd{data.get('update_id')}"   # egasi noma'lum — alohida navbat
+
+class UpdateQueue:
+    """Bir foydalanuvchining update'lari qat'iy ketma-ket, turli foydalanuvchilarniki parallel.
+    update_id bo‘yicha takrorlar (Telegram retry) tashlab yuboriladi."""
+
+    def __init__(self, workers: int, dedup_size: int):
+        self.workers = max(1, workers)
+        self.dedup_size = dedup_size
+        self.seen: "OrderedDict[int, None]" = OrderedDict()
+        self.pending: Dict[object, deque] = {}   # key -> navbat; birinchi element hozir ishlanmoqda
+        self.ready: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.stats = {"accepted": 0, "duplicate": 0, "processed": 0, "failed": 0}
+
+    def start(self) -> None:
+        self.ready = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self.tasks: t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    @property
+    def depth(self) -> int:
+        return sum(len(q) for q in self.pending.values())
+
+    def submit(self, data: dict) -> bool:
+        upd_id = data.get("update_id")
+        if upd_id is not None:
+            if upd_id in self.seen:
+                self.stats["duplicate"] += 1; return False
+            self.seen[upd_id] = None
+            if len(self.seen) > self.dedup_size: self.seen.popitem(last=False)
+        key = update_user_key(data)
+        q = self.pending.get(key)
+        if q is None:
+            self.pending[key] = deque([data]); self.ready.put_nowait(key)
+        else:
+            q.append(data)
+        self.stats["accepted"] += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self.ready.get()
+            q = self.pending[key]
+            try:
+                await process_update(q[0])
+                self.stats["processed"] += 1
+            except Exception:
+                self.stats["failed"] += 1
+                traceback.print_exc()
+                print("Update JSON:", q[0], file=sys.stderr)
+            finally:
+                q.popleft()
+                if q: self.ready.put_nowait(key)   # shu foydalanuvchining keyingisi — navbat oxiriga
+                else: del self.pending[key]
+
+UPDATE_QUEUE = UpdateQueue(UPDATE_WORKERS, UPDATE_DEDUP_SIZE)
+
 @app.post("/bot/webhook")
 async def telegram_webhook(request: Request):
     data = await request.json()
+    if WEBHOOK_MODE == "async":
+        UPDATE_QUEUE.submit(data)
+        return {"ok": True}
     try:
-        if hasattr(dp, "feed_raw_update"):
-            await dp.feed_raw_update(bot, data)
-        else:
-            update = Update.model_validate(data)
-            await dp.feed_update(bot, update)
+        await process_update(data)
         return {"ok": True}
     except Exception as e:
         traceback.print_exc()
         print("Update JSON:", data, file=sys.stderr)
         return {"ok": False}
 
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = JOB_QUEUE.get(job_id) if JOB_QUEUE is not None else None
+    if not job: return JSONResponse({"status": "error", "error": "topilmadi"}, status_code=404)
+    return {k: job[k] for k in ("id", "kind", "status", "attempts", "result", "error", "created", "updated")}
+
 @app.get("/bot/set_webhook")
 async def set_webhook(base: str | None = None):
     base_url = (base or APP_BASE).rstrip("/")
@@ -770,8 +3435,46 @@ async def set_webhook(base: str | None = None):
 # =========================
 # STARTUP
 # =========================
+WARMUP = os.getenv("WARMUP", "1") == "1"              # 0: engine'lar faqat birinchi ishda yuklanadi
+WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", "1"))
+WARMUP_MS: Dict[str, float] = {}
+
+def warm_engines() -> Dict[str, float]:
+    """Lazy kutubxonalar, shriftlar va rezyume shabloni; har biriga ketgan ms."""
+    took: Dict[str, float] = {}
+    for lz in LazyImport.registry:
+        t0 = time.perf_counter()
+        try: lz.load()
+        except Exception: traceback.print_exc()
+        took[lz.name] = round((time.perf_counter() - t0) * 1000, 1)
+    for name, fn in (("fonts", register_fonts), ("resume_template", RESUME_TPL.get)):
+        t0 = time.perf_counter()
+        try: fn()
+        except Exception: traceback.print_exc()
+        took[name] = round((time.perf_counter() - t0) * 1000, 1)
+    return took
+
+async def warmup():
+    await asyncio.sleep(WARMUP_DELAY)
+    try: await set_bot_commands()
+    except Exception: traceback.print_exc()
+    if not WARMUP or JOB_QUEUE is not None: return   # sqlite rejimida engine'lar worker'larda isitiladi
+    t0 = time.perf_counter()
+    WARMUP_MS.update(await asyncio.to_thread(warm_engines))
+    # CPU_POOL child'lari ham (har biri o‘z importlari bilan) — best effort
+    await asyncio.gather(*(CPU_POOL.run(warm_engines) for _ in range(CPU_POOL.workers)), return_exceptions=True)
+    METRICS.observe("ofm_warmup_seconds", time.perf_counter() - t0)
+
 @app.on_event("startup")
 async def on_startup():
     ensure_dir(WORKDIR)
-    try: await set_bot_commands()
-    except Exception: traceback.print_exc()
+    if JOB_QUEUE is None: LO_POOL.start()   # sqlite rejimida web tier soffice ko‘tarmaydi (kerak bo‘lsa convert o‘zi ishga tushiradi)
+    if WEBHOOK_MODE == "async": UPDATE_QUEUE.start()
+    asyncio.create_task(storage_sweeper())
+    asyncio.create_task(warmup())   # tarmoq va og‘ir importlar — server "/" ga javob bera boshlagach
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await UPDATE_QUEUE.stop()
+    LO_POOL.shutdown()
+    IO_POOL.shutdown(); CPU_POOL.shutdown()
@@ -0,0 +1,94 @@
+# app/worker.py
+# Og‘ir ishlar (finalize amallari, rezyume, bulk rezyume) uchun alohida process:
+#   JOB_BACKEND=sqlite STATE_BACKEND=sqlite python -m app.worker
+# Web process faqat navbatga qo‘yadi; worker o‘lsa ham bot ishlayveradi (ish lease tugagach qayta olinadi).
+import os
+import sys
+import socket
+import asyncio
+import traceback
+
+from app import main as core
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))
+WORKER_POLL = float(os.getenv("WORKER_POLL", "1.0"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def _heartbeat(job_id: str):
+    while True:
+        await asyncio.sleep(max(5.0, core.JOB_LEASE / 3))
+        try: await asyncio.to_thread(core.JOB_QUEUE.heartbeat, job_id)
+        except Exception: traceback.print_exc()
+
+
+async def run_job(job: dict) -> dict:
+    p = job["payload"]
+    if job["kind"] == "op":
+        res = await core.run_op(p["op"], p["files"], p["params"], p["target"], p["out_dir"])
+        await core.deliver_op_result(p["uid"], p["op"], res)
+        if not res["error"]:
+            await core.send_message(p["uid"], "✅ Yakunlandi.", reply_markup=core.kb_main())
+        return {"paths": res["paths"], "cached": res["cached"], "error": res["error"]}
+    if job["kind"] == "resume":
+        img_bytes = None
+        if p.get("photo_path") and os.path.exists(p["photo_path"]):
+            with open(p["photo_path"], "rb") as f: img_bytes = f.read()
+        info = await core.process_resume(p["ctx"], p.get("tg_id", ""), img_bytes)
+        if p.get("photo_path"):
+            try: os.remove(p["photo_path"])
+            except OSError: pass
+        return info
+    if job["kind"] == "resume_bulk":
+        st = core.RESUME_BULK.load(p["id"])
+        if st is None: raise ValueError(f"bulk partiya topilmadi: {p['id']}")
+        await core.RESUME_BULK.run(st, admit=False)
+        return {"status": st["status"], "done": st["done"], "failed": st["failed"]}
+    raise ValueError(f"Noma'lum ish turi: {job['kind']}")
+
+
+async def notify_failure(job: dict, error: str):
+    uid = job["payload"].get("uid") or job["payload"].get("tg_id")
+    if not uid: return
+    try: await core.send_message(int(uid), f"❌ Xatolik: {error}", reply_markup=core.kb_main())
+    except Exception: traceback.print_exc()
+
+
+async def worker_loop(n: int):
+    while True:
+        job = await asyncio.to_thread(core.JOB_QUEUE.claim, f"{WORKER_ID}/{n}")
+        if job is None:
+            await asyncio.sleep(WORKER_POLL); continue
+        if job["dead"]:
+            await notify_failure(job, "ish bajarilmadi, qayta urinib ko‘ring.")
+            core.STORAGE.release(job["payload"].get("cleanup")); continue
+        hb = asyncio.create_task(_heartbeat(job["id"]))
+        try:
+            result = await run_job(job)
+            await asyncio.to_thread(core.JOB_QUEUE.complete, job["id"], result)
+        except Exception as e:
+            traceback.print_exc()
+            await asyncio.to_thread(core.JOB_QUEUE.fail, job["id"], str(e))
+            await notify_failure(job, str(e))
+        finally:
+            hb.cancel()
+            core.STORAGE.release(job["payload"].get("cleanup"))
+
+
+async def main():
+    if core.JOB_QUEUE is None:
+        print("JOB_BACKEND=sqlite bo‘lishi kerak", file=sys.stderr); sys.exit(2)
+    core.ensure_dir(core.WORKDIR)
+    core.LO_POOL.start()   # web tier sqlite rejimida soffice/engine'larni ko‘tarmaydi — ular shu yerda
+    if core.WARMUP: core.WARMUP_MS.update(await asyncio.to_thread(core.warm_engines))
+    else: core.register_fonts()
+    print(f"worker {WORKER_ID}: {WORKER_CONCURRENCY} ta parallel ish", file=sys.stderr)
+    try:
+        await asyncio.gather(*(worker_loop(i) for i in range(WORKER_CONCURRENCY)))
+    finally:
+        core.LO_POOL.shutdown(); core.IO_POOL.shutdown(); core.CPU_POOL.shutdown()
+        await core.bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,363 @@
+# bench/run_bench.py
+# Hujjat amallari uchun benchmark: sintetik kirishlar yaratadi, issiq yo‘llarni o‘lchaydi va
+# natijani JSON'ga yozadi (commit'lar orasida solishtirish uchun).
+#
+#   python bench/run_bench.py --out bench_results.json            # to‘liq
+#   python bench/run_bench.py --quick --cases merge,split         # tez, tanlanganlar
+#   python bench/run_bench.py --compare old.json new.json         # ikki natijani solishtirish
+#
+# Har case alohida (spawn) process'da ishlaydi — peak RSS shu case'ga tegishli bo‘ladi.
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import resource
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGE_SIZES = [1, 10, 50, 200, 500]
+QUICK_PAGE_SIZES = [1, 10, 50]
+
+LOREM = ("Ushbu hujjat benchmark uchun avtomatik yaratilgan. Lorem ipsum dolor sit amet, consectetur "
+         "adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. ")
+
+
+def _core():
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+    os.environ.setdefault("WORKDIR", os.path.join(tempfile.gettempdir(), "ofm_bench_workdir"))
+    from app import main as core
+    return core
+
+
+# =========================
+# SINTETIK KIRISHLAR
+# =========================
+def make_text_pdf(path: str, pages: int) -> str:
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    c = canvas.Canvas(path, pagesize=A4)
+    for i in range(1, pages + 1):
+        c.setFont("Helvetica-Bold", 16); c.drawString(72, 780, f"Sahifa {i}")
+        c.setFont("Helvetica", 11)
+        for ln in range(45):
+            c.drawString(72, 750 - ln * 15, (LOREM * 2)[ln % 40: ln % 40 + 90])
+        c.showPage()
+    c.save()
+    return path
+
+
+# OCR sifati uchun ma'lum matn (ground truth): 11pt atrofidagi shrift, sahifa A4 deb
+WORDS = LOREM.split()
+TEXT_LINES = [" ".join(WORDS[(i * 7) % len(WORDS):] + WORDS[:(i * 7) % len(WORDS)])[:60] for i in range(40)]
+
+
+def _font(px: int):
+    from PIL import ImageFont
+    for path in (os.path.join(ROOT, "app", "fonts", "DejaVuSans.ttf"), "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"):
+        if os.path.exists(path): return ImageFont.truetype(path, px)
+    return ImageFont.load_default(size=px)
+
+
+def _text_page(size, px_per_inch: float, lines: int, bg=255, fg=0):
+    from PIL import Image, ImageDraw
+    im = Image.new("RGB" if isinstance(bg, tuple) else "L", size, bg); d = ImageDraw.Draw(im)
+    font = _font(max(8, int(px_per_inch * 11 / 72))); step = int(px_per_inch * 16 / 72)
+    for ln, txt in enumerate(TEXT_LINES[:lines]):
+        d.text((int(px_per_inch * 0.8), int(px_per_inch * 0.8) + ln * step), txt, fill=fg, font=font)
+    return im
+
+
+def make_scanned_pdf(path: str, pages: int, dpi: int = 150) -> str:
+    # matn qatlami yo‘q: har sahifa — matn chizilgan rasm
+    w, h = int(8.27 * dpi), int(11.69 * dpi)
+    imgs = [_text_page((w, h), dpi, 40) for _ in range(pages)]
+    imgs[0].save(path, save_all=True, append_images=imgs[1:], resolution=dpi)
+    return path
+
+
+def make_phone_jpeg(path: str, size=(4032, 3024), orientation: int = 6, skew: float = 0.0) -> str:
+    # telefon surati: landscape sensor, EXIF orientation bilan portret sahifa; ixtiyoriy qiyshiqlik
+    from PIL import Image
+    w, h = size
+    page = _text_page((h, w), h / 8.27, 40, bg=(235, 232, 225), fg=(20, 20, 20))
+    if skew: page = page.rotate(skew, fillcolor=(235, 232, 225))
+    inv = {6: Image.ROTATE_90, 8: Image.ROTATE_270, 3: Image.ROTATE_180}.get(orientation)
+    im = page.transpose(inv) if inv is not None else page
+    exif = Image.Exif(); exif[0x0112] = orientation
+    im.save(path, format="JPEG", quality=92, exif=exif)
+    return path
+
+
+def text_similarity(expected: str, got: str) -> float:
+    import difflib
+    norm = lambda t: " ".join(t.lower().split())
+    return round(difflib.SequenceMatcher(None, norm(expected), norm(got)).ratio(), 4)
+
+
+def ocr_with(path: str, **cfg) -> str:
+    """ocr_image'ni vaqtincha boshqa OCR_* sozlamalari bilan (faqat shu bench process'ida)."""
+    core = _core(); old = {k: getattr(core, k) for k in cfg}
+    try:
+        for k, v in cfg.items(): setattr(core, k, v)
+        return core.ocr_image(path, preprocess=cfg.get("OCR_PREPROCESS"))
+    finally:
+        for k, v in old.items(): setattr(core, k, v)
+
+
+def make_docx(path: str, paragraphs: int = 60) -> str:
+    from docx import Document
+    doc = Document(); doc.add_heading("Benchmark hujjati", 1)
+    for i in range(paragraphs): doc.add_paragraph(f"{i + 1}. " + LOREM * 3)
+    t = doc.add_table(rows=10, cols=4)
+    for r in range(10):
+        for c in range(4): t.cell(r, c).text = f"{r}:{c}"
+    doc.save(path)
+    return path
+
+
+def make_xlsx(path: str, rows: int = 500, cols: int = 8) -> str:
+    # openpyxl'siz minimal SpreadsheetML
+    cells = []
+    for r in range(1, rows + 1):
+        row = "".join(f'<c r="{chr(65 + c)}{r}"><v>{r * (c + 1)}</v></c>' for c in range(cols))
+        cells.append(f'<row r="{r}">{row}</row>')
+    files = {
+        "[Content_Types].xml": '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"><Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/><Default Extension="xml" ContentType="application/xml"/><Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/><Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/></Types>',
+        "_rels/.rels": '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+        "xl/workbook.xml": '<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets><sheet name="Bench" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        "xl/_rels/workbook.xml.rels": '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/></Relationships>',
+        "xl/worksheets/sheet1.xml": '<?xml version="1.0" encoding="UTF-8"?><worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>' + "".join(cells) + "</sheetData></worksheet>",
+    }
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in files.items(): z.writestr(name, data)
+    return path
+
+
+def make_pptx(path: str, slides: int = 20) -> str:
+    # python-pptx yo‘q: flat ODP yozib, soffice bilan PPTX'ga o‘tkazamiz (o‘lchanmaydi)
+    pages = "".join(
+        f'<draw:page draw:name="s{i}"><draw:frame svg:x="2cm" svg:y="2cm" svg:width="20cm" svg:height="10cm">'
+        f'<draw:text-box><text:p>Slayd {i}</text:p><text:p>{LOREM}</text:p></draw:text-box></draw:frame></draw:page>'
+        for i in range(1, slides + 1))
+    fodp = path[:-5] + ".fodp"
+    with open(fodp, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?><office:document xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+                'xmlns:draw="urn:oasis:names:tc:opendocument:xmlns:drawing:1.0" xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" '
+                'xmlns:svg="urn:oasis:names:tc:opendocument:xmlns:svg-compatible:1.0" office:version="1.2" '
+                'office:mimetype="application/vnd.oasis.opendocument.presentation"><office:body><office:presentation>'
+                + pages + "</office:presentation></office:body></office:document>")
+    subprocess.run(["soffice", "--headless", "--convert-to", "pptx", "--outdir", os.path.dirname(path), fodp],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=180)
+    return path
+
+
+def resume_payload(relatives: int = 6) -> dict:
+    core = _core()
+    ctx = json.loads(json.dumps(core.RESUME_SAMPLE))
+    base = ctx["relatives"][0]
+    ctx["relatives"] = [{**base, "full_name": f"{base['full_name']} {i}"} for i in range(relatives)]
+    return ctx
+
+
+# =========================
+# CASE'LAR
+# =========================
+def build_cases(quick: bool):
+    """[(nom, setup(td) -> kirish, run(kirish, td), birlik_soni(kirish) -> (son, birlik)[, sifat(kirish, natija) -> 0..1])]"""
+    sizes = QUICK_PAGE_SIZES if quick else PAGE_SIZES
+    cases = []
+
+    def pages(n):  # birlik: sahifa
+        return lambda inp: (n, "page")
+
+    for n in sizes:
+        cases.append((f"merge_{n}p", lambda td, n=n: [make_text_pdf(os.path.join(td, f"a{i}.pdf"), max(1, n // 2)) for i in range(2)],
+                      lambda inp, td: _core().pdf_merge(inp, os.path.join(td, "out.pdf")), pages(n)))
+        cases.append((f"split_{n}p", lambda td, n=n: make_text_pdf(os.path.join(td, "a.pdf"), n),
+                      lambda inp, td, n=n: _core().pdf_split_range(inp, f"1-{max(1, n // 2)}", os.path.join(td, "out.pdf")), pages(n)))
+        cases.append((f"watermark_{n}p", lambda td, n=n: make_text_pdf(os.path.join(td, "a.pdf"), n),
+                      lambda inp, td: _core().pdf_overlay_text(inp, os.path.join(td, "out.pdf"), text="OFM"), pages(n)))
+        cases.append((f"pagenum_{n}p", lambda td, n=n: make_text_pdf(os.path.join(td, "a.pdf"), n),
+                      lambda inp, td: _core().pdf_overlay_text(inp, os.path.join(td, "out.pdf"), text="", page_numbers=True), pages(n)))
+    for n in sizes[:3]:
+        cases.append((f"ocr_pdf_text_{n}p", lambda td, n=n: make_text_pdf(os.path.join(td, "a.pdf"), n),
+                      lambda inp, td: _core().pdf_extract_text(inp), pages(min(n, 10))))
+        cases.append((f"ocr_pdf_scanned_{n}p", lambda td, n=n: make_scanned_pdf(os.path.join(td, "a.pdf"), n),
+                      lambda inp, td: _core().ocr_pdf(inp), pages(min(n, 10)),
+                      lambda inp, out, n=n: text_similarity("\n".join(TEXT_LINES) * min(n, 10), out.replace("---", ""))))
+    cases += [
+        ("images_to_pdf_10x12mp", lambda td: [make_phone_jpeg(os.path.join(td, f"p{i}.jpg")) for i in range(10)],
+         lambda inp, td: _core().images_to_single_pdf(inp, os.path.join(td, "out.pdf")), lambda inp: (len(inp), "image")),
+        # OCR: xom vs preprocessing (sifat — ground truth bilan o‘xshashlik, 0..1)
+        ("ocr_image_12mp_raw", lambda td: make_phone_jpeg(os.path.join(td, "p.jpg")),
+         lambda inp, td: ocr_with(inp, OCR_PREPROCESS=False), lambda inp: (1, "image"), ocr_quality),
+        ("ocr_image_12mp_pre", lambda td: make_phone_jpeg(os.path.join(td, "p.jpg")),
+         lambda inp, td: ocr_with(inp, OCR_PREPROCESS=True), lambda inp: (1, "image"), ocr_quality),
+        ("ocr_image_12mp_pre_bin", lambda td: make_phone_jpeg(os.path.join(td, "p.jpg")),
+         lambda inp, td: ocr_with(inp, OCR_PREPROCESS=True, OCR_BINARIZE=True), lambda inp: (1, "image"), ocr_quality),
+        ("ocr_image_12mp_skew_raw", lambda td: make_phone_jpeg(os.path.join(td, "p.jpg"), skew=3.0),
+         lambda inp, td: ocr_with(inp, OCR_PREPROCESS=False), lambda inp: (1, "image"), ocr_quality),
+        ("ocr_image_12mp_skew_deskew", lambda td: make_phone_jpeg(os.path.join(td, "p.jpg"), skew=3.0),
+         lambda inp, td: ocr_with(inp, OCR_PREPROCESS=True, OCR_DESKEW=True), lambda inp: (1, "image"), ocr_quality),
+        ("soffice_docx", lambda td: make_docx(os.path.join(td, "a.docx")),
+         lambda inp, td: _core().soffice_convert_to_pdf(inp, os.path.join(td, "out")), lambda inp: (1, "file")),
+        ("soffice_xlsx", lambda td: make_xlsx(os.path.join(td, "a.xlsx")),
+         lambda inp, td: _core().soffice_convert_to_pdf(inp, os.path.join(td, "out")), lambda inp: (1, "file")),
+        ("soffice_pptx", lambda td: make_pptx(os.path.join(td, "a.pptx")),
+         lambda inp, td: _core().soffice_convert_to_pdf(inp, os.path.join(td, "out")), lambda inp: (1, "file")),
+        ("resume_docx", lambda td: resume_payload(),
+         lambda inp, td: _core().render_resume_docx(inp), lambda inp: (1, "resume")),
+        ("resume_pdf_native", lambda td: resume_payload(),
+         lambda inp, td: _core().render_resume_pdf_native(inp), lambda inp: (1, "resume")),
+        ("resume_pdf_soffice", lambda td: resume_payload(),
+         lambda inp, td: _core().convert_docx_bytes_to_pdf_bytes(_core().render_resume_docx(inp)["docx"]), lambda inp: (1, "resume")),
+    ]
+    # bulk: bitta render partiyasi + bitta soffice chaqiruvi; throughput "resume" birligida resume_pdf_soffice bilan solishtiriladi
+    for n in (5, 20):
+        cases.append((f"resume_bulk_{n}", lambda td, n=n: [{"i": i, "base": f"r{i:03d}", "ctx": resume_payload(), "photo_path": None}
+                                                          for i in range(n)],
+                      lambda inp, td: resume_bulk_run(inp, td), lambda inp: (len(inp), "resume")))
+    return cases
+
+
+def resume_bulk_run(items: list, td: str) -> list:
+    core = _core(); out_dir = os.path.join(td, "bulk", str(time.perf_counter_ns()))
+    rendered = core.render_resume_batch(items, out_dir)
+    return core.convert_resume_batch([r["docx"] for r in rendered], os.path.join(out_dir, "pdf"))
+
+
+def ocr_quality(inp, out: str) -> float:
+    return text_similarity("\n".join(TEXT_LINES), out)
+
+
+def percentile(vals, q):
+    vals = sorted(vals)
+    if not vals: return 0.0
+    return vals[min(len(vals) - 1, int(round(q / 100 * (len(vals) - 1))))]
+
+
+def _rss_mb(who) -> float:
+    # Linux'da ru_maxrss KB, macOS'da bayt
+    v = resource.getrusage(who).ru_maxrss
+    return v / 1024 / (1024 if platform.system() == "Darwin" else 1)
+
+
+def _run_case(name: str, quick: bool, repeat: int, warmup: int, conn):
+    try:
+        setup, run, units, *quality = next(c[1:] for c in build_cases(quick) if c[0] == name)
+        td = tempfile.mkdtemp(prefix="ofm_bench_")
+        try:
+            inp = setup(td)
+            for _ in range(warmup): run(inp, td)
+            lat = []
+            for _ in range(repeat):
+                t0 = time.perf_counter(); out = run(inp, td); lat.append(time.perf_counter() - t0)
+            n, unit = units(inp)
+            score = quality[0](inp, out) if quality else None
+        finally:
+            shutil.rmtree(td, ignore_errors=True)
+            try: _core().LO_POOL.shutdown(); _core().CPU_POOL.shutdown()   # OCR sahifalari CPU_POOL'da
+            except Exception: pass
+        total = sum(lat)
+        conn.send({
+            "case": name, "ok": True, "repeat": repeat,
+            "latency_ms": {k: round(percentile(lat, q) * 1000, 2) for k, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+                          | {"min": round(min(lat) * 1000, 2), "max": round(max(lat) * 1000, 2)},
+            "throughput": {"ops_per_s": round(repeat / total, 3), f"{unit}s_per_s": round(n * repeat / total, 3)},
+            "peak_rss_mb": {"self": round(_rss_mb(resource.RUSAGE_SELF), 1),
+                            "children": round(_rss_mb(resource.RUSAGE_CHILDREN), 1)},
+        } | ({"quality": score} if score is not None else {}))
+    except Exception as e:
+        conn.send({"case": name, "ok": False, "error": f"{type(e).__name__}: {e}"})
+
+
+def run_all(args) -> dict:
+    names = [c[0] for c in build_cases(args.quick)]
+    if args.cases:
+        wanted = [w.strip() for w in args.cases.split(",") if w.strip()]
+        names = [n for n in names if any(n == w or n.startswith(w) for w in wanted)]
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name in names:
+        parent, child = ctx.Pipe(duplex=False)
+        p = ctx.Process(target=_run_case, args=(name, args.quick, args.repeat, args.warmup, child))
+        p.start(); child.close()
+        res = parent.recv() if parent.poll(args.timeout) else {"case": name, "ok": False, "error": "timeout"}
+        p.join(5)
+        if p.is_alive(): p.kill()
+        results.append(res)
+        line = (f"{name:28s} p50 {res['latency_ms']['p50']:>10.1f} ms  p95 {res['latency_ms']['p95']:>10.1f} ms  "
+                f"rss {res['peak_rss_mb']['self']:>7.1f} MB"
+                + (f"  sifat {res['quality']:.3f}" if "quality" in res else "")) if res["ok"] else f"{name:28s} SKIP ({res['error']})"
+        print(line, flush=True)
+    return {
+        "created": datetime.utcnow().isoformat() + "Z",
+        "commit": _git_rev(),
+        "python": sys.version.split()[0], "cpu_count": os.cpu_count(), "quick": args.quick,
+        "results": results,
+        "ocr_preprocess": ocr_summary(results),
+    }
+
+
+def ocr_summary(results: list) -> list:
+    """xom vs preprocessing juftliklari: rasm boshiga tejalgan vaqt va sifat farqi."""
+    by = {r["case"]: r for r in results if r.get("ok")}
+    out = []
+    for raw, pre in (("ocr_image_12mp_raw", "ocr_image_12mp_pre"), ("ocr_image_12mp_raw", "ocr_image_12mp_pre_bin"),
+                     ("ocr_image_12mp_skew_raw", "ocr_image_12mp_skew_deskew")):
+        if raw in by and pre in by:
+            a, b = by[raw], by[pre]
+            out.append({"raw": raw, "pre": pre,
+                        "saved_ms_per_image": round(a["latency_ms"]["p50"] - b["latency_ms"]["p50"], 1),
+                        "quality_raw": a.get("quality"), "quality_pre": b.get("quality")})
+    return out
+
+
+def _git_rev() -> str:
+    try: return subprocess.check_output(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception: return ""
+
+
+def compare(old_path: str, new_path: str) -> int:
+    old = {r["case"]: r for r in json.load(open(old_path))["results"] if r.get("ok")}
+    new = {r["case"]: r for r in json.load(open(new_path))["results"] if r.get("ok")}
+    print(f"{'case':28s} {'p50 old':>10s} {'p50 new':>10s} {'Δ':>8s} {'rss old':>8s} {'rss new':>8s}")
+    worse = 0
+    for name in sorted(set(old) & set(new)):
+        a, b = old[name]["latency_ms"]["p50"], new[name]["latency_ms"]["p50"]
+        delta = (b - a) / a * 100 if a else 0.0
+        worse += delta > 10
+        q = (f"  sifat {old[name]['quality']:.3f} -> {new[name]['quality']:.3f}"
+             if "quality" in old[name] and "quality" in new[name] else "")
+        print(f"{name:28s} {a:>10.1f} {b:>10.1f} {delta:>+7.1f}% "
+              f"{old[name]['peak_rss_mb']['self']:>8.1f} {new[name]['peak_rss_mb']['self']:>8.1f}{q}")
+    return 1 if worse else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OFM hujjat amallari benchmark")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--cases", default="", help="vergul bilan: nom yoki prefiks (merge,ocr_pdf)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--timeout", type=float, default=1800)
+    ap.add_argument("--quick", action="store_true")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = ap.parse_args()
+    if args.compare: sys.exit(compare(*args.compare))
+    report = run_all(args)
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"-> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
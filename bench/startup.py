@@ -0,0 +1,108 @@
+# bench/startup.py
+# Sovuq start o‘lchovi: "import app.main" vaqti va uvicorn ishga tushgandan "/" birinchi javobigacha vaqt.
+#
+#   python bench/startup.py --runs 5 --out startup.json
+#   python bench/startup.py --compare before.json after.json
+#
+# Har o‘lchov yangi python process'da (modul keshi yo‘q); BOT_TOKEN bo‘lmasa soxta qiymat qo‘yiladi.
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = ("import time; t = time.perf_counter(); import app.main; "
+                  "print(time.perf_counter() - t)")
+
+
+def _env(extra: dict = None) -> dict:
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "123456:STARTUP")
+    env.setdefault("WORKDIR", os.path.join("/tmp", "ofm_startup_bench"))
+    env.update(extra or {})
+    return env
+
+
+def measure_import() -> float:
+    out = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=_env(), text=True)
+    return float(out.strip().splitlines()[-1])
+
+
+def top_imports(n: int = 15) -> list:
+    """python -X importtime: eng qimmat (cumulative) top-level modullar."""
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True)
+    rows = []
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line: continue
+        _, cum, name = line[len("import time:"):].split("|", 2)
+        if not cum.strip().isdigit() or name.startswith("  "): continue   # ichki (nested) importlar — tashlanadi
+        rows.append((name.strip(), int(cum) / 1000))
+    return [{"module": m, "cumulative_ms": round(ms, 1)} for m, ms in sorted(rows, key=lambda r: -r[1])[:n]]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+
+def measure_first_response(timeout: float = 120, warmup: str = "1") -> dict:
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+                            cwd=ROOT, env=_env({"WARMUP": warmup}), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - t0 < timeout:
+            if proc.poll() is not None: raise RuntimeError(f"uvicorn chiqib ketdi (kod {proc.returncode})")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as r:
+                    if r.status == 200: return {"first_response_s": round(time.perf_counter() - t0, 3)}
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError("/ javob bermadi")
+    finally:
+        proc.terminate()
+        try: proc.wait(10)
+        except subprocess.TimeoutExpired: proc.kill()
+
+
+def summary(vals: list) -> dict:
+    return {"median": round(statistics.median(vals), 3), "min": round(min(vals), 3), "max": round(max(vals), 3)}
+
+
+def compare(old_path: str, new_path: str) -> None:
+    old, new = json.load(open(old_path)), json.load(open(new_path))
+    for key in ("import_s", "first_response_s"):
+        a, b = old[key]["median"], new[key]["median"]
+        print(f"{key:18s} {a:>8.3f} -> {b:>8.3f} s  ({(b - a) / a * 100 if a else 0:+.1f}%)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OFM sovuq start o‘lchovi")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--warmup", default="1", help="WARMUP qiymati (0/1) uvicorn uchun")
+    ap.add_argument("--out", default="startup_results.json")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    a = ap.parse_args()
+    if a.compare: return compare(*a.compare)
+
+    imports = [measure_import() for _ in range(a.runs)]
+    firsts = [measure_first_response(warmup=a.warmup)["first_response_s"] for _ in range(a.runs)]
+    try: commit = subprocess.check_output(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception: commit = ""
+    report = {"created": datetime.utcnow().isoformat() + "Z", "commit": commit, "runs": a.runs, "warmup": a.warmup,
+              "import_s": summary(imports), "first_response_s": summary(firsts), "top_imports": top_imports()}
+    with open(a.out, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps({k: report[k] for k in ("import_s", "first_response_s")}, indent=2))
+    print(f"-> {a.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# loadtest/driver.py
+# Bot'ga /bot/webhook orqali real update ketma-ketliklarini yuboradi (sessiya → fayllar → target → ✅ Yakunlash)
+# va /send_resume_data formalarini jo‘natadi; parallellikni bosqichma-bosqich oshirib o‘lchaydi.
+#
+# 1) bot:    TELEGRAM_API_BASE=http://127.0.0.1:8081 BOT_TOKEN=123:LOAD uvicorn app.main:app --port 8080
+# 2) driver: python -m loadtest.driver --app http://127.0.0.1:8080 --ramp 1,4,16,32 --duration 60
+# Soxta Bot API (loadtest/fake_telegram.py) driver ichida 8081-portda ishga tushadi.
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from loadtest.fake_telegram import FakeTelegram, FileFactory, _jpeg
+
+UPDATE_IDS = itertools.count(int(time.time()) * 1000)
+FILE_SEQ = itertools.count(1)
+
+
+# =========================
+# UPDATE'LAR
+# =========================
+def _base(uid: int) -> dict:
+    return {"message_id": random.randint(1, 10 ** 9), "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"}, "from": {"id": uid, "is_bot": False, "first_name": f"Load{uid}"}}
+
+def text_update(uid: int, text: str) -> dict:
+    return {"update_id": next(UPDATE_IDS), "message": {**_base(uid), "text": text}}
+
+def doc_update(uid: int, kind: str, pages: int = 1) -> dict:
+    fid = f"{kind}-{pages}-{uid}x{next(FILE_SEQ)}"
+    return {"update_id": next(UPDATE_IDS), "message": {**_base(uid), "document": {
+        "file_id": fid, "file_unique_id": fid, "file_name": f"{fid}.{FileFactory.EXT[kind]}",
+        "mime_type": FileFactory.MIME[kind]}}}
+
+# nom -> update ketma-ketligi (oxirgisi har doim ✅ Yakunlash)
+SCENARIOS = {
+    "convert_docx": lambda uid: [text_update(uid, "🔄 Konvert"), doc_update(uid, "docx"),
+                                 text_update(uid, "🎯 Target: PDF"), text_update(uid, "✅ Yakunlash")],
+    "convert_images": lambda uid: [text_update(uid, "🔄 Konvert"), doc_update(uid, "jpg"), doc_update(uid, "jpg"),
+                                   text_update(uid, "🎯 Target: PDF"), text_update(uid, "✅ Yakunlash")],
+    "merge": lambda uid: [text_update(uid, "📎 Birlashtirish"), doc_update(uid, "pdf", 5), doc_update(uid, "pdf", 10),
+                          text_update(uid, "✅ Yakunlash")],
+    "split": lambda uid: [text_update(uid, "✂️ Ajratish"), doc_update(uid, "pdf", 20), text_update(uid, "2-6"),
+                          text_update(uid, "✅ Yakunlash")],
+    "pagenum": lambda uid: [text_update(uid, "🔢 Raqamlash"), doc_update(uid, "pdf", 20), text_update(uid, "✅ Yakunlash")],
+    "watermark": lambda uid: [text_update(uid, "💧 Watermark"), doc_update(uid, "pdf", 10), text_update(uid, "NAMUNA"),
+                              text_update(uid, "✅ Yakunlash")],
+    "ocr": lambda uid: [text_update(uid, "🔎 OCR"), doc_update(uid, "jpg"), text_update(uid, "✅ Yakunlash")],
+}
+DEFAULT_MIX = "convert_docx:2,convert_images:1,merge:2,split:2,pagenum:1,watermark:1,ocr:1,resume:2"
+
+
+# ADMISSION rad javoblari (backpressure): ish bajarilmadi, lekin bu xato ham, timeout ham emas
+REJECTED = ("⏳ Oldingi", "🚦 Server", "⌛ Navbat")
+
+
+def _done(ev: dict) -> bool:
+    return ev["method"] == "sendMessage" and ev["text"].startswith(("✅ Yakunlandi", "❌") + REJECTED)
+
+
+def _resume_done(ev: dict) -> bool:
+    return ev["method"] in ("sendDocument", "sendMediaGroup") and (ev.get("filename") or "").lower().endswith(".pdf")
+
+
+def percentile(vals: List[float], q: float) -> float:
+    vals = sorted(vals)
+    if not vals: return 0.0
+    return vals[min(len(vals) - 1, int(round(q / 100 * (len(vals) - 1))))]
+
+
+# =========================
+# DRIVER
+# =========================
+class Stage:
+    def __init__(self, users: int):
+        self.users = users
+        self.updates = 0
+        self.webhook_ms: List[float] = []
+        self.job_ms: Dict[str, List[float]] = {}
+        self.ok = 0
+        self.errors: Dict[str, int] = {}
+        self.timeouts = 0
+        self.rejected = 0
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        jobs = [v for vs in self.job_ms.values() for v in vs]
+        total = self.ok + sum(self.errors.values()) + self.timeouts + self.rejected
+        pct = lambda vs: {"p50": round(percentile(vs, 50), 1), "p95": round(percentile(vs, 95), 1),
+                          "p99": round(percentile(vs, 99), 1), "n": len(vs)}
+        return {
+            "users": self.users, "elapsed_s": round(elapsed, 1),
+            "updates_per_s": round(self.updates / elapsed, 2) if elapsed else 0.0,
+            "jobs_per_s": round(self.ok / elapsed, 3) if elapsed else 0.0,
+            "webhook_ms": pct(self.webhook_ms),
+            "job_ms": pct(jobs), "job_ms_by_scenario": {k: pct(v) for k, v in self.job_ms.items()},
+            "jobs": total, "ok": self.ok, "errors": self.errors, "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "error_rate": round(sum(self.errors.values()) / total, 4) if total else 0.0,
+            "timeout_rate": round(self.timeouts / total, 4) if total else 0.0,
+            "rejected_rate": round(self.rejected / total, 4) if total else 0.0,
+        }
+
+
+class Driver:
+    def __init__(self, app_url: str, fake: FakeTelegram, mix: Dict[str, int], job_timeout: float, think: float):
+        self.app_url = app_url.rstrip("/")
+        self.fake = fake
+        self.mix = [k for k, w in mix.items() for _ in range(w)]
+        self.job_timeout = job_timeout
+        self.think = think
+        self.photo = _jpeg((600, 800))
+        self.http: Optional[aiohttp.ClientSession] = None
+
+    async def post_update(self, st: Stage, data: dict) -> bool:
+        t0 = time.perf_counter()
+        try:
+            async with self.http.post(f"{self.app_url}/bot/webhook", json=data) as r:
+                body = await r.json(content_type=None)
+                ok = r.status == 200 and (body or {}).get("ok", True)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            ok = False
+        st.webhook_ms.append((time.perf_counter() - t0) * 1000); st.updates += 1
+        if not ok: st.error("webhook")
+        return ok
+
+    async def post_resume(self, st: Stage, uid: int) -> bool:
+        form = aiohttp.FormData()
+        for k, v in {"full_name": f"Load Test {uid}", "phone": "+998 90 000 00 00", "tg_id": str(uid),
+                     "birth_date": "01.01.1990", "birth_place": "Toshkent", "education": "Oliy",
+                     "university": "2012 y. TATU", "specialization": "Dasturchi",
+                     "current_position_date": "2020 yildan", "current_position_full": "Muhandis",
+                     "work_experience": "2012-2020 yy. — dasturchi",
+                     "relatives": json.dumps([{"relation_type": "Otasi", "full_name": "Test Ota", "b_year_place": "1960, Toshkent",
+                                               "job_title": "Nafaqada", "address": "Toshkent"}])}.items():
+            form.add_field(k, v)
+        form.add_field("photo", self.photo, filename="photo.jpg", content_type="image/jpeg")
+        try:
+            async with self.http.post(f"{self.app_url}/send_resume_data", data=form) as r:
+                body = await r.json(content_type=None)
+                ok = r.status == 200 and (body or {}).get("status") == "success"
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            ok = False
+        if not ok: st.error("resume_form")
+        return ok
+
+    async def run_scenario(self, st: Stage, uid: int, name: str) -> None:
+        if name == "resume":
+            fut = self.fake.expect(uid, _resume_done)
+            t0 = time.perf_counter()
+            if not await self.post_resume(st, uid):
+                fut.cancel(); return
+        else:
+            steps = SCENARIOS[name](uid)
+            for upd in steps[:-1]:
+                if not await self.post_update(st, upd): return
+                if self.think: await asyncio.sleep(self.think)
+            fut = self.fake.expect(uid, _done)
+            t0 = time.perf_counter()
+            if not await self.post_update(st, steps[-1]):
+                fut.cancel(); return
+        try:
+            ev = await asyncio.wait_for(fut, self.job_timeout)
+        except asyncio.TimeoutError:
+            st.timeouts += 1; return
+        if ev["text"].startswith("❌"):
+            st.error(name); return
+        if ev["text"].startswith(REJECTED):
+            st.rejected += 1; return
+        st.ok += 1
+        st.job_ms.setdefault(name, []).append((time.perf_counter() - t0) * 1000)
+
+    async def user_loop(self, st: Stage, uid: int, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            await self.run_scenario(st, uid, random.choice(self.mix))
+
+    async def stage(self, users: int, duration: float, uid_base: int) -> dict:
+        st = Stage(users)
+        deadline = time.monotonic() + duration
+        t0 = time.monotonic()
+        await asyncio.gather(*(self.user_loop(st, uid_base + i, deadline) for i in range(users)))
+        return st.report(time.monotonic() - t0)
+
+    async def run(self, ramp: List[int], duration: float) -> List[dict]:
+        self.http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.job_timeout))
+        out = []
+        try:
+            for n, users in enumerate(ramp):
+                rep = await self.stage(users, duration, uid_base=10_000_000 + n * 100_000)
+                out.append(rep)
+                print(f"users {users:>4}  upd/s {rep['updates_per_s']:>7.2f}  jobs/s {rep['jobs_per_s']:>6.2f}  "
+                      f"webhook p95 {rep['webhook_ms']['p95']:>8.1f} ms  job p50/p95 {rep['job_ms']['p50']:>8.1f}/"
+                      f"{rep['job_ms']['p95']:>8.1f} ms  err {rep['error_rate']:.1%}  timeout {rep['timeout_rate']:.1%}  "
+                      f"rejected {rep['rejected_rate']:.1%}",
+                      flush=True)
+        finally:
+            await self.http.close()
+        return out
+
+
+def parse_mix(s: str) -> Dict[str, int]:
+    mix = {}
+    for part in s.split(","):
+        name, _, w = part.partition(":")
+        name = name.strip()
+        if name not in SCENARIOS and name != "resume": raise SystemExit(f"noma'lum ssenariy: {name}")
+        mix[name] = int(w or 1)
+    return mix
+
+
+async def amain(a) -> None:
+    fake = FakeTelegram()
+    await fake.start(a.fake_host, a.fake_port)
+    try:
+        drv = Driver(a.app, fake, parse_mix(a.mix), a.job_timeout, a.think)
+        stages = await drv.run([int(x) for x in a.ramp.split(",")], a.duration)
+    finally:
+        await fake.stop()
+    report = {"created": datetime.utcnow().isoformat() + "Z", "app": a.app, "mix": a.mix,
+              "duration_s": a.duration, "telegram_calls": fake.stats, "stages": stages}
+    with open(a.out, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"-> {a.out}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OFM bot load-test driver")
+    ap.add_argument("--app", default=os.getenv("APP_URL", "http://127.0.0.1:8080"))
+    ap.add_argument("--fake-host", default="127.0.0.1")
+    ap.add_argument("--fake-port", type=int, default=8081)
+    ap.add_argument("--ramp", default="1,2,4,8,16", help="har bosqichdagi virtual foydalanuvchilar soni")
+    ap.add_argument("--duration", type=float, default=30, help="bir bosqich davomiyligi, s")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="ssenariy:og‘irlik, vergul bilan")
+    ap.add_argument("--job-timeout", type=float, default=120)
+    ap.add_argument("--think", type=float, default=0.0, help="update'lar orasidagi pauza, s")
+    ap.add_argument("--out", default="loadtest_results.json")
+    a = ap.parse_args()
+    asyncio.run(amain(a))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# loadtest/fake_telegram.py
+# Telegram Bot API o‘rnini bosuvchi lokal server (load-test uchun).
+#   getFile / fayl yuklash — sintetik PDF/JPEG/DOCX (har file_id uchun bayti boshqacha, kesh "aldamasin")
+#   sendDocument / sendMediaGroup / sendMessage / sendPhoto — qabul qiladi, chat bo‘yicha yozib boradi
+# Bot'ni unga yo‘naltirish: TELEGRAM_API_BASE=http://127.0.0.1:8081
+#
+# Alohida ham ishga tushadi: python -m loadtest.fake_telegram --port 8081
+import io
+import json
+import time
+import asyncio
+import argparse
+import itertools
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+
+# =========================
+# SINTETIK FAYLLAR
+# =========================
+def _pdf(pages: int) -> bytes:
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    buf = io.BytesIO(); c = canvas.Canvas(buf, pagesize=A4)
+    for i in range(1, pages + 1):
+        c.setFont("Helvetica", 12)
+        for ln in range(40): c.drawString(72, 780 - ln * 18, f"Sahifa {i}, qator {ln + 1}: load-test hujjati")
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _jpeg(size=(2000, 1500)) -> bytes:
+    from PIL import Image, ImageDraw
+    im = Image.new("RGB", size, (240, 238, 230)); d = ImageDraw.Draw(im)
+    for ln in range(40): d.text((80, 60 + ln * 34), f"Load-test rasmi, qator {ln + 1}", fill=(10, 10, 10))
+    buf = io.BytesIO(); im.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _docx(tag: str) -> bytes:
+    from docx import Document
+    doc = Document(); doc.add_heading(f"Load-test {tag}", 1)
+    for i in range(30): doc.add_paragraph(f"{i + 1}. Hujjat matni — konvert yo‘lini o‘lchash uchun.")
+    buf = io.BytesIO(); doc.save(buf)
+    return buf.getvalue()
+
+
+class FileFactory:
+    """file_id formati: "<tur>-<sahifa>-<n>" (pdf-5-17, jpg-1-3, docx-1-9).
+    PDF/JPEG bir marta yasaladi, har file_id'ga oxiriga noyob izoh qo‘shiladi (ikkala format ham e'tiborsiz qoldiradi)."""
+    EXT = {"pdf": "pdf", "jpg": "jpg", "docx": "docx"}
+    MIME = {"pdf": "application/pdf", "jpg": "image/jpeg",
+            "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
+
+    def __init__(self):
+        self.base: Dict[Tuple[str, int], bytes] = {}
+
+    def build(self, file_id: str) -> bytes:
+        kind, pages, _ = file_id.split("-", 2)
+        if kind == "docx": return _docx(file_id)
+        key = (kind, int(pages))
+        if key not in self.base:
+            self.base[key] = _pdf(int(pages)) if kind == "pdf" else _jpeg()
+        tail = f"\n%{file_id}\n" if kind == "pdf" else f"LOADTEST:{file_id}"
+        return self.base[key] + tail.encode()
+
+
+# =========================
+# SERVER
+# =========================
+class FakeTelegram:
+    def __init__(self):
+        self.files = FileFactory()
+        self.blobs: Dict[str, bytes] = {}
+        self.msg_ids = itertools.count(1)
+        self.stats: Dict[str, int] = {}
+        self.sent_bytes = 0
+        self.waiters: Dict[int, List[Tuple[Callable[[dict], bool], asyncio.Future]]] = {}
+        self.app = web.Application(client_max_size=200 * 1024 * 1024)
+        self.app.router.add_route("*", "/bot{token}/{method}", self.api)
+        self.app.router.add_get("/file/bot{token}/{path:.+}", self.download)
+        self.app.router.add_get("/_stats", self.stats_view)
+        self.runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> None:
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self) -> None:
+        if self.runner: await self.runner.cleanup()
+
+    def expect(self, chat_id: int, pred: Callable[[dict], bool]) -> asyncio.Future:
+        """Shu chat'ga pred(event) True bo‘ladigan yuborish kelganda bajariladigan future."""
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(chat_id, []).append((pred, fut))
+        return fut
+
+    def _emit(self, ev: dict) -> None:
+        left = []
+        for pred, fut in self.waiters.pop(ev["chat_id"], []):
+            if fut.done(): continue
+            if pred(ev): fut.set_result(ev)
+            else: left.append((pred, fut))
+        if left: self.waiters[ev["chat_id"]] = left
+
+    def _message(self, chat_id: int, **extra) -> dict:
+        return {"message_id": next(self.msg_ids), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}, **extra}
+
+    async def api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.stats[method] = self.stats.get(method, 0) + 1
+        form = await request.post() if request.can_read_body else {}
+        data = dict(form) | dict(request.query)
+        if method == "getFile":
+            fid = str(data["file_id"])
+            blob = self.blobs.get(fid) or self.files.build(fid)
+            self.blobs[fid] = blob
+            return web.json_response({"ok": True, "result": {
+                "file_id": fid, "file_unique_id": fid, "file_size": len(blob), "file_path": f"docs/{fid}"}})
+        if method == "sendMediaGroup":
+            chat_id = int(data.get("chat_id", 0)); msgs = []
+            for item in json.loads(str(data.get("media", "[]"))):
+                ref = str(item.get("media", ""))
+                f = data.get(ref[len("attach://"):]) if ref.startswith("attach://") else None
+                name = f.filename if isinstance(f, web.FileField) else ref
+                if isinstance(f, web.FileField): self.sent_bytes += len(f.file.read())
+                ev = {"method": method, "chat_id": chat_id, "ts": time.monotonic(), "text": "", "filename": name}
+                self._emit(ev)
+                msgs.append(self._message(chat_id, document={"file_id": f"out-{ev['ts']}", "file_unique_id": f"out-{ev['ts']}",
+                                                             "file_name": name}))
+            return web.json_response({"ok": True, "result": msgs})
+        if method in ("sendMessage", "sendDocument", "sendPhoto"):
+            chat_id = int(data.get("chat_id", 0))
+            ev = {"method": method, "chat_id": chat_id, "ts": time.monotonic(), "text": str(data.get("text", ""))}
+            extra = {"text": ev["text"]} if method == "sendMessage" else {}
+            for field in ("document", "photo"):
+                f = data.get(field)
+                if isinstance(f, web.FileField):
+                    body = f.file.read(); self.sent_bytes += len(body)
+                    ev["filename"] = f.filename
+                    if field == "document":
+                        extra["document"] = {"file_id": f"out-{ev['ts']}", "file_unique_id": f"out-{ev['ts']}",
+                                             "file_name": f.filename, "file_size": len(body)}
+                    else:
+                        extra["photo"] = [{"file_id": f"out-{ev['ts']}", "file_unique_id": f"out-{ev['ts']}",
+                                           "width": 1, "height": 1}]
+            self._emit(ev)
+            return web.json_response({"ok": True, "result": self._message(chat_id, **extra)})
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "OFM", "username": "ofm_load_bot"}})
+        return web.json_response({"ok": True, "result": True})   # setMyCommands, setWebhook va h.k.
+
+    async def download(self, request: web.Request) -> web.Response:
+        fid = request.match_info["path"].rsplit("/", 1)[-1]
+        blob = self.blobs.get(fid)
+        if blob is None: return web.Response(status=404)
+        return web.Response(body=blob)
+
+    async def stats_view(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": self.stats, "sent_bytes": self.sent_bytes,
+                                  "waiting_chats": len(self.waiters)})
+
+
+async def _serve(host: str, port: int) -> None:
+    fake = FakeTelegram()
+    await fake.start(host, port)
+    print(f"fake Bot API: http://{host}:{port}  (TELEGRAM_API_BASE shu manzil)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Soxta Telegram Bot API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    a = ap.parse_args()
+    asyncio.run(_serve(a.host, a.port))